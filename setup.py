@@ -32,9 +32,14 @@ setup(
         'shapely',
         'rasterio',
         'numpy',
-        'scipy'
+        'scipy',
+        'requests'
     ],
     packages=find_packages(where='src'),
+    package_data={'osw_incline': ['ned_13_index.json']},
+    entry_points={
+        'console_scripts': ['osw-incline=osw_incline.cli:main'],
+    },
     classifiers=[
         'Programming Language :: Python :: 3',
         'License :: OSI Approved :: MIT License',
@@ -1,59 +1,490 @@
-import gc
+import os
 import time
+import asyncio
+import weakref
+import importlib
+import functools
 from typing import List
 from pathlib import Path
 from .logger import Logger
-from .osm_graph import OSMGraph
 from .version import __version__
-from .dem_processor import DEMProcessor
+
+# networkx, rasterio, pyproj, shapely and numpy are only imported on first use,
+# so that `import osw_incline` stays cheap for short-lived worker processes.
+LAZY_ATTRIBUTES = {
+    'OSMGraph': 'osm_graph',
+    'DEMProcessor': 'dem_processor',
+    'ChunkedProcessor': 'chunked_processor',
+    'InclineEngine': 'engine',
+    'TilePlanner': 'tile_planner',
+    'TileCache': 'tile_cache',
+    'TilePrefetcher': 'tile_prefetcher',
+    'TileScheduler': 'scheduler',
+    'ElevationCache': 'elevation_cache',
+    'EdgeFilter': 'edge_filter',
+    'Checkpoint': 'checkpoint',
+    'MemoryMonitor': 'memory',
+    'CancellationToken': 'progress',
+    'Cancelled': 'progress',
+}
+
+
+def __getattr__(name):
+    if name in LAZY_ATTRIBUTES:
+        module = importlib.import_module(f'.{LAZY_ATTRIBUTES[name]}', __name__)
+        return getattr(module, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+# Edges handed to the executor per step by calculate_async
+ASYNC_CHUNK_SIZE = 1000
+
+# Job semaphores per event loop, one for each max_concurrent_jobs value seen in it
+_job_semaphores = weakref.WeakKeyDictionary()
+
+
+def _job_semaphore(max_concurrency):
+    semaphores = _job_semaphores.setdefault(asyncio.get_running_loop(), {})
+    if max_concurrency not in semaphores:
+        semaphores[max_concurrency] = asyncio.Semaphore(max_concurrency)
+    return semaphores[max_concurrency]
+
+
+async def _run_in_executor(executor, func, *args, **kwargs):
+    # Never leave a step running in the background: if the caller is cancelled,
+    # wait for the step to finish (it cannot be interrupted) and then re-raise.
+    future = asyncio.get_running_loop().run_in_executor(executor, functools.partial(func, *args, **kwargs))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+
+def _open_elevation_cache(elevation_cache, debug=False):
+    # A path opens a cache for the duration of one run; an ElevationCache is used as is
+    if elevation_cache is None:
+        return None
+    from .elevation_cache import ElevationCache
+
+    return ElevationCache.open(elevation_cache, debug=debug)
+
+
+def _load_options(edge_filter, memory=None):
+    # OSMGraph.from_geojson keyword arguments beyond the paths, only those in use;
+    # without a MemoryMonitor, a graph follows the default policy
+    from .memory import DEFAULT_GC_POLICY
+
+    options = {} if edge_filter is None else {'edge_filter': edge_filter}
+    if memory is not None and memory.gc_policy != DEFAULT_GC_POLICY:
+        options['memory'] = memory
+    return options
+
+
+def _progress_tracker(progress, progress_interval, cancel_token):
+    # Only runs which report progress or can be cancelled track it
+    if progress is None and cancel_token is None:
+        return None
+    from .progress import ProgressTracker
+
+    return ProgressTracker(progress, interval=progress_interval, cancel_token=cancel_token)
+
+
+def _in_dem_env(dem_file, func, *args, **kwargs):
+    # GDAL settings are per thread, so remote DEMs need them set in the executor thread
+    from .dem_processor import dem_env
+
+    with dem_env(dem_file):
+        return func(*args, **kwargs)
 
 
 class OSWIncline:
-    def __init__(self, dem_files: List[str], nodes_file: str, edges_file: str, debug=False):
+    # Upper bound on calculate_async jobs running at once in an event loop
+    max_concurrent_jobs = os.cpu_count() or 1
+
+    def __init__(self, dem_files: List[str] = None, nodes_file: str = None, edges_file: str = None, debug=False,
+                 tile_dir: str = None, download_tiles=False):
+        if dem_files is None and tile_dir is None:
+            raise ValueError('Either dem_files or tile_dir must be provided')
         self.dem_files = dem_files
+        # Directory of NED tiles to pick the needed DEM files from, instead of dem_files
+        self.tile_dir = tile_dir
+        # Download the tiles missing from tile_dir into it, overlapping downloads with processing
+        self.download_tiles = download_tiles
         self.nodes_file = nodes_file
         self.edges_file = edges_file
         self.debug = debug
+        # Counters from the last run, e.g. points skipped by the nodata coverage index
+        self.stats = {}
+        # Memory use per stage of the last calculate run, see MemoryMonitor
+        self.memory_stages = []
         if self.debug:
             Logger.debug('Debug mode is enabled')
 
-    def calculate(self, skip_existing_tags=False, batch_processing=False):
+    def calculate(self, skip_existing_tags=False, batch_processing=False, chunked=False, max_memory_bytes=None,
+                  method='idw', coverage_index=False, elevation_cache=None, edge_filter=None, checkpoint=None,
+                  layered=False, overview_factor=1, coarse_length=None, gc_policy=None, trace_memory=False,
+                  progress=None, progress_interval=1.0, cancel_token=None):
+        from .memory import MemoryMonitor, DEFAULT_GC_POLICY, collect
+        from .progress import Cancelled
+
+        if chunked and checkpoint is not None:
+            raise ValueError('checkpoint is not supported in chunked mode')
+        if layered and (chunked or checkpoint is not None):
+            raise ValueError('layered DEMs are not supported in chunked mode or with a checkpoint')
+        if edge_filter is not None:
+            # Edges the filter rejects are passed through to the output untouched
+            edge_filter = edge_filter.with_skip_existing_tags(skip_existing_tags)
+        memory = MemoryMonitor(gc_policy or DEFAULT_GC_POLICY, trace=trace_memory, debug=self.debug)
+        tracker = _progress_tracker(progress, progress_interval, cancel_token)
+        cache = _open_elevation_cache(elevation_cache, debug=self.debug)
         try:
+            memory.start()
             if self.debug:
                 Logger.debug('Starting calculation process')
             graph_nodes_path = Path(self.nodes_file)
             graph_edges_path = Path(self.edges_file)
 
-            osm_graph = OSMGraph.from_geojson(
-                nodes_path=graph_nodes_path,
-                edges_path=graph_edges_path
-            )
+            if chunked:
+                from .chunked_processor import ChunkedProcessor, DEFAULT_MAX_MEMORY_BYTES
 
-            start_time = time.time()
-            dem_processor = DEMProcessor(osm_graph=osm_graph, dem_files=self.dem_files, debug=self.debug)
-            dem_processor.process(
-                nodes_path=graph_nodes_path,
-                edges_path=graph_edges_path,
-                skip_existing_tags=skip_existing_tags,
-                batch_processing=batch_processing
-            )
+                # Out-of-core mode: the graph is never loaded into memory as a whole
+                start_time = time.time()
+                chunked_processor = ChunkedProcessor(
+                    dem_files=self._plan_dem_files(edges_path=graph_edges_path),
+                    max_memory_bytes=max_memory_bytes or DEFAULT_MAX_MEMORY_BYTES,
+                    debug=self.debug,
+                    method=method,
+                    coverage_index=coverage_index,
+                    elevation_cache=cache,
+                    edge_filter=edge_filter,
+                    overview_factor=overview_factor,
+                    coarse_length=coarse_length,
+                    progress=tracker
+                )
+                with memory.stage('chunked'):
+                    chunked_processor.process(
+                        nodes_path=graph_nodes_path,
+                        edges_path=graph_edges_path,
+                        skip_existing_tags=skip_existing_tags
+                    )
+                self.stats = dict(chunked_processor.dem_processor.stats)
+                del chunked_processor
+            else:
+                from .osm_graph import OSMGraph
+                from .dem_processor import DEMProcessor
+                from .checkpoint import Checkpoint
+
+                with memory.stage('load'):
+                    osm_graph = OSMGraph.from_geojson(
+                        nodes_path=graph_nodes_path,
+                        edges_path=graph_edges_path,
+                        **_load_options(edge_filter, memory)
+                    )
+                osm_graph.memory = memory
 
-            # Delete osm_graph and dem_processor to force garbage collection
-            osm_graph.clean()
-            del osm_graph, dem_processor
-            gc.collect()
+                start_time = time.time()
+                checkpoint_state = Checkpoint.open(checkpoint, debug=self.debug)
+                finished = False
+                try:
+                    dem_processor = DEMProcessor(
+                        osm_graph=osm_graph,
+                        dem_files=self._plan_dem_files(osm_graph=osm_graph),
+                        debug=self.debug,
+                        method=method,
+                        coverage_index=coverage_index,
+                        elevation_cache=cache,
+                        checkpoint=checkpoint_state,
+                        layered=layered,
+                        overview_factor=overview_factor,
+                        coarse_length=coarse_length,
+                        memory=memory,
+                        progress=tracker
+                    )
+                    dem_processor.process(
+                        nodes_path=graph_nodes_path,
+                        edges_path=graph_edges_path,
+                        skip_existing_tags=skip_existing_tags,
+                        batch_processing=batch_processing
+                    )
+                    finished = True
+                finally:
+                    if checkpoint_state is not None and checkpoint_state is not checkpoint:
+                        # An interrupted run keeps its checkpoint for the next one
+                        if finished:
+                            checkpoint_state.remove()
+                        else:
+                            checkpoint_state.close()
+                self.stats = dict(dem_processor.stats)
+                if edge_filter is not None:
+                    self.stats['passthrough_edges'] = len(osm_graph.passthrough_edges)
+
+                # Release the graph; cleaning it collects garbage if the policy asks for it
+                with memory.stage('clean'):
+                    osm_graph.clean()
+                    del osm_graph, dem_processor
 
             end_time = time.time()
             time_taken = end_time - start_time
             if self.debug:
                 Logger.info(f'Entire processing took: {time_taken} seconds')
+                if self.stats:
+                    Logger.info(f'Processing stats: {self.stats}')
             return True
+        except Cancelled:
+            if self.debug:
+                Logger.info('Calculation was cancelled')
+            raise
+        except Exception as e:
+            if self.debug:
+                Logger.error(f'Error processing DEM files: {e}')
+            raise Exception(f'Error processing DEM files: {e}')
+        finally:
+            if cache is not elevation_cache:
+                cache.close()
+            memory.close()
+            self.memory_stages = memory.stages
+            collect(memory, 'stage')
+
+    def plan(self, workers=1, max_memory_bytes=None):
+        """Estimate the cost of ``calculate`` without computing any incline.
+
+        Only the input files and the DEMs' metadata are read. Returns the graph
+        size, the reverse edge pairs, the edges and bytes to read per DEM file,
+        and the estimated peak memory of each execution mode; see
+        ``run_plan.plan_run``.
+        """
+        from .run_plan import plan_run
+
+        return plan_run(
+            self.nodes_file,
+            self.edges_file,
+            dem_files=None if self.tile_dir is not None else list(self.dem_files),
+            tile_dir=self.tile_dir,
+            workers=workers,
+            max_memory_bytes=max_memory_bytes,
+            debug=self.debug
+        )
+
+    def inclines(self, edges, skip_existing_tags=False, method='idw', coverage_index=False, elevation_cache=None,
+                 layered=False, overview_factor=1, coarse_length=None, gc_policy=None, progress=None,
+                 progress_interval=1.0, cancel_token=None):
+        """Compute the inclines of edges held in memory, without any file I/O
+        besides reading the DEMs.
+
+        ``edges`` is a GeoJSON FeatureCollection dict, a list of Feature dicts,
+        a GeoDataFrame or an Arrow table with a WKB (or WKT) geometry column;
+        geopandas and pyarrow are only needed by their own objects. Nodes are
+        not needed. Returns an array with the incline of each edge, in order:
+        the computed one where a DEM gives one, else the incline the edge
+        already has, else NaN. As with ``calculate``, ``skip_existing_tags``
+        skips edges with an incline and drops those outside [-1, 1]. The other
+        options are those of ``calculate``.
+        """
+        import numpy as np
+        from .memory import MemoryMonitor, DEFAULT_GC_POLICY
+        from .progress import Cancelled
+        from .features import edge_coords, existing_inclines
+        from .dem_processor import DEMProcessor
+
+        coords = edge_coords(edges)
+        # As with calculate: edges with an incline are skipped with skip_existing_tags, and lose it
+        # if it is out of range; otherwise they keep it unless a DEM gives them a new one
+        inclines = existing_inclines(edges, valid_only=False)
+        pending = ~np.isnan(coords).any(axis=1)
+        if skip_existing_tags:
+            pending &= np.isnan(inclines)
+            inclines = existing_inclines(edges)
+        memory = MemoryMonitor(gc_policy or DEFAULT_GC_POLICY, debug=self.debug)
+        tracker = _progress_tracker(progress, progress_interval, cancel_token)
+        cache = _open_elevation_cache(elevation_cache, debug=self.debug)
+        try:
+            start_time = time.time()
+            dem_processor = DEMProcessor(
+                osm_graph=None,
+                dem_files=self._plan_dem_files(coords=coords[pending]),
+                debug=self.debug,
+                method=method,
+                coverage_index=coverage_index,
+                elevation_cache=cache,
+                layered=layered,
+                overview_factor=overview_factor,
+                coarse_length=coarse_length,
+                memory=memory,
+                progress=tracker
+            )
+            dem_processor.process_coords(coords, inclines, rows=np.flatnonzero(pending))
+            self.stats = dict(dem_processor.stats)
+            if self.debug:
+                Logger.info(f'Computed inclines for {len(inclines)} edges in {time.time() - start_time} seconds')
+            return inclines
+        except Cancelled:
+            if self.debug:
+                Logger.info('Calculation was cancelled')
+            raise
         except Exception as e:
             if self.debug:
                 Logger.error(f'Error processing DEM files: {e}')
             raise Exception(f'Error processing DEM files: {e}')
         finally:
-            gc.collect()
+            if cache is not elevation_cache:
+                cache.close()
+            self.memory_stages = memory.stages
+
+    def add_inclines(self, edges, **options):
+        """Return a copy of the in-memory ``edges``, of the same kind, with the
+        inclines of ``inclines(edges, **options)`` set as their ``incline``
+        property or column. ``edges`` itself is not modified."""
+        from .features import with_inclines
+
+        return with_inclines(edges, self.inclines(edges, **options))
+
+    def _plan_dem_files(self, osm_graph=None, edges_path=None, coords=None):
+        # Without a tile directory the explicit dem_files list is used as is
+        if self.tile_dir is None:
+            return self.dem_files
+
+        from .tile_planner import TilePlanner
+
+        planner = TilePlanner()
+        if osm_graph is not None:
+            tiles = planner.tiles_for_graph(osm_graph.G)
+        elif coords is not None:
+            tiles = planner.tiles_for_points(coords[:, [0, 2]].ravel(), coords[:, [1, 3]].ravel())
+        else:
+            tiles = planner.tiles_for_edges_file(edges_path)
+        dem_files, missing = planner.resolve(tiles, self.tile_dir)
+        if self.debug:
+            Logger.debug(f'Graph needs {len(tiles)} DEM tiles: {tiles}')
+            if missing and not self.download_tiles:
+                Logger.warning(f'DEM tiles missing from {self.tile_dir}: {missing}')
+        if missing and self.download_tiles:
+            missing_tiles = set(missing)
+            found = dict(zip([tile for tile in tiles if tile not in missing_tiles], dem_files))
+            return self._download_dem_files(tiles, found)
+        return dem_files
+
+    def _download_dem_files(self, tiles, found):
+        from .tile_cache import TileCache
+        from .tile_prefetcher import TilePrefetcher
+
+        # Later DEMs take precedence over earlier ones (the other way round in a layered run), so
+        # tiles are handed over in plan order, each as soon as it and those before it are available
+        with TilePrefetcher(TileCache(self.tile_dir, debug=self.debug), debug=self.debug) as prefetcher:
+            downloads = prefetcher.prefetch([tile for tile in tiles if tile not in found])
+            available = dict(found)
+            for tile in tiles:
+                while tile not in available:
+                    name, path = next(downloads)
+                    available[name] = str(path)
+                yield available.pop(tile)
+
+    async def calculate_async(self, skip_existing_tags=False, chunk_size=ASYNC_CHUNK_SIZE, executor=None,
+                              method='idw', coverage_index=False, elevation_cache=None, edge_filter=None,
+                              overview_factor=1, coarse_length=None, progress=None, progress_interval=1.0,
+                              cancel_token=None):
+        """Asynchronous variant of ``calculate`` for use inside an event loop.
+
+        Loading, DEM reads and interpolation run in ``executor`` (the loop's
+        default executor if None) in chunks of ``chunk_size`` edges, so the loop
+        stays responsive and the task can be cancelled between chunks. The
+        output files are only written once every chunk has completed, so a
+        cancelled job leaves its inputs untouched. ``progress`` and
+        ``cancel_token`` work as with ``calculate``; the callback runs in the
+        event loop, between chunks.
+        """
+        if edge_filter is not None:
+            edge_filter = edge_filter.with_skip_existing_tags(skip_existing_tags)
+        from .progress import Cancelled
+
+        tracker = _progress_tracker(progress, progress_interval, cancel_token)
+        async with _job_semaphore(self.max_concurrent_jobs):
+            cache = _open_elevation_cache(elevation_cache, debug=self.debug)
+            try:
+                import rasterio
+                from .osm_graph import OSMGraph
+                from .dem_processor import DEMProcessor, dem_path, source_name
+
+                if self.debug:
+                    Logger.debug('Starting asynchronous calculation process')
+                graph_nodes_path = Path(self.nodes_file)
+                graph_edges_path = Path(self.edges_file)
+
+                osm_graph = await _run_in_executor(
+                    executor, OSMGraph.from_geojson, nodes_path=graph_nodes_path, edges_path=graph_edges_path,
+                    **_load_options(edge_filter)
+                )
+
+                start_time = time.time()
+                # Planning walks every edge and resolves the tiles on disk, and tiles may still be
+                # downloading, so both are left to the executor
+                dem_files = iter(await _run_in_executor(executor, self._plan_dem_files, osm_graph=osm_graph))
+                dem_processor = DEMProcessor(
+                    osm_graph=osm_graph,
+                    dem_files=dem_files,
+                    debug=self.debug,
+                    method=method,
+                    coverage_index=coverage_index,
+                    elevation_cache=cache,
+                    overview_factor=overview_factor,
+                    coarse_length=coarse_length
+                )
+                edges = await _run_in_executor(executor, list, osm_graph.G.edges(data=True))
+                if tracker is not None:
+                    # The number of tiles is known once they are all handed over
+                    tracker.start(len(edges))
+                while True:
+                    dem_file = await _run_in_executor(executor, next, dem_files, None)
+                    if dem_file is None:
+                        break
+                    if tracker is not None:
+                        tracker.begin_tile(source_name(dem_file))
+                    try:
+                        await _run_in_executor(executor, dem_processor.prepare_overview, dem_file)
+                        dem = await _run_in_executor(executor, _in_dem_env, dem_file, rasterio.open, dem_path(dem_file))
+                    except rasterio.errors.RasterioIOError:
+                        raise Exception(f'Failed to open DEM file: {dem_file}')
+                    try:
+                        for i in range(0, len(edges), chunk_size):
+                            await _run_in_executor(
+                                executor,
+                                _in_dem_env,
+                                dem_file,
+                                dem_processor.process_edge_batch,
+                                edges[i:i + chunk_size],
+                                dem,
+                                skip_existing_tags=skip_existing_tags
+                            )
+                            if tracker is not None:
+                                tracker.advance(min(chunk_size, len(edges) - i))
+                    finally:
+                        dem.close()
+                    if tracker is not None:
+                        tracker.end_tile()
+
+                await _run_in_executor(executor, osm_graph.to_geojson, graph_nodes_path, graph_edges_path)
+                if tracker is not None:
+                    tracker.finish()
+                self.stats = dict(dem_processor.stats)
+                if edge_filter is not None:
+                    self.stats['passthrough_edges'] = len(osm_graph.passthrough_edges)
+                osm_graph.clean()
+                del osm_graph, dem_processor, edges
+
+                if self.debug:
+                    Logger.info(f'Entire processing took: {time.time() - start_time} seconds')
+                return True
+            except (asyncio.CancelledError, Cancelled):
+                if self.debug:
+                    Logger.info('Asynchronous calculation was cancelled')
+                raise
+            except Exception as e:
+                if self.debug:
+                    Logger.error(f'Error processing DEM files: {e}')
+                raise Exception(f'Error processing DEM files: {e}')
+            finally:
+                if cache is not elevation_cache:
+                    cache.close()
 
 
 OSWIncline.__version__ = __version__
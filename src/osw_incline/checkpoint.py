@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import hashlib
+from pathlib import Path
+from .logger import Logger
+
+# Edges processed between two checkpoints
+DEFAULT_EVERY = 10000
+
+
+def graph_fingerprint(G, method, dem_files=(), layered=False):
+    """Identify a graph's edges, in iteration order, with the endpoints of their
+    geometries, the interpolation method and the DEM files. The DEM files are
+    taken in order, as their order decides which one an incline comes from."""
+    digest = hashlib.sha256(f'{method}\n{layered}\n{G.number_of_edges()}\n'.encode())
+    for dem_file in dem_files:
+        digest.update(f'{dem_file}\n'.encode())
+    for u, v, k, geometry in G.edges(keys=True, data='geometry'):
+        endpoints = '' if geometry is None else f'{geometry.coords[0]}\t{geometry.coords[-1]}'
+        digest.update(f'{u}\t{v}\t{k}\t{endpoints}\n'.encode())
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """On-disk progress of an incline run, so that an interrupted run can resume.
+
+    Every ``every`` edges, the inclines of the edges just processed and the
+    position reached in the current DEM tile are committed to a SQLite file;
+    tiles are marked done once their output has been written. Edges are
+    identified by their position in the graph, so a checkpoint only applies to
+    the graph it was written for: ``start`` compares the graph's fingerprint
+    and starts over if it differs.
+    """
+
+    def __init__(self, path, every=DEFAULT_EVERY, debug=False):
+        if every < 1:
+            raise ValueError('every must be at least 1')
+        self.path = Path(path)
+        self.every = every
+        self.debug = debug
+        self.connection = sqlite3.connect(self.path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS tiles (dem TEXT PRIMARY KEY, position INTEGER NOT NULL, '
+                'done INTEGER NOT NULL)'
+            )
+            self.connection.execute('CREATE TABLE IF NOT EXISTS inclines (edge INTEGER PRIMARY KEY, incline REAL)')
+
+    @classmethod
+    def open(cls, checkpoint, debug=False):
+        """Return ``checkpoint`` if it is a Checkpoint, else open one at the path ``checkpoint``."""
+        if checkpoint is None or isinstance(checkpoint, Checkpoint):
+            return checkpoint
+        return cls(checkpoint, debug=debug)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def remove(self):
+        """Close the checkpoint and delete its files, once the run has completed."""
+        self.close()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(f'{self.path}{suffix}')
+            except FileNotFoundError:
+                pass
+
+    def start(self, G, method, dem_files=(), layered=False):
+        """Bind the checkpoint to a graph and its DEM files. Returns True if it
+        holds progress for them."""
+        fingerprint = graph_fingerprint(G, method, dem_files, layered=layered)
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row is not None and row[0] == fingerprint:
+            return self.connection.execute('SELECT COUNT(*) FROM tiles').fetchone()[0] > 0
+
+        if row is not None and self.debug:
+            Logger.warning(f'Checkpoint {self.path} belongs to other inputs, starting over')
+        with self.connection:
+            self.connection.execute('DELETE FROM tiles')
+            self.connection.execute('DELETE FROM inclines')
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+        return False
+
+    def restore(self, edges):
+        """Set the checkpointed inclines on ``edges``, the graph's ``(u, v, data)``
+        edges in order. Returns the number of edges restored."""
+        restored = 0
+        for edge, incline in self.connection.execute('SELECT edge, incline FROM inclines'):
+            d = edges[edge][2]
+            if incline is None:
+                d.pop('incline', None)
+            else:
+                d['incline'] = incline
+            restored += 1
+        return restored
+
+    def is_done(self, dem):
+        row = self.connection.execute('SELECT done FROM tiles WHERE dem = ?', (str(dem),)).fetchone()
+        return row is not None and bool(row[0])
+
+    def position(self, dem):
+        """Number of edges already processed against ``dem``."""
+        row = self.connection.execute('SELECT position FROM tiles WHERE dem = ?', (str(dem),)).fetchone()
+        return 0 if row is None else row[0]
+
+    def save(self, dem, position, inclines):
+        """Record that the edges before ``position`` were processed against ``dem``,
+        with ``inclines`` the ``(edge, incline)`` pairs of the edges just processed."""
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO inclines VALUES (?, ?)', inclines)
+            self.connection.execute('INSERT OR REPLACE INTO tiles VALUES (?, ?, 0)', (str(dem), position))
+
+    def complete(self, dem):
+        """Mark ``dem`` as done: its inclines are in the output files."""
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO tiles VALUES (?, 0, 1) ON CONFLICT (dem) DO UPDATE SET done = 1', (str(dem),)
+            )
@@ -0,0 +1,228 @@
+import os
+import math
+import tempfile
+import rasterio
+import numpy as np
+from typing import List
+from pathlib import Path
+from .logger import Logger
+from .dem_processor import DEMProcessor, dem_path, is_remote, geographic_bounds, source_name, REMOTE_GDAL_OPTIONS
+from .geojson_stream import iter_features, FeatureWriter
+
+DEFAULT_MAX_MEMORY_BYTES = 256 * 1024 * 1024
+DEFAULT_CELL_SIZE = 0.1  # degrees
+
+# Each spilled edge is stored as (feature index, x0, y0, x1, y1)
+RECORD_FIELDS = 5
+# Approximate in-memory cost of one buffered edge record (list slots + float objects)
+RECORD_BYTES = 160
+# Approximate working memory of one edge during array-based interpolation
+EDGE_WORKING_BYTES = 1024
+
+
+class ChunkedProcessor:
+    """Compute inclines without materialising the graph in memory.
+
+    Edges are streamed from disk and spilled into fixed-size grid cells
+    (keyed on their lower endpoint). Each cell is then processed on its own
+    against the DEM tiles it overlaps, and the results are merged back into
+    the edges file in a final streaming pass which preserves feature order.
+    Peak memory is kept close to ``max_memory_bytes``.
+    """
+
+    def __init__(self, dem_files: List[str], max_memory_bytes=DEFAULT_MAX_MEMORY_BYTES,
+                 cell_size=DEFAULT_CELL_SIZE, debug=False, method='idw', coverage_index=False, elevation_cache=None,
+                 edge_filter=None, overview_factor=1, coarse_length=None, progress=None):
+        if max_memory_bytes <= 0:
+            raise ValueError('max_memory_bytes must be a positive number of bytes')
+        self.dem_files = dem_files
+        self.max_memory_bytes = max_memory_bytes
+        self.cell_size = cell_size
+        self.debug = debug
+        # Edges the filter rejects are not partitioned and keep their properties
+        self.edge_filter = edge_filter
+        # Half of the budget goes to the edge batch, a quarter to resident DEM blocks
+        self.batch_size = max(1, (max_memory_bytes // 2) // EDGE_WORKING_BYTES)
+        # ProgressTracker of the partitioned edges, advanced once a cell is done against all its tiles
+        self.progress = progress
+        self.dem_processor = DEMProcessor(
+            osm_graph=None,
+            dem_files=dem_files,
+            debug=debug,
+            method=method,
+            block_cache_bytes=max_memory_bytes // 4,
+            coverage_index=coverage_index,
+            elevation_cache=elevation_cache,
+            overview_factor=overview_factor,
+            coarse_length=coarse_length
+        )
+
+    def process(self, nodes_path, edges_path, skip_existing_tags=False):
+        workdir = Path(edges_path).resolve().parent
+        with tempfile.TemporaryDirectory(dir=workdir, prefix='.osw_incline_') as spill_dir:
+            total, cells = self._partition(edges_path, spill_dir, skip_existing_tags)
+            if self.debug:
+                Logger.debug(f'Partitioned {total} edges into {len(cells)} cells')
+
+            inclines = np.memmap(
+                Path(spill_dir, 'inclines.dat'), dtype=np.float64, mode='w+', shape=(max(total, 1),)
+            )
+            inclines[:] = np.nan
+            if self.progress is not None:
+                self.progress.start(sum(os.path.getsize(path) for path in cells.values()) // (RECORD_FIELDS * 8), 1)
+            self._compute(cells, inclines)
+
+            self._write_edges(edges_path, spill_dir, inclines, skip_existing_tags)
+            self._write_nodes(nodes_path, spill_dir)
+            del inclines
+            if self.progress is not None:
+                # The cells make a single pass over the edges
+                self.progress.end_tile()
+                self.progress.finish()
+
+    def cell_of(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def cell_bounds(self, cell):
+        cx, cy = cell
+        return (
+            cx * self.cell_size,
+            cy * self.cell_size,
+            (cx + 1) * self.cell_size,
+            (cy + 1) * self.cell_size
+        )
+
+    def _partition(self, edges_path, spill_dir, skip_existing_tags):
+        cells = {}
+        buffers = {}
+        buffered = 0
+        flush_at = max(1, (self.max_memory_bytes // 2) // RECORD_BYTES)
+
+        total = 0
+        for index, feature in enumerate(iter_features(edges_path)):
+            total += 1
+            props = feature.get('properties') or {}
+            geometry = feature.get('geometry')
+            if skip_existing_tags and props.get('incline') is not None:
+                continue
+            if self.edge_filter is not None and not self.edge_filter.accepts(feature):
+                self.dem_processor.stats['passthrough_edges'] += 1
+                continue
+            if not geometry or geometry.get('type') != 'LineString' or len(geometry['coordinates']) < 2:
+                if self.debug:
+                    Logger.info(f'No geometry found for edge {props.get("_u_id")}-{props.get("_v_id")}')
+                continue
+
+            first_point = geometry['coordinates'][0]
+            last_point = geometry['coordinates'][-1]
+            # Key cells on the lower endpoint, so that an edge and its reverse share a cell
+            anchor = min(tuple(first_point[:2]), tuple(last_point[:2]))
+            cell = self.cell_of(anchor[0], anchor[1])
+            buffers.setdefault(cell, []).extend(
+                (index, first_point[0], first_point[1], last_point[0], last_point[1])
+            )
+            buffered += 1
+            if buffered >= flush_at:
+                self._flush(buffers, cells, spill_dir)
+                buffered = 0
+
+        self._flush(buffers, cells, spill_dir)
+        return total, cells
+
+    def _flush(self, buffers, cells, spill_dir):
+        for cell, records in buffers.items():
+            if cell not in cells:
+                cells[cell] = Path(spill_dir, f'cell_{cell[0]}_{cell[1]}.bin')
+            with open(cells[cell], 'ab') as f:
+                np.asarray(records, dtype=np.float64).tofile(f)
+        buffers.clear()
+
+    def _compute(self, cells, inclines):
+        dem_files = list(self.dem_files)
+        if any(is_remote(dem_file) for dem_file in dem_files):
+            with rasterio.Env(**REMOTE_GDAL_OPTIONS):
+                return self._compute_with(dem_files, cells, inclines)
+        return self._compute_with(dem_files, cells, inclines)
+
+    def _compute_with(self, dem_files, cells, inclines):
+        datasets = []
+        try:
+            for dem_file in dem_files:
+                try:
+                    self.dem_processor.prepare_overview(dem_file)
+                    dem = rasterio.open(dem_path(dem_file))
+                    datasets.append((dem_file, dem, geographic_bounds(dem)))
+                except rasterio.errors.RasterioIOError:
+                    if self.debug:
+                        Logger.error(f'Failed to open DEM file: {dem_file}')
+                    raise Exception(f'Failed to open DEM file: {dem_file}')
+
+            for cell, cell_path in cells.items():
+                records = np.memmap(cell_path, dtype=np.float64, mode='r').reshape(-1, RECORD_FIELDS)
+                left, bottom, right, top = self.cell_bounds(cell)
+                for dem_file, dem, bounds in datasets:
+                    if left > bounds.right or right < bounds.left or bottom > bounds.top or top < bounds.bottom:
+                        continue
+                    if self.debug:
+                        Logger.debug(f'Processing cell {cell} ({len(records)} edges) against {dem_file}')
+                    if self.progress is not None:
+                        self.progress.begin_tile(source_name(dem_file))
+                    for start in range(0, len(records), self.batch_size):
+                        self._compute_batch(np.array(records[start:start + self.batch_size]), dem, inclines)
+                if self.progress is not None:
+                    self.progress.advance(len(records))
+                del records
+                # Cells are visited once, so their blocks will not be needed again
+                self.dem_processor.clear_block_cache()
+        finally:
+            for _, dem, _ in datasets:
+                dem.close()
+
+    def _compute_batch(self, batch, dem, inclines):
+        computed = self.dem_processor.infer_inclines(batch[:, 1:], dem=dem, precision=3)
+        valid = ~np.isnan(computed) & (computed >= -1) & (computed <= 1)
+        inclines[batch[valid, 0].astype(np.int64)] = computed[valid]
+
+    def _write_edges(self, edges_path, spill_dir, inclines, skip_existing_tags):
+        output_path = Path(spill_dir, 'edges.geojson')
+        with FeatureWriter(output_path) as writer:
+            for index, feature in enumerate(iter_features(edges_path)):
+                props = feature.get('properties') or {}
+                if skip_existing_tags and props.get('incline') is not None:
+                    if props['incline'] < -1 or props['incline'] > 1:
+                        del props['incline']
+                elif not np.isnan(inclines[index]):
+                    props['incline'] = float(inclines[index])
+
+                # Match the property layout written by OSMGraph.to_geojson
+                u = props.pop('_u_id', None)
+                v = props.pop('_v_id', None)
+                props.pop('osm_id', None)
+                props.pop('segment', None)
+                props['_u_id'] = str(u)
+                props['_v_id'] = str(v)
+                writer.write({
+                    'type': 'Feature',
+                    'geometry': feature.get('geometry'),
+                    'properties': props
+                })
+        os.replace(output_path, edges_path)
+
+    def _write_nodes(self, nodes_path, spill_dir):
+        output_path = Path(spill_dir, 'nodes.geojson')
+        with FeatureWriter(output_path) as writer:
+            for feature in iter_features(nodes_path):
+                props = feature.get('properties') or {}
+                if 'is_point' in props:
+                    continue
+                n = props.pop('_id', None)
+                props.pop('osm_id', None)
+                props.pop('lon', None)
+                props.pop('lat', None)
+                props['_id'] = str(n)
+                writer.write({
+                    'type': 'Feature',
+                    'geometry': feature.get('geometry'),
+                    'properties': props
+                })
+        os.replace(output_path, nodes_path)
@@ -0,0 +1,257 @@
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from collections import Counter
+from .version import __version__
+from .dem_processor import METHODS, MAX_OVERVIEW_FACTOR
+from .scheduler import TileScheduler, DEFAULT_MEMORY_BUDGET_BYTES
+from .sharding import shard_graph, merge_shards, SHARD_KINDS, DEFAULT_SHARD_CELL_SIZE, MANIFEST_NAME
+
+
+def read_manifest(manifest_path):
+    """Read ``(nodes_file, edges_file)`` pairs from a manifest.
+
+    The manifest is either a JSON list of ``{"nodes": ..., "edges": ...}``
+    objects, a manifest written by ``osw-incline shard`` (its ``shards``), or
+    a text file with one whitespace separated nodes/edges pair per
+    line (blank lines and lines starting with ``#`` are ignored). Relative
+    paths are resolved against the manifest's directory.
+    """
+    manifest_path = Path(manifest_path)
+    base_dir = manifest_path.parent
+    with open(manifest_path) as f:
+        content = f.read()
+
+    if content.lstrip().startswith('['):
+        pairs = [(entry['nodes'], entry['edges']) for entry in json.loads(content)]
+    elif content.lstrip().startswith('{'):
+        pairs = [(shard['nodes'], shard['edges']) for shard in json.loads(content)['shards']]
+    else:
+        pairs = []
+        for line_number, line in enumerate(content.splitlines(), start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = line.split()
+            if len(parts) != 2:
+                raise ValueError(f'{manifest_path}:{line_number}: expected a nodes file and an edges file')
+            pairs.append((parts[0], parts[1]))
+    return [(str(Path(base_dir, nodes)), str(Path(base_dir, edges))) for nodes, edges in pairs]
+
+
+def parse_excludes(excludes):
+    """Turn ``KEY=VALUE[,VALUE...]`` arguments into an ``EdgeFilter`` exclude mapping."""
+    exclude = {}
+    for item in excludes:
+        key, separator, values = item.partition('=')
+        if not separator or not key or not values:
+            raise SystemExit(f'osw-incline run: --exclude expects KEY=VALUE[,VALUE...], got {item!r}')
+        exclude.setdefault(key, []).extend(values.split(','))
+    return exclude
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='osw-incline', description='Add inclines to OpenSidewalks graphs.')
+    parser.add_argument('--version', action='version', version=f'%(prog)s {__version__}')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', help='Compute inclines for one or more graphs in place.')
+    run.add_argument('--graph', nargs=2, action='append', default=[], metavar=('NODES', 'EDGES'),
+                     help='A nodes/edges GeoJSON pair. May be repeated.')
+    run.add_argument('--manifest', action='append', default=[],
+                     help='File listing nodes/edges pairs (JSON list or one pair per line). May be repeated.')
+    dems = run.add_mutually_exclusive_group(required=True)
+    dems.add_argument('--dem-dir', help='Directory of NED tiles; each graph uses only the tiles it needs.')
+    dems.add_argument('--dem', nargs='+', help='DEM files used for every graph.')
+    run.add_argument('--method', choices=METHODS, default='idw', help='Interpolation method (default: idw).')
+    run.add_argument('--workers', type=int, default=1,
+                     help='Number of worker processes (default: 1, compute in this process).')
+    run.add_argument('--memory-budget-mb', type=int, default=DEFAULT_MEMORY_BUDGET_BYTES // (1024 * 1024),
+                     help='Memory budget for open DEM tiles, per worker (default: %(default)s).')
+    run.add_argument('--skip-existing-tags', action='store_true', help='Keep inclines already in the edges files.')
+    run.add_argument('--batch-processing', action='store_true', help='Use array-based batch interpolation.')
+    run.add_argument('--coverage-index', action='store_true', help='Skip DEM reads in all-nodata regions.')
+    run.add_argument('--elevation-cache', metavar='PATH',
+                     help='SQLite file of elevations reused across runs (used with --batch-processing).')
+    run.add_argument('--exclude', action='append', default=[], metavar='KEY=VALUE[,VALUE...]',
+                     help='Pass edges with one of these property values through without an incline, '
+                          'e.g. highway=steps,elevator. May be repeated.')
+    run.add_argument('--bbox', nargs=4, type=float, metavar=('MINX', 'MINY', 'MAXX', 'MAXY'),
+                     help='Only compute inclines of edges with both endpoints in this box.')
+    run.add_argument('--layered', action='store_true',
+                     help='Treat the DEMs as layers in priority order (e.g. lidar before NED): each edge gets its '
+                          'incline from the first DEM covering it, recorded in ext:incline_source.')
+    run.add_argument('--overview-factor', type=int, default=1, metavar='N',
+                     help='Coarse mode: read the DEMs decimated by N, from overviews built next to them if missing '
+                          '(default: 1, full resolution).')
+    run.add_argument('--coarse-length', type=float, metavar='METERS',
+                     help='With --overview-factor, only read edges at least this long coarsely.')
+    run.add_argument('--report-format', choices=('text', 'json'), default='text',
+                     help='Format of the report on stdout (text or json); the graphs are written as GeoJSON either way.')
+    run.add_argument('--stats', help='Write per-graph timings and counters to this JSON file.')
+    run.add_argument('--debug', action='store_true', help='Enable debug logging.')
+    run.set_defaults(func=run_command)
+
+    plan = subparsers.add_parser('plan', help='Estimate the cost of a run without computing inclines.')
+    plan.add_argument('nodes', metavar='NODES', help='Nodes GeoJSON file.')
+    plan.add_argument('edges', metavar='EDGES', help='Edges GeoJSON file.')
+    plan_dems = plan.add_mutually_exclusive_group(required=True)
+    plan_dems.add_argument('--dem-dir', help='Directory of NED tiles.')
+    plan_dems.add_argument('--dem', nargs='+', help='DEM files.')
+    plan.add_argument('--workers', type=int, default=1, help='Number of worker processes to estimate for.')
+    plan.add_argument('--memory-budget-mb', type=int, default=DEFAULT_MEMORY_BUDGET_BYTES // (1024 * 1024),
+                      help='Memory budget for open DEM tiles, per worker (default: %(default)s).')
+    plan.add_argument('--max-memory-mb', type=int,
+                      help='Memory budget of the chunked mode (default: 256).')
+    plan.add_argument('--debug', action='store_true', help='Enable debug logging.')
+    plan.set_defaults(func=plan_command)
+
+    shard = subparsers.add_parser('shard', help='Split a graph into shards which can be run independently.')
+    shard.add_argument('nodes', metavar='NODES', help='Nodes GeoJSON file.')
+    shard.add_argument('edges', metavar='EDGES', help='Edges GeoJSON file.')
+    shard.add_argument('--out', required=True, help='Directory the shards and their manifest are written to.')
+    shard.add_argument('--by', choices=SHARD_KINDS, default='tile',
+                       help='Shard by NED tile or by grid cell (default: tile).')
+    shard.add_argument('--cell-size', type=float, default=DEFAULT_SHARD_CELL_SIZE,
+                       help='Grid cell size in degrees, with --by cell (default: %(default)s).')
+    shard.add_argument('--debug', action='store_true', help='Enable debug logging.')
+    shard.set_defaults(func=shard_command)
+
+    merge = subparsers.add_parser('merge', help='Reassemble processed shards into one nodes/edges pair.')
+    merge.add_argument('manifest', metavar='MANIFEST', help='Manifest written by the shard command.')
+    merge.add_argument('--nodes', required=True, help='Nodes GeoJSON file to write.')
+    merge.add_argument('--edges', required=True, help='Edges GeoJSON file to write.')
+    merge.add_argument('--debug', action='store_true', help='Enable debug logging.')
+    merge.set_defaults(func=merge_command)
+    return parser
+
+
+def run_command(args):
+    pairs = [tuple(pair) for pair in args.graph]
+    for manifest in args.manifest:
+        pairs.extend(read_manifest(manifest))
+    if not pairs:
+        raise SystemExit('osw-incline run: no graphs given, use --graph or --manifest')
+    if args.workers < 1:
+        raise SystemExit('osw-incline run: --workers must be at least 1')
+    if not 1 <= args.overview_factor <= MAX_OVERVIEW_FACTOR:
+        raise SystemExit(f'osw-incline run: --overview-factor must be between 1 and {MAX_OVERVIEW_FACTOR}')
+
+    edge_filter = None
+    if args.exclude or args.bbox:
+        from .edge_filter import EdgeFilter
+
+        edge_filter = EdgeFilter(exclude=parse_excludes(args.exclude), bbox=args.bbox)
+
+    # Graphs sharing DEM tiles are run back to back, in the same worker
+    scheduler = TileScheduler(
+        dem_files=args.dem,
+        tile_dir=args.dem_dir,
+        memory_budget_bytes=args.memory_budget_mb * 1024 * 1024,
+        debug=args.debug
+    )
+    start_time = time.time()
+    records, schedule = scheduler.run(
+        pairs,
+        workers=args.workers,
+        skip_existing_tags=args.skip_existing_tags,
+        batch_processing=args.batch_processing,
+        method=args.method,
+        coverage_index=args.coverage_index,
+        elevation_cache=args.elevation_cache,
+        edge_filter=edge_filter,
+        layered=args.layered,
+        overview_factor=args.overview_factor,
+        coarse_length=args.coarse_length
+    )
+
+    summary = _summary(records, time.time() - start_time, schedule)
+    if args.stats:
+        with open(args.stats, 'w') as f:
+            json.dump(summary, f, indent=2)
+    _report(summary, args.report_format)
+    return 0 if summary['failed'] == 0 else 1
+
+
+def plan_command(args):
+    from .run_plan import plan_run
+
+    if args.workers < 1:
+        raise SystemExit('osw-incline plan: --workers must be at least 1')
+    plan = plan_run(
+        args.nodes,
+        args.edges,
+        dem_files=args.dem,
+        tile_dir=args.dem_dir,
+        workers=args.workers,
+        max_memory_bytes=None if args.max_memory_mb is None else args.max_memory_mb * 1024 * 1024,
+        memory_budget_bytes=args.memory_budget_mb * 1024 * 1024,
+        debug=args.debug
+    )
+    json.dump(plan, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0
+
+
+def shard_command(args):
+    if args.cell_size <= 0:
+        raise SystemExit('osw-incline shard: --cell-size must be positive')
+    manifest = shard_graph(args.nodes, args.edges, args.out, by=args.by, cell_size=args.cell_size, debug=args.debug)
+    for shard in manifest['shards']:
+        tiles = ', '.join(shard['tiles']) or 'no tiles'
+        print(f'{shard["name"]}: {shard["edge_count"]} edges, {shard["node_count"]} nodes ({tiles})')
+    print(f'{len(manifest["shards"])} shards written to {Path(args.out, MANIFEST_NAME)}')
+    return 0
+
+
+def merge_command(args):
+    try:
+        merge_shards(args.manifest, args.nodes, args.edges, debug=args.debug)
+    except ValueError as e:
+        raise SystemExit(f'osw-incline merge: {e}')
+    print(f'Merged {args.manifest} into {args.nodes} and {args.edges}')
+    return 0
+
+
+def _summary(records, seconds, schedule):
+    totals = Counter()
+    for record in records:
+        totals.update(record['stats'])
+    return {
+        'version': __version__,
+        'workers': schedule['workers'],
+        'seconds': seconds,
+        'graphs': len(records),
+        'failed': sum(record['status'] != 'ok' for record in records),
+        'stats': dict(totals),
+        'schedule': {key: value for key, value in schedule.items() if key != 'workers'},
+        'results': records,
+    }
+
+
+def _report(summary, report_format):
+    if report_format == 'json':
+        json.dump(summary, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return
+    for record in summary['results']:
+        if record['status'] == 'ok':
+            print(f'ok     {record["edges"]} ({record["edge_count"]} edges, {record["seconds"]:.2f}s)')
+        else:
+            print(f'error  {record["edges"]}: {record["error"]}')
+    schedule = summary['schedule']
+    print(f'{summary["graphs"] - summary["failed"]}/{summary["graphs"]} graphs processed '
+          f'in {summary["seconds"]:.2f}s with {summary["workers"]} worker(s)')
+    print(f'{schedule["actual_loads"]} DEM tile loads (estimated {schedule["estimated_loads"]}, '
+          f'{schedule["naive_loads"]} in input order)')
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import numpy as np
+from rasterio.enums import Resampling
+
+# Decimation of the mask an index is built from. Masks are 0 or 255, so the average
+# of a sample of fewer than 510 pixels rounds to 0 only if none of them is valid
+MASK_DECIMATION = 16
+
+
+class CoverageIndex:
+    """Low-resolution map of where a DEM has data.
+
+    The raster is divided into square blocks of ``block_size`` pixels and each
+    block is flagged according to whether it holds at least one valid pixel.
+    Interpolation windows that only touch empty blocks are known to be all
+    nodata and can be rejected without reading the DEM.
+    """
+
+    def __init__(self, has_data, block_size, width, height):
+        self.has_data = has_data
+        self.block_size = block_size
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def build(cls, dem, block_size):
+        block_rows = -(-dem.height // block_size)
+        block_cols = -(-dem.width // block_size)
+        has_data = np.zeros((block_rows, block_cols), dtype=bool)
+        # A single decimated read, served from the overviews where the DEM has them, instead of a
+        # full-resolution read of every block: each sample is valid if any pixel it covers is
+        factor = min(block_size, MASK_DECIMATION)
+        sample_rows = -(-dem.height // factor)
+        sample_cols = -(-dem.width // factor)
+        mask = dem.read_masks(1, out_shape=(sample_rows, sample_cols), resampling=Resampling.average)
+        first_rows, last_rows = _sample_blocks(dem.height, sample_rows, block_size)
+        first_cols, last_cols = _sample_blocks(dem.width, sample_cols, block_size)
+        rows, cols = np.nonzero(mask)
+        # A sample is no larger than a block, so it overlaps at most 2x2 of them
+        for block_rows_of in (first_rows[rows], last_rows[rows]):
+            for block_cols_of in (first_cols[cols], last_cols[cols]):
+                has_data[block_rows_of, block_cols_of] = True
+        return cls(has_data=has_data, block_size=block_size, width=dem.width, height=dem.height)
+
+    @property
+    def coverage(self):
+        """Share of blocks holding at least one valid pixel."""
+        return float(self.has_data.mean()) if self.has_data.size else 0.0
+
+    def all_nodata(self, row_off, col_off, dim):
+        """Flag the ``dim`` x ``dim`` windows starting at (row_off, col_off) that
+        lie entirely in empty blocks. Accepts scalars or arrays of offsets."""
+        row_off = np.asarray(row_off)
+        col_off = np.asarray(col_off)
+        last_row = self.has_data.shape[0] - 1
+        last_col = self.has_data.shape[1] - 1
+        # A window is smaller than a block, so it spans at most 2x2 blocks
+        top = np.clip(row_off // self.block_size, 0, last_row)
+        bottom = np.clip((row_off + dim - 1) // self.block_size, 0, last_row)
+        left = np.clip(col_off // self.block_size, 0, last_col)
+        right = np.clip((col_off + dim - 1) // self.block_size, 0, last_col)
+        return ~(
+            self.has_data[top, left] | self.has_data[top, right] |
+            self.has_data[bottom, left] | self.has_data[bottom, right]
+        )
+
+
+def _sample_blocks(size, samples, block_size):
+    # First and last block overlapped by each of ``samples`` samples spread over ``size`` pixels
+    index = np.arange(samples)
+    first = index * size // samples
+    last = -(-(index + 1) * size // samples) - 1
+    return first // block_size, last // block_size
@@ -1,150 +1,691 @@
-import gc
+import os
 import math
 import pyproj
+import functools
+import itertools
+from collections import OrderedDict, Counter
 import rasterio
 import numpy as np
-from typing import List
+from contextlib import nullcontext, contextmanager
 from pathlib import Path
 from .logger import Logger
-from .osm_graph import OSMGraph
+from rasterio.enums import Resampling
 from rasterio.windows import Window
-from shapely.geometry import LineString
-from scipy.interpolate import RectBivariateSpline
+from .coverage_index import CoverageIndex
+from .memory import paused_gc, collect
+from .progress import Cancelled, PROGRESS_CHUNK_EDGES
+from typing import List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .osm_graph import OSMGraph
+    from .elevation_cache import ElevationCache
+    from .checkpoint import Checkpoint
+    from .memory import MemoryMonitor
+    from .progress import ProgressTracker
+
+METHODS = ('idw', 'bilinear', 'spline')
+
+# Array-based interpolation reads the DEM in square blocks of this many pixels
+# and keeps the most recently used ones resident, up to DEFAULT_BLOCK_CACHE_BYTES.
+BLOCK_SIZE = 256
+DEFAULT_BLOCK_CACHE_BYTES = 64 * 1024 * 1024
+# Largest interpolation window (3x3) minus one: rows/cols read past each block edge
+BLOCK_PADDING = 2
+
+# Coarse reads decimate the DEM by at most this factor, so that a decimated 3x3
+# window still spans at most 2x2 blocks of the coverage index
+MAX_OVERVIEW_FACTOR = 64
+# Overview rows written at once while building an overview
+OVERVIEW_BUILD_ROWS = 256
+
+# Layered runs record the DEM each incline was computed from in this (OSW extension) edge property
+SOURCE_PROPERTY = 'ext:incline_source'
+# Edges interpolated at once against one layer
+LAYER_BATCH_SIZE = 10000
+
+# DEM files given as URLs are read remotely, block by block, as Cloud-Optimized GeoTIFFs
+REMOTE_PREFIXES = {'http://': '/vsicurl/http://', 'https://': '/vsicurl/https://', 's3://': '/vsis3/'}
+# GDAL settings for remote DEMs: no directory listings, neighbouring block requests
+# merged into a single range request, and fetched bytes kept in GDAL's memory cache.
+# That cache only lasts as long as the process: elevations persist across runs in an
+# ElevationCache, and whole tiles in a TileCache
+REMOTE_GDAL_OPTIONS = {
+    'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR',
+    'CPL_VSIL_CURL_ALLOWED_EXTENSIONS': '.tif,.tiff',
+    'GDAL_HTTP_MERGE_CONSECUTIVE_RANGES': 'YES',
+    'GDAL_HTTP_MULTIPLEX': 'YES',
+    'VSI_CACHE': 'TRUE',
+    'VSI_CACHE_SIZE': str(DEFAULT_BLOCK_CACHE_BYTES),
+}
+
+
+def is_remote(dem_file):
+    return str(dem_file).startswith(tuple(REMOTE_PREFIXES))
+
+
+def dem_path(dem_file):
+    """Return what to open ``dem_file`` with: a local Path, or a GDAL virtual file
+    system path for URLs."""
+    name = str(dem_file)
+    for prefix, vsi_prefix in REMOTE_PREFIXES.items():
+        if name.startswith(prefix):
+            return vsi_prefix + name[len(prefix):]
+    return Path(dem_file)
+
+
+def dem_env(dem_file):
+    """GDAL environment to open and read ``dem_file`` in. GDAL settings are
+    per thread, so reads from another thread need their own environment."""
+    return rasterio.Env(**REMOTE_GDAL_OPTIONS) if is_remote(dem_file) else nullcontext()
+
+
+@functools.lru_cache(maxsize=None)
+def _transformer_to(crs_wkt):
+    return pyproj.Transformer.from_crs(pyproj.CRS('EPSG:4326'), pyproj.CRS.from_wkt(crs_wkt), always_xy=True)
+
+
+def raster_transformer(crs):
+    """Transformer from lon/lat to a DEM's projected ``crs``, shared by every DEM
+    in that CRS. Returns None for geographic or unknown CRSs, whose DEMs are
+    indexed with lon/lat directly."""
+    if crs is None:
+        return None
+    try:
+        crs_wkt = crs.to_wkt()
+        if not pyproj.CRS.from_wkt(crs_wkt).is_projected:
+            return None
+    except (pyproj.exceptions.CRSError, rasterio.errors.CRSError, TypeError):
+        return None
+    return _transformer_to(crs_wkt)
+
+
+def geographic_bounds(dem):
+    """Bounds of ``dem`` in lon/lat, whatever its CRS."""
+    if raster_transformer(dem.crs) is None:
+        return dem.bounds
+    from rasterio.coords import BoundingBox
+    from rasterio.warp import transform_bounds
+
+    return BoundingBox(*transform_bounds(dem.crs, 'EPSG:4326', *dem.bounds, densify_pts=21))
+
+
+def reverse_twins(coords):
+    """For an (N, 4) array of ``(first_lon, first_lat, last_lon, last_lat)`` rows,
+    map each row whose endpoints are exactly those of an earlier row in reverse
+    to that row, and every other row to -1. Only unambiguous pairs, with one
+    edge each way, are matched."""
+    twin_of = np.full(len(coords), -1, dtype=np.int64)
+    if len(coords) < 2:
+        return twin_of
+    forward = (coords[:, 0] < coords[:, 2]) | ((coords[:, 0] == coords[:, 2]) & (coords[:, 1] < coords[:, 3]))
+    # Both directions of an edge share the same canonical row; + 0.0 turns -0.0 into 0.0
+    canonical = np.ascontiguousarray(np.where(forward[:, None], coords, coords[:, [2, 3, 0, 1]])) + 0.0
+    keys = canonical.view(np.dtype((np.void, canonical.itemsize * 4))).ravel()
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+
+    candidates = np.flatnonzero(counts[inverse] == 2)
+    pairs = candidates[np.lexsort((candidates, inverse[candidates]))].reshape(-1, 2)
+    reverse = forward[pairs[:, 0]] != forward[pairs[:, 1]]
+    twin_of[pairs[reverse, 1]] = pairs[reverse, 0]
+    return twin_of
+
+
+def build_overview(dem_file, factor, debug=False):
+    """Make sure a local GeoTIFF has an overview decimated by ``factor``.
+
+    A missing overview is written, by averaging ``factor`` x ``factor`` pixels,
+    to an external ``.ovr`` file next to the DEM, which GDAL picks up the next
+    time the DEM is opened. Returns whether the overview is available: not for
+    remote DEMs, nor if another ``.ovr`` file without this factor exists or
+    cannot be written, in which case decimated reads fall back to resampling
+    the full-resolution pixels.
+    """
+    if is_remote(dem_file):
+        return False
+    ovr_path = Path(f'{dem_file}.ovr')
+    with rasterio.open(dem_file) as src:
+        if factor in src.overviews(1):
+            return True
+        if ovr_path.exists():
+            if debug:
+                Logger.warning(f'{ovr_path} has no overview decimated by {factor}, reading {dem_file} in full')
+            return False
+
+        width, height = src.width // factor, src.height // factor
+        profile = dict(
+            src.profile, driver='GTiff', width=width, height=height, count=1,
+            transform=src.transform * src.transform.scale(factor), tiled=True, blockxsize=256, blockysize=256
+        )
+        partial_path = Path(f'{ovr_path}.{os.getpid()}.partial')
+        try:
+            with rasterio.open(partial_path, 'w', **profile) as dst:
+                for row in range(0, height, OVERVIEW_BUILD_ROWS):
+                    window = Window(0, row, width, min(OVERVIEW_BUILD_ROWS, height - row))
+                    data = src.read(
+                        1, window=Window(0, row * factor, width * factor, window.height * factor),
+                        out_shape=(window.height, width), resampling=Resampling.average, masked=True
+                    )
+                    dst.write(data.filled(src.nodata) if src.nodata is not None else data.data, 1, window=window)
+            os.replace(partial_path, ovr_path)
+        except (OSError, rasterio.errors.RasterioError) as e:
+            if debug:
+                Logger.warning(f'Could not build an overview of {dem_file}: {e}')
+            partial_path.unlink(missing_ok=True)
+            return False
+    if debug:
+        Logger.info(f'Built overview of {dem_file} decimated by {factor}: {ovr_path}')
+    return True
+
+
+def source_name(dem_file):
+    """Name recorded in ``SOURCE_PROPERTY`` for ``dem_file``: its file name."""
+    return Path(str(dem_file)).name
+
+
+class LayeredEdges:
+    """Edges of a layered run, and which of them no DEM layer has resolved yet.
+
+    ``pending`` holds the edge data dicts and ``coords`` their
+    ``(first_lon, first_lat, last_lon, last_lat)`` rows.
+    """
+
+    def __init__(self, pending, coords):
+        self.pending = pending
+        self.coords = coords
+        self.unresolved = np.arange(len(pending))
+
+    @property
+    def done(self):
+        return not len(self.unresolved)
 
 
 class DEMProcessor:
 
-    def __init__(self, osm_graph: OSMGraph, dem_files: List[str], debug=False):
+    def __init__(self, osm_graph: 'OSMGraph', dem_files: List[str], debug=False, method='idw',
+                 block_cache_bytes=DEFAULT_BLOCK_CACHE_BYTES, coverage_index=False,
+                 elevation_cache: 'ElevationCache' = None, checkpoint: 'Checkpoint' = None, layered=False,
+                 overview_factor=1, coarse_length=None, build_overviews=True, memory: 'MemoryMonitor' = None,
+                 progress: 'ProgressTracker' = None):
+        if method not in METHODS:
+            raise ValueError('Invalid interpolation method {} selected'.format(method))
+        if not 1 <= overview_factor <= MAX_OVERVIEW_FACTOR:
+            raise ValueError(f'overview_factor must be between 1 and {MAX_OVERVIEW_FACTOR}')
         wgs84 = pyproj.CRS('EPSG:4326')
         utm = pyproj.CRS('EPSG:32610')
         self.transformer = pyproj.Transformer.from_crs(wgs84, utm, always_xy=True)
         self.dem_files = dem_files
         self.OG = osm_graph
         self.debug = debug
+        self.method = method
+        self.block_cache_bytes = block_cache_bytes
+        self._block_cache = OrderedDict()
+        self._block_cache_size = 0
+        # Per-DEM nodata coverage, built the first time a DEM is used
+        self.coverage_index = coverage_index
+        self._coverage = {}
+        # Elevations of earlier runs, consulted by the array-based path before reading the DEM
+        self.elevation_cache = elevation_cache
+        self._fingerprints = {}
+        # Per-DEM transformer into a projected DEM CRS (None for lon/lat DEMs)
+        self._raster_transformers = {}
+        # Progress committed to disk while processing, so that an interrupted run can resume
+        self.checkpoint = checkpoint
+        # dem_files are layers in priority order: each edge gets its incline from the first one covering it
+        self.layered = layered
+        # Coarse mode: DEMs are read decimated by overview_factor, for every edge or only
+        # for edges at least coarse_length meters long, from (built if missing) overviews
+        self.overview_factor = overview_factor
+        self.coarse_length = coarse_length
+        self.build_overviews = build_overviews
+        # Garbage collection policy, and memory use per DEM tile; the default policy if None
+        self.memory = memory
+        # Progress of process(), reported and checked for cancellation between chunks of edges
+        self.progress = progress
+        self.stats = Counter()
 
     def process(self, nodes_path, edges_path, skip_existing_tags=False, batch_processing=False):
-        gc.disable()
+        # Automatic collection stays paused while the graph is processed; the
+        # memory policy decides when to collect
+        with paused_gc():
+            if self.progress is not None:
+                tiles = len(self.dem_files) if hasattr(self.dem_files, '__len__') else None
+                self.progress.start(self.OG.G.number_of_edges(), tiles)
+            self._process(nodes_path, edges_path, skip_existing_tags=skip_existing_tags,
+                          batch_processing=batch_processing)
+            if self.progress is not None:
+                self.progress.finish()
+
+    def _process(self, nodes_path, edges_path, skip_existing_tags=False, batch_processing=False):
+        if self.layered:
+            if self.checkpoint is not None:
+                raise ValueError('checkpoint is not supported with layered DEMs')
+            self._process_layered(nodes_path, edges_path, skip_existing_tags=skip_existing_tags)
+            return
+
+        edges = None if self.checkpoint is None else self._resume()
+        written = False
+        for dem_file in self.dem_files:
+            if edges is not None and self.checkpoint.is_done(dem_file):
+                self.stats['checkpoint_skipped_tiles'] += 1
+                if self.progress is not None:
+                    self.progress.end_tile()
+                continue
+            with self._open_dem(dem_file) as dem:
+                if edges is None:
+                    self.process_graph(
+                        G=self.OG.G,
+                        dem=dem,
+                        skip_existing_tags=skip_existing_tags,
+                        batch_processing=batch_processing
+                    )
+                else:
+                    self._process_checkpointed(
+                        edges, dem, dem_file, skip_existing_tags=skip_existing_tags,
+                        batch_processing=batch_processing
+                    )
+                self.OG.to_geojson(nodes_path, edges_path)
+                written = True
+                if edges is not None:
+                    self.checkpoint.complete(dem_file)
+
+        if edges is not None and not written:
+            # Every tile was done before the interruption; write out the restored inclines
+            self.OG.to_geojson(nodes_path, edges_path)
+
+    def prepare_overview(self, dem_file):
+        """Build the overview coarse mode reads from ``dem_file``, if needed.
+        To be called before the DEM is opened."""
+        if self.overview_factor > 1 and self.build_overviews:
+            build_overview(dem_file, self.overview_factor, debug=self.debug)
+
+    def factor_for(self, length):
+        """Decimation factor of the DEM reads for an edge of ``length`` meters."""
+        if self.coarse_length is None or length >= self.coarse_length:
+            return self.overview_factor
+        return 1
+
+    @contextmanager
+    def _open_dem(self, dem_file):
+        dem_file_path = dem_path(dem_file)
+        if self.debug:
+            Logger.debug(f'Processing DEM tile: {dem_file_path}')
+        stage = nullcontext() if self.memory is None else self.memory.stage(f'tile {source_name(dem_file)}')
+        if self.progress is not None:
+            self.progress.begin_tile(source_name(dem_file))
+        try:
+            with stage:
+                try:
+                    self.prepare_overview(dem_file)
+                    with dem_env(dem_file), rasterio.open(dem_file_path) as dem:
+                        yield dem
+                finally:
+                    collect(self.memory, 'tile')
+        except Cancelled:
+            raise
+        except rasterio.errors.RasterioIOError:
+            if self.debug:
+                Logger.error(f'Failed to open DEM file: {dem_file_path}')
+            raise Exception(f'Failed to open DEM file: {dem_file_path}')
+        except Exception as e:
+            if self.debug:
+                Logger.error(f'Error processing DEM file: {dem_file_path}, error: {e}')
+            raise Exception(f'Error processing DEM file: {dem_file_path}, error: {e}')
+        if self.progress is not None:
+            self.progress.end_tile()
+
+    def _advance(self, edges):
+        # Called between chunks of edges: reports progress and stops a cancelled run
+        if self.progress is not None:
+            self.progress.advance(edges)
+
+    def _process_layered(self, nodes_path, edges_path, skip_existing_tags=False):
+        layers = self.layered_edges(self.OG.G.edges(data=True), skip_existing_tags=skip_existing_tags)
         for dem_file in self.dem_files:
-            dem_file_path = Path(dem_file)
+            if layers.done:
+                break
+            with self._open_dem(dem_file) as dem:
+                self.process_layer(layers, dem, dem_file)
+        self.OG.to_geojson(nodes_path, edges_path)
+
+    def layered_edges(self, edges, skip_existing_tags=False):
+        """Collect the ``(u, v, data)`` edges which need an incline for a layered run."""
+        pending, coords = self._pending_edges(edges, skip_existing_tags=skip_existing_tags)
+        for d in pending:
+            d.pop(SOURCE_PROPERTY, None)
+        return LayeredEdges(pending, np.array(coords, dtype=np.float64).reshape(-1, 4))
+
+    def process_layer(self, layers, dem, dem_file):
+        """Compute the inclines of the edges no earlier layer resolved from ``dem``.
+
+        Only edges with both endpoints within the DEM's bounds are interpolated,
+        in bulk. Those which get an incline are resolved, and the DEM is
+        recorded in their ``SOURCE_PROPERTY``; the others are left to the next
+        layers. Both endpoints of an edge always come from the same layer, so
+        that its incline does not mix two DEMs.
+        """
+        bounds = geographic_bounds(dem)
+        coords = layers.coords[layers.unresolved]
+        lons, lats = coords[:, [0, 2]], coords[:, [1, 3]]
+        covered = ((lons >= bounds.left) & (lons <= bounds.right) &
+                   (lats >= bounds.bottom) & (lats <= bounds.top)).all(axis=1)
+        candidates = layers.unresolved[covered]
+
+        resolved = []
+        source = source_name(dem_file)
+        for start in range(0, len(candidates), LAYER_BATCH_SIZE):
+            batch = candidates[start:start + LAYER_BATCH_SIZE]
+            inclines = self.infer_inclines(layers.coords[batch], dem=dem, precision=3)
+            found = ~np.isnan(inclines)
+            for i, incline in zip(batch[found].tolist(), inclines[found].tolist()):
+                if -1 <= incline <= 1:
+                    d = layers.pending[i]
+                    d['incline'] = incline
+                    d[SOURCE_PROPERTY] = source
+            resolved.append(batch[found])
+            self._advance(len(batch))
+
+        if resolved:
+            resolved = np.concatenate(resolved)
+            layers.unresolved = np.setdiff1d(layers.unresolved, resolved, assume_unique=True)
+            self.stats['layered_edges'] += len(resolved)
+        self.clear_block_cache(dem.name)
+        if self.debug:
+            Logger.debug(f'{len(resolved)} edges resolved from {dem_file}, {len(layers.unresolved)} left')
+
+    def _resume(self):
+        # Restores the inclines of an interrupted run of the same graph, if any
+        edges = list(self.OG.G.edges(data=True))
+        if not isinstance(self.dem_files, (list, tuple)):
+            # Tiles handed over as they download are waited for, as the checkpoint is bound to them
+            self.dem_files = list(self.dem_files)
+        if self.checkpoint.start(self.OG.G, self.method, self.dem_files, layered=self.layered):
+            self.stats['checkpoint_restored_edges'] += self.checkpoint.restore(edges)
             if self.debug:
-                Logger.debug(f'Processing DEM tile: {dem_file_path}')
-
-            try:
-                with rasterio.open(dem_file_path) as dem:
-                    """
-                    Option 1:
-                        Pros:
-                            Batching: This approach processes edges in batches of 1000, which can be faster for large graphs.
-                            Parallelization: The second approach can be parallelized by using a ThreadPoolExecutor or similar.
-                        Cons:
-                            Memory usage: The second approach stores all edges in a list, which could be memory-intensive for large graphs.
-                            Intermediate list storage: The second approach stores the entire edge set as a list in memory, which is not memory-efficient.
-                    """
-                    if batch_processing:
-                        edges = list(self.OG.G.edges(data=True))  # Get all edges, even if fewer than batch_size
-                        self._process_in_batches(edges, dem, batch_size=10000, skip_existing_tags=skip_existing_tags)
-                    else:
-                        """
-                        Option 2:
-                            Pros:
-                                Simple iteration: The first approach iterates over the edges one by one, making the memory footprint relatively small, especially if you have a large number of edges.
-                                No intermediate list storage: It does not store the entire edge set as a list in memory, which is better for memory efficiency.
-                            Cons:
-                                Single-threaded: The entire edge processing happens sequentially, which can be slower for very large graphs, as there's no batching or parallelization.
-                                No batching: It processes all edges at once in a loop, which could cause memory spikes during large computations if infer_incline holds intermediate states or large datasets.
-                        """
-                        for u, v, d in self.OG.G.edges(data=True):
-                            if 'geometry' in d:
-                                if skip_existing_tags:
-                                    if 'incline' in d and d['incline'] is not None:
-                                        if d['incline'] < -1 or d['incline'] > 1:
-                                            del d['incline']
-                                        # If incline already exists, skip
-                                        continue
-                                incline = self.infer_incline(linestring=d['geometry'], dem=dem, precision=3)
-                                if incline is not None and -1 <= incline <= 1:
-                                    # Add incline to the edge properties
-                                    d['incline'] = incline
-                            else:
-                                if self.debug:
-                                    Logger.info(f'No geometry found for edge {u}-{v}')
+                Logger.info(f'Resuming from checkpoint {self.checkpoint.path}')
+        return edges
 
-                self.OG.to_geojson(nodes_path, edges_path)
-            except rasterio.errors.RasterioIOError:
-                if self.debug:
-                    Logger.error(f'Failed to open DEM file: {dem_file_path}')
-                raise Exception(f'Failed to open DEM file: {dem_file_path}')
-            except Exception as e:
-                if self.debug:
-                    Logger.error(f'Error processing DEM file: {dem_file_path}, error: {e}')
-                raise Exception(f'Error processing DEM file: {dem_file_path}, error: {e}')
-            finally:
-                gc.collect()
+    def _process_checkpointed(self, edges, dem, dem_file, skip_existing_tags=False, batch_processing=False):
+        # Same as process_graph, committing progress every checkpoint.every edges
+        computed = {}
+        start = self.checkpoint.position(dem_file)
+        self._advance(start)
+        for i in range(start, len(edges), self.checkpoint.every):
+            chunk = edges[i:i + self.checkpoint.every]
+            if batch_processing or self.elevation_cache is not None:
+                self._process_in_batches(chunk, dem, batch_size=10000, skip_existing_tags=skip_existing_tags)
+            else:
+                for u, v, d in chunk:
+                    self._process_edge(u, v, d, dem, skip_existing_tags=skip_existing_tags, computed=computed,
+                                       has_twin=self.OG.G.has_edge(v, u))
+                self._advance(len(chunk))
+            self.checkpoint.save(
+                dem_file, i + len(chunk), [(i + j, d.get('incline')) for j, (_, _, d) in enumerate(chunk)]
+            )
 
-        gc.disable()
+    def process_graph(self, G, dem, skip_existing_tags=False, batch_processing=False):
+        """Add inclines from an already opened DEM to the edges of ``G`` in place.
+        Runs with an elevation cache always use the array path, which looks it up."""
+        if batch_processing or self.elevation_cache is not None:
+            """
+            Option 1:
+                Pros:
+                    Batching: This approach processes edges in batches of 1000, which can be faster for large graphs.
+                    Parallelization: The second approach can be parallelized by using a ThreadPoolExecutor or similar.
+                Cons:
+                    Memory usage: The second approach stores all edges in a list, which could be memory-intensive for large graphs.
+                    Intermediate list storage: The second approach stores the entire edge set as a list in memory, which is not memory-efficient.
+            """
+            edges = list(G.edges(data=True))  # Get all edges, even if fewer than batch_size
+            self._process_in_batches(edges, dem, batch_size=10000, skip_existing_tags=skip_existing_tags)
+        else:
+            """
+            Option 2:
+                Pros:
+                    Simple iteration: The first approach iterates over the edges one by one, making the memory footprint relatively small, especially if you have a large number of edges.
+                    No intermediate list storage: It does not store the entire edge set as a list in memory, which is better for memory efficiency.
+                Cons:
+                    Single-threaded: The entire edge processing happens sequentially, which can be slower for very large graphs, as there's no batching or parallelization.
+                    No batching: It processes all edges at once in a loop, which could cause memory spikes during large computations if infer_incline holds intermediate states or large datasets.
+            """
+            # Inclines by endpoints, so that the reverse twin of an edge is not computed again.
+            # Only edges with a v-u edge are kept, until their twin takes them
+            computed = {}
+            edges = iter(G.edges(data=True))
+            # In chunks, so that progress and cancellation are checked between them
+            for chunk in iter(lambda: list(itertools.islice(edges, PROGRESS_CHUNK_EDGES)), []):
+                for u, v, d in chunk:
+                    self._process_edge(u, v, d, dem, skip_existing_tags=skip_existing_tags, computed=computed,
+                                       has_twin=G.has_edge(v, u))
+                self._advance(len(chunk))
 
     def _process_in_batches(self, edges, dem, batch_size=10000, skip_existing_tags=False):
         # Process edges in batches
         for i in range(0, len(edges), batch_size):
             batch = edges[i:i + batch_size]
-            for u, v, d in batch:
-                if 'geometry' in d:
-                    if skip_existing_tags:
-                        if 'incline' in d and d['incline'] is not None:
-                            if d['incline'] < -1 or d['incline'] > 1:
-                                del d['incline']
-                            # If incline already exists, skip
-                            continue
-                    incline = self.infer_incline(linestring=d['geometry'], dem=dem, precision=3)
-                    if incline is not None and -1 <= incline <= 1:
-                        d['incline'] = incline
-            # Trigger garbage collection after each batch
-            gc.collect()
+            self.process_edge_batch(batch, dem, skip_existing_tags=skip_existing_tags)
+            collect(self.memory, 'batch')
+            self._advance(len(batch))
+
+    def process_edge_batch(self, edges, dem, skip_existing_tags=False):
+        """Array-based counterpart of ``process_edges``: all endpoints of the batch
+        are interpolated at once against resident DEM blocks."""
+        pending, coords = self._pending_edges(edges, skip_existing_tags=skip_existing_tags)
+        if not pending:
+            return
+        inclines = self.infer_inclines(np.array(coords, dtype=np.float64), dem=dem, precision=3)
+        for d, incline in zip(pending, inclines):
+            if not np.isnan(incline) and -1 <= incline <= 1:
+                d['incline'] = float(incline)
+
+    def process_coords(self, coords, inclines, rows=None):
+        """In-memory counterpart of ``process``: computes the inclines of the
+        edges ``rows`` (all by default) of an (N, 4) array of ``(first_lon,
+        first_lat, last_lon, last_lat)`` rows from every DEM file in turn, and
+        sets them in ``inclines`` in place. Inclines from later DEM files replace
+        those of earlier ones, except in a layered run, where the first DEM
+        giving an edge an incline wins. Edges without one keep their value in
+        ``inclines``. Only the DEM files are read.
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 4)
+        pending = np.arange(len(coords)) if rows is None else np.asarray(rows, dtype=np.int64)
+        with paused_gc():
+            if self.progress is not None:
+                tiles = len(self.dem_files) if hasattr(self.dem_files, '__len__') else None
+                self.progress.start(len(pending), tiles)
+            for dem_file in self.dem_files:
+                if self.layered and not len(pending):
+                    break
+                resolved = []
+                with self._open_dem(dem_file) as dem:
+                    for start in range(0, len(pending), 10000):
+                        batch = pending[start:start + 10000]
+                        computed = self.infer_inclines(coords[batch], dem=dem, precision=3)
+                        found = ~np.isnan(computed)
+                        valid = found & (computed >= -1) & (computed <= 1)
+                        inclines[batch[valid]] = computed[valid]
+                        resolved.append(batch[found])
+                        collect(self.memory, 'batch')
+                        self._advance(len(batch))
+                    self.clear_block_cache(dem.name)
+                if self.layered and resolved:
+                    resolved = np.concatenate(resolved)
+                    pending = np.setdiff1d(pending, resolved, assume_unique=True)
+                    self.stats['layered_edges'] += len(resolved)
+            if self.progress is not None:
+                self.progress.finish()
+        return inclines
+
+    def _pending_edges(self, edges, skip_existing_tags=False):
+        # Data and endpoint coordinates of the edges which need an incline
+        pending = []
+        coords = []
+        for u, v, d in edges:
+            if 'geometry' not in d:
+                if self.debug:
+                    Logger.info(f'No geometry found for edge {u}-{v}')
+                continue
+            if skip_existing_tags and 'incline' in d and d['incline'] is not None:
+                if d['incline'] < -1 or d['incline'] > 1:
+                    del d['incline']
+                # If incline already exists, skip
+                continue
+            first_point = d['geometry'].coords[0]
+            last_point = d['geometry'].coords[-1]
+            coords.append((first_point[0], first_point[1], last_point[0], last_point[1]))
+            pending.append(d)
+        return pending, coords
+
+    def process_edges(self, edges, dem, skip_existing_tags=False):
+        """Add inclines to a sequence of ``(u, v, data)`` edges in place."""
+        edges = list(edges)
+        keys = {(u, v) for u, v, _ in edges}
+        computed = {}
+        for u, v, d in edges:
+            self._process_edge(u, v, d, dem, skip_existing_tags=skip_existing_tags, computed=computed,
+                               has_twin=(v, u) in keys)
+
+    def _process_edge(self, u, v, d, dem, skip_existing_tags=False, computed=None, has_twin=True):
+        # ``computed`` holds the inclines of edges waiting for their reverse twin, if ``has_twin``
+        # says they have one; the twin pops them, so the dict does not grow with the tile
+        if 'geometry' in d:
+            if skip_existing_tags:
+                if 'incline' in d and d['incline'] is not None:
+                    if d['incline'] < -1 or d['incline'] > 1:
+                        del d['incline']
+                    # If incline already exists, skip
+                    return
+            if computed is None:
+                incline = self.infer_incline(linestring=d['geometry'], dem=dem, precision=3)
+            else:
+                first_point = d['geometry'].coords[0]
+                last_point = d['geometry'].coords[-1]
+                if (last_point, first_point) in computed:
+                    # Same endpoints in reverse: same length and negated elevation difference
+                    incline = computed.pop((last_point, first_point))
+                    incline = None if incline is None else 0.0 - incline
+                    self.stats['reverse_twins'] += 1
+                else:
+                    incline = self.incline_between(first_point, last_point, dem=dem, precision=3)
+                    if has_twin:
+                        computed[(first_point, last_point)] = incline
+            if incline is not None and -1 <= incline <= 1:
+                # Add incline to the edge properties
+                d['incline'] = incline
+        else:
+            if self.debug:
+                Logger.info(f'No geometry found for edge {u}-{v}')
 
     def infer_incline(self, linestring, dem, precision=3):
-        first_point = linestring.coords[0]
-        last_point = linestring.coords[-1]
+        return self.incline_between(
+            first_point=linestring.coords[0],
+            last_point=linestring.coords[-1],
+            dem=dem,
+            precision=precision
+        )
 
+    def incline_between(self, first_point, last_point, dem, precision=3):
         # Dynamically calculate the length
         length = self.calculate_projected_length(first_point=first_point, last_point=last_point)
 
         if length == 0:
             return None
 
-        first_elevation = self.dem_interpolate(lon=first_point[0], lat=first_point[1], dem=dem)
-        second_elevation = self.dem_interpolate(lon=last_point[0], lat=last_point[1], dem=dem)
+        factor = self.factor_for(length)
+        first_elevation = self.dem_interpolate(lon=first_point[0], lat=first_point[1], dem=dem, factor=factor)
+        second_elevation = self.dem_interpolate(lon=last_point[0], lat=last_point[1], dem=dem, factor=factor)
 
         if first_elevation is None or second_elevation is None:
             return None
 
         elevation_diff = second_elevation - first_elevation
+        if np.ma.is_masked(elevation_diff):
+            return None
 
         try:
-            incline = elevation_diff / length
+            # float() so that inclines from float32 DEMs can be written to GeoJSON
+            incline = float(elevation_diff / length)
             return round(incline, precision)
         except Exception as e:
             if self.debug:
                 Logger.error(f'Error calculating incline: {e}')
             return None
 
+    def infer_inclines(self, coords, dem, precision=3):
+        """Vectorised ``incline_between`` for an (N, 4) array of
+        ``(first_lon, first_lat, last_lon, last_lat)`` rows.
+
+        Returns an array of N inclines with NaN where no incline could be inferred.
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 4)
+        inclines = np.full(len(coords), np.nan)
+        if not len(coords):
+            return inclines
+
+        # Edges whose endpoints are those of an earlier edge in reverse get its negated incline
+        twin_of = reverse_twins(coords)
+        twins = np.flatnonzero(twin_of >= 0)
+        if len(twins):
+            self.stats['reverse_twins'] += len(twins)
+            computed = np.flatnonzero(twin_of < 0)
+            inclines[computed] = self.infer_inclines(coords[computed], dem=dem, precision=precision)
+            inclines[twins] = 0.0 - inclines[twin_of[twins]]
+            return inclines
+
+        lengths = self.calculate_projected_lengths(coords)
+        lons = np.concatenate([coords[:, 0], coords[:, 2]])
+        lats = np.concatenate([coords[:, 1], coords[:, 3]])
+        if self.overview_factor == 1:
+            elevations = self.interpolate_points(lons=lons, lats=lats, dem=dem)
+        else:
+            # Both endpoints of an edge are read at the edge's decimation factor
+            coarse = np.tile(lengths >= (self.coarse_length or 0), 2)
+            elevations = np.full(len(lons), np.nan)
+            elevations[coarse] = self.interpolate_points(
+                lons[coarse], lats[coarse], dem=dem, factor=self.overview_factor
+            )
+            elevations[~coarse] = self.interpolate_points(lons[~coarse], lats[~coarse], dem=dem)
+            self.stats['coarse_edges'] += int(coarse.sum()) // 2
+        first_elevations = elevations[:len(coords)]
+        second_elevations = elevations[len(coords):]
+
+        valid = (lengths != 0) & ~np.isnan(first_elevations) & ~np.isnan(second_elevations)
+        raw = (second_elevations[valid] - first_elevations[valid]) / lengths[valid]
+        # Python's round() keeps the results identical to the per-edge path
+        inclines[valid] = [round(value, precision) for value in raw.tolist()]
+        return inclines
+
     def calculate_projected_length(self, first_point, last_point):
         # Convert the geographic coordinates (lon, lat) to projected (UTM) coordinates
         first_proj = self.transformer.transform(first_point[0], first_point[1])
         last_proj = self.transformer.transform(last_point[0], last_point[1])
 
         # Calculate the length in meters
-        length = LineString([first_proj, last_proj]).length
+        dx = last_proj[0] - first_proj[0]
+        dy = last_proj[1] - first_proj[1]
+        length = math.sqrt(dx * dx + dy * dy)
         return length
 
-    def dem_interpolate(self, lon, lat, dem):
+    def calculate_projected_lengths(self, coords):
+        first_x, first_y = self.transformer.transform(coords[:, 0], coords[:, 1])
+        last_x, last_y = self.transformer.transform(coords[:, 2], coords[:, 3])
+        dx = np.asarray(last_x) - np.asarray(first_x)
+        dy = np.asarray(last_y) - np.asarray(first_y)
+        return np.sqrt(dx * dx + dy * dy)
+
+    def dem_interpolate(self, lon, lat, dem, factor=1):
         try:
-            # Log the point being interpolated
+            x, y = lon, lat
+            transformer = self.raster_transformer(dem)
+            if transformer is not None:
+                x, y = transformer.transform(lon, lat)
             interpolated = self.interpolated_value(
-                x=lon,
-                y=lat,
+                x=x,
+                y=y,
                 dem=dem,
-                method='idw',
-                scaling_factor=1.0
+                method=self.method,
+                scaling_factor=1.0,
+                factor=factor
             )
 
             if interpolated is not None:
@@ -156,19 +697,23 @@ class DEMProcessor:
                 Logger.error(f'Error in DEM interpolation: {e}')
         return None
 
-    def interpolated_value(self, x, y, dem, method='idw', scaling_factor=1.0):
+    def interpolated_value(self, x, y, dem, method='idw', scaling_factor=1.0, factor=1):
         """Given a point (x, y), find the interpolated value in the raster using
-        bilinear interpolation.
+        bilinear interpolation. With ``factor`` > 1, the raster is read decimated
+        by ``factor``, from an overview if it has one.
         """
         methods = {'spline': self.bivariate_spline, 'bilinear': self.bilinear, 'idw': self.idw}
 
-        # At this point, we assume that the input DEM is in the same crs as the
-        # x y values.
+        # x and y are in the DEM's crs: lon/lat, or projected coordinates
+        # transformed by dem_interpolate.
 
         # The DEM's affine transformation: maps units along its indices to crs
         # coordinates. e.g. if the DEM is 1000x1000, maps xy values in the
         # 0-1000 range to the DEM's CRS, e.g. lon-lat
         aff = dem.transform
+        if factor > 1:
+            # Pixels of the decimated raster are factor x factor full-resolution pixels
+            aff = aff * aff.scale(factor)
         # The inverse of the transform: maps values in the DEM's crs to indices.
         # Note: the output values are floats between the index integers.
         inv = ~aff
@@ -194,8 +739,24 @@ class DEMProcessor:
             raise ValueError('Invalid interpolation method {} selected'.format(method))
             # FIXME: create any necessary special handling for masked vs. unmasked data
             # FIXME: bilinear interp function doesn't work with masked data
+
+        if self.coverage_index and self.coverage(dem).all_nodata(offset_y * factor, offset_x * factor, dim * factor):
+            # The whole window is known to be nodata: skip the read
+            self.stats['nodata_skips'] += 1
+            return None
+
         try:
-            dem_arr = dem.read(1, window=Window(offset_x, offset_y, dim, dim), masked=True)
+            if factor > 1:
+                if offset_x < 0 or offset_y < 0 or offset_x + dim > dem.width // factor or \
+                        offset_y + dim > dem.height // factor:
+                    # Windows cut off by the raster edge cannot be interpolated
+                    return None
+                dem_arr = dem.read(
+                    1, window=Window(offset_x * factor, offset_y * factor, dim * factor, dim * factor),
+                    out_shape=(dim, dim), resampling=Resampling.average, masked=True
+                )
+            else:
+                dem_arr = dem.read(1, window=Window(offset_x, offset_y, dim, dim), masked=True)
         except ValueError as e:
             raise e
 
@@ -250,18 +811,240 @@ class DEMProcessor:
         nrow, ncol = arr.shape
         if (nrow != 2) or (ncol != 2):
             raise ValueError('Shape of bilinear interpolation input must be 2x2')
-        top = dx * arr[0, 0] + (1 - dx) * arr[0, 1]
-        bottom = dx * arr[1, 0] + (1 - dx) * arr[1, 1]
+        top = (1 - dx) * arr[0, 0] + dx * arr[0, 1]
+        bottom = (1 - dx) * arr[1, 0] + dx * arr[1, 1]
 
-        return dy * top + (1 - dy) * bottom
+        return (1 - dy) * top + dy * bottom
 
     def bivariate_spline(self, dx, dy, arr):
         nrow, ncol = arr.shape
+        if (nrow, ncol) == (3, 3):
+            # The windows of interpolated_value: evaluated with the Lagrange weights of
+            # bivariate_spline_array rather than by fitting a spline for every point
+            value = self.bivariate_spline_array(
+                np.array([dx], dtype=np.float64), np.array([dy], dtype=np.float64),
+                np.asarray(arr)[np.newaxis], np.ma.getmaskarray(arr)[np.newaxis]
+            )[0]
+            return None if np.isnan(value) else value
+
+        # SciPy is only needed for other window shapes, so it is imported on demand
+        from scipy.interpolate import RectBivariateSpline
 
-        ky = min(nrow - 1, 3)
+        # Rows are the first axis of the spline and columns the second
         kx = min(nrow - 1, 3)
+        ky = min(ncol - 1, 3)
 
         spline = RectBivariateSpline(
-            np.array(range(ncol)), np.array(range(nrow)), arr, kx=kx, ky=ky
+            np.array(range(nrow)), np.array(range(ncol)), arr, kx=kx, ky=ky
         )
-        return spline(dx, dy)[0][0]
+        return spline(dy, dx)[0][0]
+
+    def interpolate_points(self, lons, lats, dem, method=None, factor=1):
+        """Interpolate the DEM at N points at once.
+
+        Equivalent to calling ``interpolated_value`` for every point, but the
+        DEM is read in resident blocks and each interpolator is evaluated over
+        all points of a block with array operations. Returns an array of N
+        elevations with NaN where no value could be interpolated.
+        """
+        method = method or self.method
+        if method not in METHODS:
+            raise ValueError('Invalid interpolation method {} selected'.format(method))
+        xs, ys = self.raster_coordinates(lons, lats, dem)
+        if self.elevation_cache is None:
+            return self._interpolate_points(xs, ys, dem, method, factor)
+
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        bounds = dem.bounds
+        # Points off the DEM are cheap to reject and are not worth caching
+        on_dem = (xs >= bounds.left) & (xs <= bounds.right) & (ys >= bounds.bottom) & (ys <= bounds.top)
+        values = np.full(lons.shape, np.nan)
+        fingerprint = self.fingerprint(dem)
+        # Decimated elevations are cached apart from full-resolution ones
+        cache_method = method if factor == 1 else f'{method}@{factor}'
+        found, cached = self.elevation_cache.get_many(fingerprint, cache_method, lons[on_dem], lats[on_dem])
+        values[on_dem] = cached
+        self.stats['elevation_cache_hits'] += int(found.sum())
+        self.stats['elevation_cache_misses'] += int((~found).sum())
+
+        missing = np.flatnonzero(on_dem)[~found]
+        if len(missing):
+            computed = self._interpolate_points(xs[missing], ys[missing], dem, method, factor)
+            values[missing] = computed
+            self.elevation_cache.put_many(fingerprint, cache_method, lons[missing], lats[missing], computed)
+        return values
+
+    def raster_transformer(self, dem):
+        """Transformer from lon/lat to the CRS of ``dem``, or None if it is indexed with lon/lat."""
+        if dem.name not in self._raster_transformers:
+            self._raster_transformers[dem.name] = raster_transformer(dem.crs)
+        return self._raster_transformers[dem.name]
+
+    def raster_coordinates(self, lons, lats, dem):
+        """Arrays of points in the CRS of ``dem``, transformed in one call if it is projected."""
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        transformer = self.raster_transformer(dem)
+        if transformer is None or not lons.size:
+            return lons, lats
+        xs, ys = transformer.transform(lons, lats)
+        return np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+
+    def fingerprint(self, dem):
+        """Fingerprint of ``dem`` used in elevation cache keys, computed once per DEM."""
+        if dem.name not in self._fingerprints:
+            from .elevation_cache import dem_fingerprint
+
+            self._fingerprints[dem.name] = dem_fingerprint(dem)
+        return self._fingerprints[dem.name]
+
+    def _interpolate_points(self, xs, ys, dem, method, factor=1):
+        # xs and ys are in the DEM's crs, see raster_coordinates
+        values = np.full(xs.shape, np.nan)
+        if not xs.size:
+            return values
+
+        # Indices into the raster decimated by factor
+        transform = dem.transform if factor == 1 else dem.transform * dem.transform.scale(factor)
+        width, height = dem.width // factor, dem.height // factor
+        # Same operation order as Affine.__mul__, so indices match the scalar path exactly
+        inv = ~transform
+        _x = xs * inv.a + ys * inv.b + inv.c
+        _y = xs * inv.d + ys * inv.e + inv.f
+        finite = np.isfinite(_x) & np.isfinite(_y)
+        _x = np.where(finite, _x, 0)
+        _y = np.where(finite, _y, 0)
+
+        if method == 'bilinear':
+            dim = 2
+            offset_x = np.floor(_x).astype(np.int64)
+            offset_y = np.floor(_y).astype(np.int64)
+        else:
+            dim = 3
+            offset_x = np.floor(_x).astype(np.int64) - 1
+            offset_y = np.floor(_y).astype(np.int64) - 1
+        dx = _x - offset_x
+        dy = _y - offset_y
+
+        # Windows that are cut off by the raster edge cannot be interpolated
+        inside = finite & (offset_x >= 0) & (offset_y >= 0) & \
+            (offset_x + dim <= width) & (offset_y + dim <= height)
+        if self.coverage_index:
+            empty = inside & self.coverage(dem).all_nodata(offset_y * factor, offset_x * factor, dim * factor)
+            self.stats['nodata_skips'] += int(empty.sum())
+            inside &= ~empty
+
+        points = np.nonzero(inside)[0]
+        if not points.size:
+            return values
+
+        block_rows = offset_y[points] // BLOCK_SIZE
+        block_cols = offset_x[points] // BLOCK_SIZE
+        keys = block_rows * (width // BLOCK_SIZE + 1) + block_cols
+        order = np.argsort(keys, kind='stable')
+        points, block_rows, block_cols, keys = points[order], block_rows[order], block_cols[order], keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        ends = np.r_[starts[1:], len(keys)]
+
+        interpolator = {'idw': self.idw_array, 'bilinear': self.bilinear_array, 'spline': self.bivariate_spline_array}
+        window = np.arange(dim)
+        for start, end in zip(starts, ends):
+            block_row, block_col = int(block_rows[start]), int(block_cols[start])
+            data, mask = self._read_block(dem, block_row, block_col, factor)
+            group = points[start:end]
+            local_y = offset_y[group] - block_row * BLOCK_SIZE
+            local_x = offset_x[group] - block_col * BLOCK_SIZE
+            rows = local_y[:, None, None] + window[None, :, None]
+            cols = local_x[:, None, None] + window[None, None, :]
+            values[group] = interpolator[method](dx[group], dy[group], data[rows, cols], mask[rows, cols])
+
+        return values
+
+    def _read_block(self, dem, block_row, block_col, factor=1):
+        # A block of the raster decimated by factor
+        key = (dem.name, block_row, block_col, factor)
+        if key in self._block_cache:
+            self._block_cache.move_to_end(key)
+            return self._block_cache[key]
+
+        row_off = block_row * BLOCK_SIZE
+        col_off = block_col * BLOCK_SIZE
+        window = Window(
+            col_off,
+            row_off,
+            min(BLOCK_SIZE + BLOCK_PADDING, dem.width // factor - col_off),
+            min(BLOCK_SIZE + BLOCK_PADDING, dem.height // factor - row_off)
+        )
+        if factor == 1:
+            arr = dem.read(1, window=window, masked=True)
+        else:
+            # Served from the overview decimated by factor when the DEM has one
+            arr = dem.read(
+                1, window=Window(col_off * factor, row_off * factor, window.width * factor, window.height * factor),
+                out_shape=(window.height, window.width), resampling=Resampling.average, masked=True
+            )
+        block = (np.ma.getdata(arr), np.ma.getmaskarray(arr))
+
+        self._block_cache[key] = block
+        self._block_cache_size += block[0].nbytes + block[1].nbytes
+        while self._block_cache_size > self.block_cache_bytes and len(self._block_cache) > 1:
+            _, (data, mask) = self._block_cache.popitem(last=False)
+            self._block_cache_size -= data.nbytes + mask.nbytes
+        return block
+
+    def coverage(self, dem):
+        """Return the nodata coverage index of ``dem``, building it on first use."""
+        if dem.name not in self._coverage:
+            if self.debug:
+                Logger.debug(f'Building nodata coverage index for {dem.name}')
+            self._coverage[dem.name] = CoverageIndex.build(dem, block_size=BLOCK_SIZE)
+        return self._coverage[dem.name]
+
+    def clear_block_cache(self, dem_name=None):
+        """Drop the resident blocks of the DEM named ``dem_name``, or of every DEM."""
+        if dem_name is None:
+            self._block_cache.clear()
+            self._block_cache_size = 0
+            return
+        for key in [key for key in self._block_cache if key[0] == dem_name]:
+            data, mask = self._block_cache.pop(key)
+            self._block_cache_size -= data.nbytes + mask.nbytes
+
+    def idw_array(self, dx, dy, windows, masks):
+        # Vectorised ``idw`` over N 3x3 windows, including its quirks: distances
+        # are |row offset| * |column offset|, and a point lying exactly on a
+        # pixel row or column gets an infinite weight and no value.
+        n = len(windows)
+        masked_share = masks.reshape(n, -1).sum(axis=1) / 9
+        xs = np.arange(3)[None, :] - dx[:, None]
+        ys = np.arange(3)[None, :] - dy[:, None]
+        distances = np.sqrt((ys ** 2)[:, :, None] * (xs ** 2)[:, None, :])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inverse_distances = np.where(masks, 0, 1 / distances).reshape(n, -1)
+            weights = inverse_distances / inverse_distances.sum(axis=1)[:, None]
+            weighted_values = np.where(masks.reshape(n, -1), 0, windows.reshape(n, -1) * weights)
+            values = weighted_values.sum(axis=1)
+
+        values[masked_share >= 0.75] = np.nan
+        return values
+
+    def bilinear_array(self, dx, dy, windows, masks):
+        # Vectorised ``bilinear`` over N 2x2 windows
+        top = (1 - dx) * windows[:, 0, 0] + dx * windows[:, 0, 1]
+        bottom = (1 - dx) * windows[:, 1, 0] + dx * windows[:, 1, 1]
+        values = (1 - dy) * top + dy * bottom
+        values[masks.reshape(len(windows), -1).any(axis=1)] = np.nan
+        return values
+
+    def bivariate_spline_array(self, dx, dy, windows, masks):
+        # A degree-2 RectBivariateSpline through a 3x3 window is the biquadratic
+        # interpolating polynomial, so it can be evaluated with Lagrange weights:
+        # dy along the rows of the window and dx along its columns.
+        def lagrange(t):
+            return np.stack([(t - 1) * (t - 2) / 2, -t * (t - 2), t * (t - 1) / 2], axis=1)
+
+        values = np.einsum('ni,nij,nj->n', lagrange(dy), windows.astype(np.float64), lagrange(dx))
+        values[masks.reshape(len(windows), -1).any(axis=1)] = np.nan
+        return values
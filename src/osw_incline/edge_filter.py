@@ -0,0 +1,76 @@
+import copy
+
+
+class EdgeFilter:
+    """Decides, from an edge's raw GeoJSON feature, whether it needs an incline.
+
+    Applied while edges are loaded, so that edges which never get an incline
+    are not materialised in the graph and are written back as they were read.
+
+    An edge needs an incline unless:
+
+    * its geometry is not a LineString with at least two points;
+    * ``skip_existing_tags`` is set and it already has an incline;
+    * one of its properties matches ``exclude``, a mapping of property names to
+      a value or a list of values, e.g. ``{'highway': ['steps', 'elevator']}``;
+    * one of its endpoints lies outside ``bbox``, ``(minx, miny, maxx, maxy)``;
+    * ``predicate``, if given, returns False for its properties.
+    """
+
+    def __init__(self, exclude=None, bbox=None, predicate=None, skip_existing_tags=False):
+        self.exclude = {
+            key: set(values) if isinstance(values, (list, tuple, set, frozenset)) else {values}
+            for key, values in (exclude or {}).items()
+        }
+        if bbox is not None:
+            bbox = tuple(float(value) for value in bbox)
+            if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+                raise ValueError('bbox must be (minx, miny, maxx, maxy)')
+        self.bbox = bbox
+        self.predicate = predicate
+        self.skip_existing_tags = skip_existing_tags
+
+    def with_skip_existing_tags(self, skip_existing_tags):
+        """Return this filter, or a copy of it with ``skip_existing_tags`` set."""
+        if not skip_existing_tags or self.skip_existing_tags:
+            return self
+        edge_filter = copy.copy(self)
+        edge_filter.skip_existing_tags = True
+        return edge_filter
+
+    def accepts(self, feature):
+        """True if the edge of ``feature`` needs an incline."""
+        geometry = feature.get('geometry')
+        if not geometry or geometry.get('type') != 'LineString' or len(geometry.get('coordinates') or ()) < 2:
+            return False
+
+        props = feature.get('properties') or {}
+        if self.skip_existing_tags and props.get('incline') is not None:
+            return False
+        for key, values in self.exclude.items():
+            if key in props and _hashable(props[key]) in values:
+                return False
+
+        if self.bbox is not None:
+            minx, miny, maxx, maxy = self.bbox
+            for point in (geometry['coordinates'][0], geometry['coordinates'][-1]):
+                if not (minx <= point[0] <= maxx and miny <= point[1] <= maxy):
+                    return False
+
+        return self.predicate is None or bool(self.predicate(props))
+
+    def passthrough(self, props):
+        """Apply to the properties of a rejected edge what processing would have."""
+        if self.skip_existing_tags and props.get('incline') is not None:
+            if props['incline'] < -1 or props['incline'] > 1:
+                del props['incline']
+        return props
+
+
+def _hashable(value):
+    # Lists and objects never match an exclude value
+    try:
+        hash(value)
+    except TypeError:
+        return None
+    return value
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import numpy as np
+from pathlib import Path
+from .logger import Logger
+
+DEFAULT_MAX_ENTRIES = 10_000_000
+# Coordinates are rounded to this many degrees (about 1 cm) to form cache keys
+DEFAULT_QUANTUM = 1e-7
+# Eviction trims the cache to this share of max_entries, so it does not run on every insert
+LOW_WATERMARK = 0.9
+# Bytes hashed from each end of a local DEM file for its fingerprint
+FINGERPRINT_SAMPLE_BYTES = 1024 * 1024
+
+
+def dem_fingerprint(dem):
+    """Identify the contents of an open DEM.
+
+    Combines the raster's shape, data type, nodata value, transform and CRS
+    with, for local files, the file size and a hash of its first and last MiB.
+    Remote DEMs are identified by their URL instead of their bytes.
+    """
+    digest = hashlib.sha256(json.dumps({
+        'width': dem.width,
+        'height': dem.height,
+        'dtypes': list(dem.dtypes),
+        'nodata': dem.nodata,
+        'transform': list(dem.transform)[:6],
+        'crs': dem.crs.to_wkt() if dem.crs else None,
+    }, sort_keys=True).encode())
+
+    name = str(dem.name)
+    if name.startswith('/vsi') or not os.path.isfile(name):
+        digest.update(name.encode())
+    else:
+        size = os.path.getsize(name)
+        digest.update(str(size).encode())
+        with open(name, 'rb') as f:
+            digest.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+            f.seek(max(0, size - FINGERPRINT_SAMPLE_BYTES))
+            digest.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+    return digest.hexdigest()
+
+
+class ElevationCache:
+    """On-disk cache of interpolated elevations shared across runs.
+
+    Entries are keyed by DEM fingerprint, interpolation method and quantized
+    lon/lat, and stored in a SQLite database which several processes can use
+    at once. Lookups and inserts are done for whole arrays of points. Once the
+    cache holds more than ``max_entries`` elevations, the least recently used
+    ones are evicted.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, quantum=DEFAULT_QUANTUM, debug=False):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.quantum = quantum
+        self.debug = debug
+        # Used from executor threads by calculate_async; calls never overlap
+        self.connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS elevations ('
+                'dem TEXT NOT NULL, method TEXT NOT NULL, x INTEGER NOT NULL, y INTEGER NOT NULL, '
+                'elevation REAL, used INTEGER NOT NULL, PRIMARY KEY (dem, method, x, y)) WITHOUT ROWID'
+            )
+            self.connection.execute('CREATE INDEX IF NOT EXISTS elevations_used ON elevations (used)')
+        self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS lookup (i INTEGER PRIMARY KEY, x INTEGER, y INTEGER)')
+        self._count = len(self)
+
+    @classmethod
+    def open(cls, cache, debug=False):
+        """Return ``cache`` if it is an ElevationCache, else open one at the path ``cache``."""
+        if cache is None or isinstance(cache, ElevationCache):
+            return cache
+        return cls(cache, debug=debug)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM elevations').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def quantize(self, lons, lats):
+        return (
+            np.round(np.asarray(lons, dtype=np.float64) / self.quantum).astype(np.int64),
+            np.round(np.asarray(lats, dtype=np.float64) / self.quantum).astype(np.int64)
+        )
+
+    def get_many(self, fingerprint, method, lons, lats):
+        """Look up the elevations of N points.
+
+        Returns ``(found, values)``: a boolean array flagging the cached points,
+        and their elevations (NaN for points cached as having no value).
+        """
+        xs, ys = self.quantize(lons, lats)
+        found = np.zeros(len(xs), dtype=bool)
+        values = np.full(len(xs), np.nan)
+        if not len(xs):
+            return found, values
+
+        with self.connection:
+            self.connection.execute('DELETE FROM lookup')
+            self.connection.executemany(
+                'INSERT INTO lookup VALUES (?, ?, ?)', zip(range(len(xs)), xs.tolist(), ys.tolist())
+            )
+            rows = self.connection.execute(
+                'SELECT lookup.i, elevations.elevation FROM lookup JOIN elevations '
+                'ON elevations.dem = ? AND elevations.method = ? AND elevations.x = lookup.x AND elevations.y = lookup.y',
+                (fingerprint, method)
+            ).fetchall()
+            if rows:
+                self.connection.execute(
+                    'UPDATE elevations SET used = ? WHERE dem = ? AND method = ? AND (x, y) IN (SELECT x, y FROM lookup)',
+                    (int(time.time()), fingerprint, method)
+                )
+        for i, elevation in rows:
+            found[i] = True
+            if elevation is not None:
+                values[i] = elevation
+        return found, values
+
+    def put_many(self, fingerprint, method, lons, lats, values):
+        """Store the elevations of N points; NaN is stored as "no value"."""
+        xs, ys = self.quantize(lons, lats)
+        if not len(xs):
+            return
+        used = int(time.time())
+        elevations = [None if np.isnan(value) else value for value in np.asarray(values, dtype=np.float64).tolist()]
+        with self.connection:
+            cursor = self.connection.executemany(
+                'INSERT OR IGNORE INTO elevations VALUES (?, ?, ?, ?, ?, ?)',
+                ((fingerprint, method, x, y, elevation, used)
+                 for x, y, elevation in zip(xs.tolist(), ys.tolist(), elevations))
+            )
+            self._count += max(cursor.rowcount, 0)
+        if self._count > self.max_entries:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries once the cache is over ``max_entries``."""
+        with self.connection:
+            self._count = len(self)
+            if self._count <= self.max_entries:
+                return 0
+            excess = self._count - int(self.max_entries * LOW_WATERMARK)
+            self.connection.execute(
+                'DELETE FROM elevations WHERE (dem, method, x, y) IN '
+                '(SELECT dem, method, x, y FROM elevations ORDER BY used LIMIT ?)',
+                (excess,)
+            )
+            self._count -= excess
+        if self.debug:
+            Logger.debug(f'Evicted {excess} elevations from {self.path}')
+        return excess
@@ -0,0 +1,156 @@
+import time
+import rasterio
+from typing import List
+from pathlib import Path
+from collections import OrderedDict
+from .logger import Logger
+from .osm_graph import OSMGraph
+from .dem_processor import DEMProcessor, dem_path, dem_env
+
+
+class InclineEngine:
+    """Long-lived incline calculator for many graphs sharing the same DEM tiles.
+
+    DEM datasets are opened once, on first use, and stay open together with the
+    DEMProcessor (its coordinate transformer and resident DEM blocks) until
+    ``close`` is called, so repeated ``compute`` calls only pay for the
+    interpolation itself. With ``max_open``, the least recently used datasets
+    are closed as others are opened, so the limit also holds within a graph
+    spanning more tiles.
+    """
+
+    def __init__(self, dem_files: List[str], debug=False, method='idw', coverage_index=False, elevation_cache=None,
+                 layered=False, overview_factor=1, coarse_length=None, max_open=None):
+        self.dem_files = list(dem_files)
+        self.debug = debug
+        self.max_open = max_open
+        self._owned_cache = False
+        if elevation_cache is not None:
+            from .elevation_cache import ElevationCache
+
+            # A cache opened from a path belongs to the engine and is closed with it
+            self._owned_cache = not isinstance(elevation_cache, ElevationCache)
+            elevation_cache = ElevationCache.open(elevation_cache, debug=debug)
+        self.dem_processor = DEMProcessor(
+            osm_graph=None,
+            dem_files=self.dem_files,
+            debug=debug,
+            method=method,
+            coverage_index=coverage_index,
+            elevation_cache=elevation_cache,
+            layered=layered,
+            overview_factor=overview_factor,
+            coarse_length=coarse_length
+        )
+        # Open datasets, least recently used first
+        self._datasets = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def dataset(self, dem_file):
+        """Return the open dataset for ``dem_file``, opening it on first use."""
+        key = str(dem_file)
+        if key not in self._datasets:
+            if self.debug:
+                Logger.debug(f'Opening DEM tile: {key}')
+            try:
+                self.dem_processor.prepare_overview(dem_file)
+                with dem_env(dem_file):
+                    self._datasets[key] = rasterio.open(dem_path(dem_file))
+            except rasterio.errors.RasterioIOError:
+                if self.debug:
+                    Logger.error(f'Failed to open DEM file: {dem_file}')
+                raise Exception(f'Failed to open DEM file: {dem_file}')
+            self.dem_processor.stats['dem_opens'] += 1
+            if self.max_open is not None:
+                # The new dataset is the most recently used, so it is never the one closed
+                self.trim(max(1, self.max_open))
+        self._datasets.move_to_end(key)
+        return self._datasets[key]
+
+    @property
+    def stats(self):
+        """Counters accumulated over every graph computed by this engine."""
+        return self.dem_processor.stats
+
+    @property
+    def open_datasets(self):
+        return list(self._datasets)
+
+    def release(self, dem_file):
+        """Close a single DEM dataset; it is reopened if a later graph needs it."""
+        dem = self._datasets.pop(str(dem_file), None)
+        if dem is not None:
+            self.dem_processor.clear_block_cache(dem.name)
+            dem.close()
+
+    def trim(self, max_open):
+        """Close the least recently used datasets until at most ``max_open`` are open."""
+        while len(self._datasets) > max_open:
+            self.release(next(iter(self._datasets)))
+
+    def close(self):
+        for dem_file in list(self._datasets):
+            self.release(dem_file)
+        if self._owned_cache:
+            self.dem_processor.elevation_cache.close()
+            self._owned_cache = False
+
+    def compute(self, graph, skip_existing_tags=False, batch_processing=False, dem_files=None):
+        """Add inclines to the edges of ``graph`` in place and return it.
+
+        ``graph`` may be an OSMGraph or a networkx graph whose edges carry a
+        shapely ``geometry``. ``dem_files`` restricts the computation to a subset
+        of DEM files, in order; by default all of the engine's files are used.
+        With a layered engine, the files are layers in priority order.
+        """
+        G = graph.G if isinstance(graph, OSMGraph) else graph
+        start_time = time.time()
+        layers = None
+        if self.dem_processor.layered:
+            layers = self.dem_processor.layered_edges(G.edges(data=True), skip_existing_tags=skip_existing_tags)
+        for dem_file in (self.dem_files if dem_files is None else dem_files):
+            if layers is not None and layers.done:
+                break
+            dem = self.dataset(dem_file)
+            try:
+                with dem_env(dem_file):
+                    if layers is not None:
+                        self.dem_processor.process_layer(layers, dem, dem_file)
+                        continue
+                    self.dem_processor.process_graph(
+                        G=G,
+                        dem=dem,
+                        skip_existing_tags=skip_existing_tags,
+                        batch_processing=batch_processing
+                    )
+            except Exception as e:
+                if self.debug:
+                    Logger.error(f'Error processing DEM file: {dem_file}, error: {e}')
+                raise Exception(f'Error processing DEM file: {dem_file}, error: {e}')
+        if self.debug:
+            Logger.info(f'Computed inclines for {G.number_of_edges()} edges in {time.time() - start_time} seconds')
+        return graph
+
+    def compute_files(self, nodes_file, edges_file, skip_existing_tags=False, batch_processing=False,
+                      edge_filter=None):
+        """Load a nodes/edges pair, compute its inclines and write it back in place.
+
+        Edges rejected by ``edge_filter`` are not loaded into the graph and are
+        written back unchanged.
+        """
+        if edge_filter is not None:
+            edge_filter = edge_filter.with_skip_existing_tags(skip_existing_tags)
+        osm_graph = OSMGraph.from_geojson(
+            nodes_path=Path(nodes_file), edges_path=Path(edges_file), edge_filter=edge_filter
+        )
+        if osm_graph.passthrough_edges:
+            self.stats['passthrough_edges'] += len(osm_graph.passthrough_edges)
+        self.compute(osm_graph, skip_existing_tags=skip_existing_tags, batch_processing=batch_processing)
+        osm_graph.to_geojson(Path(nodes_file), Path(edges_file))
+        osm_graph.clean()
+        return True
@@ -0,0 +1,137 @@
+import json
+import numpy as np
+import shapely
+
+LINESTRING = 1
+INCLINE_PROPERTY = 'incline'
+
+
+def edge_kind(edges):
+    """How ``edges`` hold their features: ``'collection'`` (a GeoJSON
+    FeatureCollection dict), ``'features'`` (a list of Feature dicts),
+    ``'frame'`` (a GeoDataFrame) or ``'arrow'`` (an Arrow table with a WKB
+    geometry column)."""
+    if isinstance(edges, dict):
+        if edges.get('type') != 'FeatureCollection':
+            raise ValueError('Edges given as a dict must be a GeoJSON FeatureCollection')
+        return 'collection'
+    if isinstance(edges, (list, tuple)):
+        return 'features'
+    # geopandas and pyarrow are optional, so their objects are recognised by their attributes
+    if hasattr(edges, 'geometry') and hasattr(edges, 'columns'):
+        return 'frame'
+    if hasattr(edges, 'schema') and hasattr(edges, 'column_names'):
+        return 'arrow'
+    raise ValueError(f'Unsupported edges of type {type(edges).__name__}, expected a FeatureCollection dict, '
+                     f'a list of features, a GeoDataFrame or an Arrow table')
+
+
+def edge_coords(edges):
+    """Endpoints of the edges as an (N, 4) array of ``(first_lon, first_lat,
+    last_lon, last_lat)`` rows, NaN for edges without a LineString geometry."""
+    kind = edge_kind(edges)
+    if kind in ('collection', 'features'):
+        return _feature_coords(edges['features'] if kind == 'collection' else edges)
+    if kind == 'frame':
+        geometries = edges.geometry
+        if geometries.crs is not None and not geometries.crs.equals('EPSG:4326'):
+            geometries = geometries.to_crs('EPSG:4326')
+        return geometry_coords(np.asarray(geometries.values, dtype=object))
+    return geometry_coords(_arrow_geometries(edges))
+
+
+def existing_inclines(edges, valid_only=True):
+    """Inclines the edges already have, NaN where they have none. With
+    ``valid_only``, inclines outside [-1, 1] are NaN too, as ``calculate``
+    drops them."""
+    kind = edge_kind(edges)
+    if kind in ('collection', 'features'):
+        features = edges['features'] if kind == 'collection' else edges
+        values = [(feature.get('properties') or {}).get(INCLINE_PROPERTY) for feature in features]
+    elif kind == 'frame':
+        values = edges[INCLINE_PROPERTY] if INCLINE_PROPERTY in edges.columns else [None] * len(edges)
+    elif INCLINE_PROPERTY in edges.column_names:
+        values = edges.column(INCLINE_PROPERTY).to_pylist()
+    else:
+        values = [None] * edges.num_rows
+    inclines = np.array([_as_incline(value) for value in values], dtype=np.float64)
+    if valid_only:
+        inclines[(inclines < -1) | (inclines > 1)] = np.nan
+    return inclines
+
+
+def with_inclines(edges, inclines):
+    """A copy of ``edges``, of the same kind, with the ``incline`` of each edge
+    set to ``inclines``, or removed where it is NaN. The input is not modified."""
+    kind = edge_kind(edges)
+    if kind in ('collection', 'features'):
+        features = edges['features'] if kind == 'collection' else edges
+        updated = [_with_incline(feature, incline) for feature, incline in zip(features, inclines.tolist())]
+        return {**edges, 'features': updated} if kind == 'collection' else updated
+    if kind == 'frame':
+        updated = edges.copy()
+        updated[INCLINE_PROPERTY] = inclines
+        return updated
+
+    import pyarrow as pa
+
+    column = pa.array(inclines, type=pa.float64(), from_pandas=True)
+    if INCLINE_PROPERTY in edges.column_names:
+        return edges.set_column(edges.column_names.index(INCLINE_PROPERTY), INCLINE_PROPERTY, column)
+    return edges.append_column(INCLINE_PROPERTY, column)
+
+
+def _with_incline(feature, incline):
+    props = feature.get('properties') or {}
+    if np.isnan(incline):
+        if INCLINE_PROPERTY not in props:
+            return feature
+        return {**feature, 'properties': {key: value for key, value in props.items() if key != INCLINE_PROPERTY}}
+    return {**feature, 'properties': {**props, INCLINE_PROPERTY: incline}}
+
+
+def geometry_coords(geometries):
+    """``edge_coords`` for an array of shapely geometries."""
+    geometries = np.asarray(geometries, dtype=object)
+    coords = np.full((len(geometries), 4), np.nan)
+    if not len(geometries):
+        return coords
+    lines = (shapely.get_type_id(geometries) == LINESTRING) & (shapely.get_num_points(geometries) >= 2)
+    first = shapely.get_point(geometries[lines], 0)
+    last = shapely.get_point(geometries[lines], -1)
+    coords[lines] = np.column_stack([shapely.get_x(first), shapely.get_y(first),
+                                     shapely.get_x(last), shapely.get_y(last)])
+    return coords
+
+
+def _feature_coords(features):
+    coords = np.full((len(features), 4), np.nan)
+    for i, feature in enumerate(features):
+        geometry = feature.get('geometry')
+        if not geometry or geometry.get('type') != 'LineString' or len(geometry.get('coordinates') or ()) < 2:
+            continue
+        first_point, last_point = geometry['coordinates'][0], geometry['coordinates'][-1]
+        coords[i] = (first_point[0], first_point[1], last_point[0], last_point[1])
+    return coords
+
+
+def _arrow_geometries(table):
+    # GeoParquet/GeoArrow tables name their geometry column in the 'geo' schema metadata
+    name = 'geometry'
+    metadata = table.schema.metadata or {}
+    if b'geo' in metadata:
+        name = json.loads(metadata[b'geo']).get('primary_column', name)
+    if name not in table.column_names:
+        raise ValueError(f'Arrow table has no {name} column')
+    values = np.array(table.column(name).to_pylist(), dtype=object)
+    if len(values) and isinstance(next((value for value in values if value is not None), None), str):
+        return shapely.from_wkt(values)
+    return shapely.from_wkb(values)
+
+
+def _as_incline(value):
+    # Missing values of any kind (None, NaN, pandas NA) are NaN
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
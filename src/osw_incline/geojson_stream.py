@@ -0,0 +1,90 @@
+import re
+import json
+
+SCHEMA = 'https://sidewalks.washington.edu/opensidewalks/0.2/schema.json'
+
+# Characters read from disk per refill of the parse buffer
+CHUNK_SIZE = 1024 * 1024
+
+FEATURES_KEY = re.compile(r'"features"\s*:\s*\[')
+SEPARATORS = ' \t\r\n,'
+
+
+def iter_features(path, chunk_size=CHUNK_SIZE):
+    """Yield the features of a GeoJSON FeatureCollection one at a time.
+
+    Only the feature being decoded is held in memory, so arbitrarily large
+    files can be scanned with a bounded footprint.
+    """
+    decoder = json.JSONDecoder()
+    with open(path) as f:
+        buffer = f.read(chunk_size)
+        match = FEATURES_KEY.search(buffer)
+        while match is None:
+            more = f.read(chunk_size)
+            if not more:
+                raise ValueError(f'No features array found in {path}')
+            buffer += more
+            match = FEATURES_KEY.search(buffer)
+        pos = match.end()
+
+        while True:
+            while True:
+                while pos < len(buffer) and buffer[pos] in SEPARATORS:
+                    pos += 1
+                if pos < len(buffer):
+                    break
+                more = f.read(chunk_size)
+                if not more:
+                    raise ValueError(f'Unexpected end of file while reading features from {path}')
+                buffer, pos = more, 0
+
+            if buffer[pos] == ']':
+                return
+
+            try:
+                feature, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The feature is split across the buffer boundary
+                more = f.read(chunk_size)
+                if not more:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+
+            yield feature
+            pos = end
+
+
+class FeatureWriter:
+    """Write a GeoJSON FeatureCollection feature by feature.
+
+    The output is byte-identical to ``json.dump`` of a FeatureCollection dict
+    built with the same features and ``$schema``.
+    """
+
+    def __init__(self, path, schema=SCHEMA):
+        self.path = path
+        self.schema = schema
+        self.count = 0
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'w')
+        self._file.write('{"type": "FeatureCollection", "features": [')
+        return self
+
+    def write(self, feature):
+        self.write_json(json.dumps(feature))
+
+    def write_json(self, text):
+        """Write a feature already encoded with ``json.dumps``."""
+        if self.count:
+            self._file.write(', ')
+        self._file.write(text)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._file.write(f'], "$schema": {json.dumps(self.schema)}}}')
+        self._file.close()
+        self._file = None
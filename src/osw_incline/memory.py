@@ -0,0 +1,181 @@
+import gc
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from .logger import Logger
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Events at which a run offers to collect garbage: after each batch of edges,
+# after each DEM tile, and after each loading/saving stage of a graph
+EVENTS = ('batch', 'tile', 'stage')
+# Events each policy collects at; 'pressure' collects at any of them, but only
+# once the resident size has grown by pressure_bytes since the last collection
+POLICY_EVENTS = {
+    'always': EVENTS,
+    'tile': ('tile',),
+    'pressure': EVENTS,
+    'none': (),
+}
+GC_POLICIES = tuple(POLICY_EVENTS)
+DEFAULT_GC_POLICY = 'tile'
+DEFAULT_PRESSURE_BYTES = 256 * 1024 * 1024
+# Allocation sites listed per stage when tracing
+TRACE_TOP = 10
+
+
+def rss_bytes():
+    """Current resident set size of the process, or None where it cannot be read."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes():
+    """Peak resident set size of the process so far, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+@contextmanager
+def paused_gc():
+    """Disable automatic garbage collection for the duration of the block.
+
+    Loading and saving build millions of acyclic dicts and lists, each of which
+    counts towards the collector's thresholds, so that it would otherwise scan
+    the growing graph over and over again. Explicit ``gc.collect()`` calls still
+    run.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def collect(memory, event):
+    """Collect garbage at ``event`` if ``memory``'s policy asks for it, or the
+    default policy's if ``memory`` is None. Returns whether it collected."""
+    if memory is None:
+        if event in POLICY_EVENTS[DEFAULT_GC_POLICY]:
+            gc.collect()
+            return True
+        return False
+    return memory.collect(event)
+
+
+class MemoryMonitor:
+    """Garbage collection policy of a run, and its memory use per stage.
+
+    Automatic collection is paused while graphs are loaded, processed and
+    saved, so that it does not scan millions of long-lived objects over and
+    over; ``gc_policy`` decides when full collections run instead:
+
+    - ``always``: after every batch, tile and stage, as earlier releases did;
+    - ``tile``: after every DEM tile only;
+    - ``pressure``: only once the resident size has grown by
+      ``pressure_bytes`` since the last collection (after every tile where the
+      resident size cannot be read);
+    - ``none``: never.
+
+    Each ``stage`` block appends a record to ``stages`` with its duration, the
+    resident and peak resident size at its end, and the collections it ran.
+    With ``trace``, tracemalloc runs while the monitor is open and records also
+    hold the traced and peak traced bytes of the stage and its top allocation
+    sites.
+    """
+
+    def __init__(self, gc_policy=DEFAULT_GC_POLICY, pressure_bytes=DEFAULT_PRESSURE_BYTES, trace=False, debug=False):
+        if gc_policy not in POLICY_EVENTS:
+            raise ValueError(f'Invalid gc_policy {gc_policy}, expected one of {GC_POLICIES}')
+        self.gc_policy = gc_policy
+        self.pressure_bytes = pressure_bytes
+        self.trace = trace
+        self.debug = debug
+        self.stages = []
+        self.collections = 0
+        self.collect_seconds = 0.0
+        self._baseline = rss_bytes()
+        self._started_tracing = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def close(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def collect(self, event):
+        """Collect garbage at ``event`` if the policy asks for it. Returns whether it collected."""
+        if event not in POLICY_EVENTS[self.gc_policy]:
+            return False
+        if self.gc_policy == 'pressure':
+            rss = rss_bytes()
+            if rss is None or self._baseline is None:
+                if event != 'tile':
+                    return False
+            elif rss - self._baseline < self.pressure_bytes:
+                return False
+        start_time = time.perf_counter()
+        gc.collect()
+        self.collections += 1
+        self.collect_seconds += time.perf_counter() - start_time
+        self._baseline = rss_bytes()
+        return True
+
+    @contextmanager
+    def stage(self, name):
+        """Record the memory use of the block as stage ``name``."""
+        start_time = time.perf_counter()
+        collections, collect_seconds = self.collections, self.collect_seconds
+        tracing = self.trace and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            record = {
+                'stage': name,
+                'seconds': time.perf_counter() - start_time,
+                'rss_bytes': rss_bytes(),
+                'peak_rss_bytes': peak_rss_bytes(),
+                'collections': self.collections - collections,
+                'collect_seconds': self.collect_seconds - collect_seconds,
+            }
+            if tracing:
+                record['traced_bytes'], record['traced_peak_bytes'] = tracemalloc.get_traced_memory()
+                record['top_allocations'] = top_allocations(TRACE_TOP)
+            self.stages.append(record)
+            if self.debug:
+                Logger.debug(f'Memory after {name}: {record}')
+
+
+def top_allocations(limit=TRACE_TOP):
+    """The ``limit`` source lines holding the most traced memory."""
+    statistics = tracemalloc.take_snapshot().statistics('lineno')[:limit]
+    return [
+        {'location': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}', 'bytes': stat.size,
+         'count': stat.count}
+        for stat in statistics
+    ]
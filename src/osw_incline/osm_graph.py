@@ -1,94 +1,220 @@
-import gc
 import json
+import itertools
 import pyproj
+import shapely
+import numpy as np
 import networkx as nx
+from .geojson_stream import FeatureWriter, iter_features
+from .memory import paused_gc, collect
 from shapely.geometry import shape, mapping
 
-SCHEMA = 'https://sidewalks.washington.edu/opensidewalks/0.2/schema.json'
+POINT = 0
+LINESTRING = 1
+
+
+def geometries_from_geojson(geojsons):
+    """Build shapely geometries from a list of GeoJSON geometry dicts.
+
+    Points and LineStrings are built with shapely's array constructors, a few
+    calls for the whole list; any other geometry goes through ``shape()``.
+    """
+    geometries = [None] * len(geojsons)
+    points, lines = [], []
+    for index, geojson in enumerate(geojsons):
+        kind = geojson.get('type') if isinstance(geojson, dict) else None
+        coordinates = geojson.get('coordinates') if kind else None
+        if kind == 'Point' and coordinates is not None and len(coordinates) in (2, 3):
+            points.append(index)
+        elif kind == 'LineString' and coordinates is not None and len(coordinates) >= 2:
+            lines.append(index)
+        else:
+            geometries[index] = shape(geojson)
+
+    if points:
+        try:
+            coords = np.array([geojsons[index]['coordinates'] for index in points], dtype=np.float64)
+            built = shapely.points(coords) if coords.ndim == 2 else None
+        except (TypeError, ValueError):
+            # Points of mixed dimensions or with bad coordinates
+            built = None
+        if built is None:
+            built = [shape(geojsons[index]) for index in points]
+        for index, geometry in zip(points, built):
+            geometries[index] = geometry
+
+    if lines:
+        lengths = [len(geojsons[index]['coordinates']) for index in lines]
+        try:
+            coords = np.array(
+                list(itertools.chain.from_iterable(geojsons[index]['coordinates'] for index in lines)),
+                dtype=np.float64
+            )
+            built = None
+            if coords.ndim == 2 and coords.shape[1] in (2, 3):
+                built = shapely.linestrings(coords, indices=np.repeat(np.arange(len(lines)), lengths))
+        except (TypeError, ValueError):
+            built = None
+        if built is None:
+            built = [shape(geojsons[index]) for index in lines]
+        for index, geometry in zip(lines, built):
+            geometries[index] = geometry
+
+    return geometries
+
+
+def geometries_to_geojson(geometries):
+    """Convert a list of shapely geometries to GeoJSON geometry dicts.
+
+    Serializes to the same JSON as ``mapping()`` (coordinates are lists rather
+    than tuples), but reads the coordinates of all non-empty Points and
+    LineStrings in one call; other geometries go through ``mapping()``.
+    """
+    geojsons = [None] * len(geometries)
+    type_ids = shapely.get_type_id(geometries)
+    has_z = shapely.has_z(geometries)
+    simple = np.isin(type_ids, (POINT, LINESTRING)) & ~shapely.is_empty(geometries)
+
+    for include_z in (False, True):
+        selected = np.flatnonzero(simple & (has_z == include_z))
+        if not len(selected):
+            continue
+        coords, owners = shapely.get_coordinates(
+            np.take(np.asarray(geometries, dtype=object), selected), include_z=include_z, return_index=True
+        )
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(owners, minlength=len(selected))))).tolist()
+        coords = coords.tolist()
+        for position, index in enumerate(selected.tolist()):
+            if type_ids[index] == POINT:
+                geojsons[index] = {'type': 'Point', 'coordinates': coords[offsets[position]]}
+            else:
+                geojsons[index] = {'type': 'LineString', 'coordinates': coords[offsets[position]:offsets[position + 1]]}
+
+    for index in np.flatnonzero(~simple).tolist():
+        geojsons[index] = mapping(geometries[index])
+    return geojsons
+
 
 class OSMGraph:
-    def __init__(self, G=None):
+    def __init__(self, G=None, memory=None):
         if G is not None:
             self.G = G
 
+        # MemoryMonitor deciding when loading, saving and cleaning collect garbage
+        self.memory = memory
+
+        # Raw GeoJSON features of the edges left out of G by an EdgeFilter
+        self.passthrough_edges = []
+
         # Geodesic distance calculator. Assumes WGS84-like geometries.
         self.geod = pyproj.Geod(ellps='WGS84')
 
     @classmethod
-    def from_geojson(cls, nodes_path, edges_path):
+    @paused_gc()
+    def from_geojson(cls, nodes_path, edges_path, edge_filter=None, memory=None):
+        """Load a graph from nodes and edges GeoJSON files.
+
+        With an ``EdgeFilter``, only the edges it accepts are added to the
+        graph; the others are kept in ``passthrough_edges`` and written back
+        unchanged by ``to_geojson``. ``memory`` is the ``MemoryMonitor`` whose
+        garbage collection policy the graph follows, the default policy if None.
+        """
+        passthrough_edges = []
         with open(nodes_path) as f:
             nodes_fc = json.load(f)
 
-        with open(edges_path) as f:
-            edges_fc = json.load(f)
+        if edge_filter is None:
+            with open(edges_path) as f:
+                edge_features = json.load(f)['features']
+        else:
+            # Edges that need no incline are kept as they were read, outside the graph
+            edge_features = []
+            for edge_feature in iter_features(edges_path):
+                if edge_filter.accepts(edge_feature):
+                    edge_features.append(edge_feature)
+                else:
+                    edge_filter.passthrough(edge_feature.setdefault('properties', {}))
+                    passthrough_edges.append(edge_feature)
 
         G = nx.MultiDiGraph()
-        osm_graph = cls(G=G)
+        osm_graph = cls(G=G, memory=memory)
+        osm_graph.passthrough_edges = passthrough_edges
 
-        for node_feature in nodes_fc['features']:
+        node_features = nodes_fc['features']
+        geometries = geometries_from_geojson([node_feature['geometry'] for node_feature in node_features])
+        for node_feature, geometry in zip(node_features, geometries):
             props = node_feature['properties']
             n = props.pop('_id')
-            props['geometry'] = shape(node_feature['geometry'])
+            props['geometry'] = geometry
             G.add_node(n, **props)
 
-        del nodes_fc
-        gc.collect()
+        del nodes_fc, node_features, geometries
+        collect(memory, 'stage')
 
-        for edge_feature in edges_fc['features']:
+        geometries = geometries_from_geojson([edge_feature['geometry'] for edge_feature in edge_features])
+        for edge_feature, geometry in zip(edge_features, geometries):
             props = edge_feature['properties']
             u = props.pop('_u_id')
             v = props.pop('_v_id')
-            props['geometry'] = shape(edge_feature['geometry'])
+            props['geometry'] = geometry
             G.add_edge(u, v, **props)
 
-        del edges_fc
-        gc.collect()
+        del edge_features, geometries
+        collect(memory, 'stage')
 
         return osm_graph
 
+    @paused_gc()
     def to_geojson(self, *args):
         nodes_path = args[0]
         edges_path = args[1]
-        edge_features = []
-        for u, v, d in self.G.edges(data=True):
-            d_copy = {**d}
-            d_copy['_u_id'] = str(u)
-            d_copy['_v_id'] = str(v)
-            if 'osm_id' in d_copy:
-                d_copy.pop('osm_id')
-            if 'segment' in d_copy:
-                d_copy.pop('segment')
-
-            geometry = mapping(d_copy.pop('geometry'))
-
-            edge_features.append({
-                'type': 'Feature',
-                'geometry': geometry,
-                'properties': d_copy
-            })
-        edges_fc = {
-            'type': 'FeatureCollection',
-            'features': edge_features,
-            '$schema': SCHEMA
-        }
-
-        with open(edges_path, 'w') as f:
-            json.dump(edges_fc, f)
-
-        # Delete edge_features and force garbage collection
-        del edge_features, edges_fc
-        gc.collect()
-
-        node_features = []
-        for n, d in self.G.nodes(data=True):
-            d_copy = {**d}
-            if 'is_point' not in d_copy:
+        edges = self.G.edges(data=True)
+        geometries = geometries_to_geojson([d['geometry'] for _, _, d in edges])
+        with FeatureWriter(edges_path) as writer:
+            for (u, v, d), geometry in zip(edges, geometries):
+                d_copy = {**d}
+                d_copy['_u_id'] = str(u)
+                d_copy['_v_id'] = str(v)
+                if 'osm_id' in d_copy:
+                    d_copy.pop('osm_id')
+                if 'segment' in d_copy:
+                    d_copy.pop('segment')
+                d_copy.pop('geometry')
+
+                writer.write({
+                    'type': 'Feature',
+                    'geometry': geometry,
+                    'properties': d_copy
+                })
+            for feature in self.passthrough_edges:
+                # Same property layout as the edges of the graph
+                props = {**(feature.get('properties') or {})}
+                u = props.pop('_u_id', None)
+                v = props.pop('_v_id', None)
+                props.pop('osm_id', None)
+                props.pop('segment', None)
+                props['_u_id'] = str(u)
+                props['_v_id'] = str(v)
+                writer.write({
+                    'type': 'Feature',
+                    'geometry': feature.get('geometry'),
+                    'properties': props
+                })
+
+        # Delete the converted geometries, collecting garbage if the policy asks for it
+        del geometries
+        collect(self.memory, 'stage')
+
+        nodes = [(n, d) for n, d in self.G.nodes(data=True) if 'is_point' not in d]
+        geometries = geometries_to_geojson([d['geometry'] for _, d in nodes])
+        with FeatureWriter(nodes_path) as writer:
+            for (n, d), geometry in zip(nodes, geometries):
+                d_copy = {**d}
                 d_copy['_id'] = str(n)
 
                 if 'osm_id' in d_copy:
                     d_copy.pop('osm_id')
 
-                geometry = mapping(d_copy.pop('geometry'))
+                d_copy.pop('geometry')
 
                 if 'lon' in d_copy:
                     d_copy.pop('lon')
@@ -96,36 +222,29 @@ class OSMGraph:
                 if 'lat' in d_copy:
                     d_copy.pop('lat')
 
-                node_features.append({
+                writer.write({
                     'type': 'Feature',
                     'geometry': geometry,
                     'properties': d_copy
                 })
-        nodes_fc = {
-            'type': 'FeatureCollection',
-            'features': node_features,
-            '$schema': SCHEMA
-        }
-
-        with open(nodes_path, 'w') as f:
-            json.dump(nodes_fc, f)
 
-        # Delete node_features and force garbage collection
-        del node_features, nodes_fc
-        gc.collect()
+        # Delete the converted geometries, collecting garbage if the policy asks for it
+        del nodes, geometries
+        collect(self.memory, 'stage')
 
         if len(args) == 3:
             points_path = args[2]
-            point_features = []
-            for n, d in self.G.nodes(data=True):
-                d_copy = {**d}
-                if 'is_point' in d_copy:
+            points = [(n, d) for n, d in self.G.nodes(data=True) if 'is_point' in d]
+            geometries = geometries_to_geojson([d['geometry'] for _, d in points])
+            with FeatureWriter(points_path) as writer:
+                for (n, d), geometry in zip(points, geometries):
+                    d_copy = {**d}
                     d_copy['_id'] = str(n)
 
                     if 'osm_id' in d_copy:
                         d_copy.pop('osm_id')
 
-                    geometry = mapping(d_copy.pop('geometry'))
+                    d_copy.pop('geometry')
 
                     d_copy.pop('is_point')
 
@@ -135,24 +254,17 @@ class OSMGraph:
                     if 'lat' in d_copy:
                         d_copy.pop('lat')
 
-                    point_features.append({
+                    writer.write({
                         'type': 'Feature',
                         'geometry': geometry,
                         'properties': d_copy
                     })
-            points_fc = {
-                'type': 'FeatureCollection',
-                'features': point_features,
-                '$schema': SCHEMA
-            }
-
-            with open(points_path, 'w') as f:
-                json.dump(points_fc, f)
 
-            # Delete point_features and force garbage collection
-            del point_features, points_fc
-            gc.collect()
+            # Delete the converted geometries, collecting garbage if the policy asks for it
+            del points, geometries
+            collect(self.memory, 'stage')
 
     def clean(self):
         del self.G
-        gc.collect()
+        self.passthrough_edges = []
+        collect(self.memory, 'stage')
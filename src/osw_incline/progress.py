@@ -0,0 +1,126 @@
+import time
+import threading
+
+# Minimum time between two progress reports
+DEFAULT_PROGRESS_INTERVAL = 1.0  # seconds
+# Edges the edge-by-edge path processes between two progress updates and cancellation checks
+PROGRESS_CHUNK_EDGES = 1000
+
+
+class Cancelled(Exception):
+    """Raised inside a run stopped through its ``CancellationToken``."""
+
+
+class CancellationToken:
+    """Asks a run to stop. ``cancel()`` may be called from any thread; the run
+    stops with ``Cancelled`` at its next check, between chunks of edges."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled('Run was cancelled')
+
+
+class ProgressTracker:
+    """Progress of a run, reported to ``callback`` at most every ``interval`` seconds.
+
+    A run is a pass over ``edges`` edges per DEM tile. Each report is a dict
+    with ``edges_done`` and ``edges_total`` (None while the number of tiles is
+    unknown), the current ``tile``, ``tiles_done`` and ``tiles_total``,
+    ``elapsed_seconds``, ``edges_per_second``, ``eta_seconds`` (None if
+    unknown) and ``finished``, set on the last report. ``advance`` is called
+    between chunks of edges, where ``cancel_token`` is checked too.
+    """
+
+    def __init__(self, callback=None, interval=DEFAULT_PROGRESS_INTERVAL, cancel_token: CancellationToken = None):
+        self.callback = callback
+        self.interval = interval
+        self.cancel_token = cancel_token
+        self.edges = 0
+        self.edges_done = 0
+        self.tile = None
+        self.tiles_done = 0
+        self.tiles_total = None
+        self._start_time = self._last_report = time.monotonic()
+
+    def start(self, edges, tiles=None):
+        """Start tracking a run over ``edges`` edges for each of ``tiles`` DEM tiles."""
+        self.edges = edges
+        self.edges_done = 0
+        self.tile = None
+        self.tiles_done = 0
+        self.tiles_total = tiles
+        self._start_time = self._last_report = time.monotonic()
+        self.check()
+
+    @property
+    def edges_total(self):
+        if self.tiles_total is None:
+            return None
+        return self.edges * self.tiles_total
+
+    def check(self):
+        if self.cancel_token is not None:
+            self.cancel_token.raise_if_cancelled()
+
+    def begin_tile(self, tile):
+        self.tile = tile
+        self.check()
+
+    def end_tile(self):
+        # Edges a tile did not visit (e.g. resolved by an earlier layer) count as done
+        self.tiles_done += 1
+        self.edges_done = max(self.edges_done, self.tiles_done * self.edges)
+        self._maybe_report()
+
+    def advance(self, edges):
+        self.edges_done += edges
+        self.check()
+        self._maybe_report()
+
+    def finish(self):
+        # Tiles left unvisited (e.g. once every edge is resolved by a layer) have nothing left to do
+        self.tile = None
+        if self.tiles_total is None:
+            self.tiles_total = self.tiles_done
+        self.edges_done = max(self.edges_done, self.edges_total)
+        if self.callback is not None:
+            self.callback(self.report(finished=True))
+
+    def report(self, finished=False, now=None):
+        elapsed = (time.monotonic() if now is None else now) - self._start_time
+        rate = self.edges_done / elapsed if elapsed > 0 else 0.0
+        total = self.edges_total
+        eta = None
+        if finished:
+            eta = 0.0
+        elif total is not None and rate > 0:
+            eta = max(total - self.edges_done, 0) / rate
+        return {
+            'edges_done': self.edges_done,
+            'edges_total': total,
+            'tile': self.tile,
+            'tiles_done': self.tiles_done,
+            'tiles_total': self.tiles_total,
+            'elapsed_seconds': elapsed,
+            'edges_per_second': rate,
+            'eta_seconds': eta,
+            'finished': finished,
+        }
+
+    def _maybe_report(self):
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.callback(self.report(now=now))
@@ -0,0 +1,118 @@
+import os
+import rasterio
+import numpy as np
+from array import array
+from .logger import Logger
+from .geojson_stream import iter_features
+from .scheduler import TILE_MEMORY_BYTES, DEFAULT_MEMORY_BUDGET_BYTES
+from .chunked_processor import DEFAULT_MAX_MEMORY_BYTES, EDGE_WORKING_BYTES, RECORD_FIELDS
+from .dem_processor import (DEFAULT_BLOCK_CACHE_BYTES, dem_env, dem_path, geographic_bounds, raster_transformer,
+                            reverse_twins)
+
+# Estimated peak cost of a loaded OSMGraph, measured while loading sidewalk graphs
+GRAPH_EDGE_BYTES = 1500
+GRAPH_NODE_BYTES = 1300
+# Edges interpolated at once by batch processing
+BATCH_EDGES = 10000
+MODES = ('serial', 'batch', 'workers', 'chunked')
+
+
+def plan_run(nodes_file, edges_file, dem_files=None, tile_dir=None, workers=1, max_memory_bytes=None,
+             memory_budget_bytes=DEFAULT_MEMORY_BUDGET_BYTES, debug=False):
+    """Estimate the cost of computing the inclines of a graph, without computing them.
+
+    Streams the nodes and edges files once and only reads the DEMs' metadata.
+    Returns a dict with:
+
+    - ``nodes``, ``edges``, ``edges_without_geometry`` and ``input_bytes``;
+    - ``distinct_nodes``, the nodes the edges refer to, and ``reverse_pairs``,
+      the edges whose incline is derived from their reverse twin;
+    - ``tiles``: per DEM file, the ``edges`` with an endpoint on it and the
+      uncompressed ``read_bytes`` of the DEM blocks those endpoints fall in;
+      ``missing_tiles`` lists tiles of ``tile_dir`` without a file;
+    - ``read_bytes``, the total over the DEM files;
+    - ``memory``: the estimated peak memory in bytes of each execution mode
+      (``serial``, ``batch``, ``workers`` for ``workers`` processes, and
+      ``chunked`` within ``max_memory_bytes``), and ``spill_bytes``, the disk
+      space used by chunked mode.
+    """
+    if dem_files is None and tile_dir is None:
+        raise ValueError('Either dem_files or tile_dir must be provided')
+
+    node_count = sum(1 for _ in iter_features(nodes_file))
+    edge_count = 0
+    without_geometry = 0
+    node_ids = set()
+    # Endpoints as flat (first_lon, first_lat, last_lon, last_lat) rows
+    endpoints = array('d')
+    for feature in iter_features(edges_file):
+        edge_count += 1
+        props = feature.get('properties') or {}
+        node_ids.update(props[key] for key in ('_u_id', '_v_id') if key in props)
+        geometry = feature.get('geometry')
+        if not geometry or geometry.get('type') != 'LineString' or len(geometry.get('coordinates') or ()) < 2:
+            without_geometry += 1
+            continue
+        first_point, last_point = geometry['coordinates'][0], geometry['coordinates'][-1]
+        endpoints.extend((first_point[0], first_point[1], last_point[0], last_point[1]))
+    coords = np.frombuffer(endpoints, dtype=np.float64).reshape(-1, 4)
+
+    missing = []
+    if dem_files is None:
+        from .tile_planner import TilePlanner
+
+        planner = TilePlanner()
+        tiles = planner.tiles_for_points(np.r_[coords[:, 0], coords[:, 2]], np.r_[coords[:, 1], coords[:, 3]])
+        dem_files, missing = planner.resolve(tiles, tile_dir)
+    tiles = [_tile_cost(dem_file, coords) for dem_file in dem_files]
+    read_bytes = sum(tile['read_bytes'] for tile in tiles)
+
+    graph_bytes = node_count * GRAPH_NODE_BYTES + edge_count * GRAPH_EDGE_BYTES
+    batch_bytes = graph_bytes + min(edge_count, BATCH_EDGES) * EDGE_WORKING_BYTES + DEFAULT_BLOCK_CACHE_BYTES
+    max_open_tiles = max(1, memory_budget_bytes // TILE_MEMORY_BYTES)
+    worker_bytes = batch_bytes + min(max(len(tiles), 1), max_open_tiles) * TILE_MEMORY_BYTES
+    plan = {
+        'nodes': node_count,
+        'edges': edge_count,
+        'edges_without_geometry': without_geometry,
+        'input_bytes': os.path.getsize(nodes_file) + os.path.getsize(edges_file),
+        'distinct_nodes': len(node_ids),
+        'reverse_pairs': int((reverse_twins(coords) >= 0).sum()),
+        'tiles': tiles,
+        'missing_tiles': missing,
+        'read_bytes': read_bytes,
+        'memory': {
+            'serial': graph_bytes,
+            'batch': batch_bytes,
+            # Each worker process holds its own graph, blocks and open tiles
+            'workers': workers * worker_bytes,
+            'chunked': max_memory_bytes or DEFAULT_MAX_MEMORY_BYTES,
+        },
+        'workers': workers,
+        'spill_bytes': edge_count * (RECORD_FIELDS + 1) * 8,
+    }
+    if debug:
+        Logger.info(f'Plan for {edges_file}: {plan}')
+    return plan
+
+
+def _tile_cost(dem_file, coords):
+    # Edges with an endpoint on the DEM, and the bytes of the DEM's internal blocks holding endpoints
+    with dem_env(dem_file), rasterio.open(dem_path(dem_file)) as dem:
+        bounds = geographic_bounds(dem)
+        lons = np.r_[coords[:, 0], coords[:, 2]]
+        lats = np.r_[coords[:, 1], coords[:, 3]]
+        inside = (lons >= bounds.left) & (lons <= bounds.right) & (lats >= bounds.bottom) & (lats <= bounds.top)
+        edges = int((inside[:len(coords)] | inside[len(coords):]).sum())
+
+        xs, ys = lons[inside], lats[inside]
+        transformer = raster_transformer(dem.crs)
+        if transformer is not None and len(xs):
+            xs, ys = (np.asarray(values) for values in transformer.transform(xs, ys))
+        inv = ~dem.transform
+        cols = np.clip(np.floor(xs * inv.a + ys * inv.b + inv.c).astype(np.int64), 0, dem.width - 1)
+        rows = np.clip(np.floor(xs * inv.d + ys * inv.e + inv.f).astype(np.int64), 0, dem.height - 1)
+        block_height, block_width = dem.block_shapes[0]
+        blocks = len(np.unique(rows // block_height * (dem.width // block_width + 1) + cols // block_width))
+        block_bytes = block_height * block_width * np.dtype(dem.dtypes[0]).itemsize
+    return {'dem': str(dem_file), 'edges': edges, 'blocks': blocks, 'read_bytes': blocks * block_bytes}
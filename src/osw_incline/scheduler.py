@@ -0,0 +1,301 @@
+import os
+import time
+import itertools
+import rasterio
+from pathlib import Path
+from collections import OrderedDict, Counter
+from concurrent.futures import ProcessPoolExecutor
+from .logger import Logger
+from .geojson_stream import iter_features
+
+DEFAULT_MEMORY_BUDGET_BYTES = 1024 * 1024 * 1024
+# Estimated resident cost of an open DEM tile: GDAL dataset state plus the
+# interpolation blocks a city-sized graph keeps cached from it
+TILE_MEMORY_BYTES = 64 * 1024 * 1024
+
+
+class TileScheduler:
+    """Orders many graph jobs so that graphs sharing DEM tiles run back to back.
+
+    Each job's tile footprint is worked out from its edges file without loading
+    the graph. Jobs are then ordered greedily, always picking the job whose
+    tiles overlap most with the tiles still open, and split into contiguous
+    groups, one per worker. While running, at most ``max_open_tiles`` tiles
+    (derived from ``memory_budget_bytes``) stay open; the least recently used
+    ones are closed first.
+    """
+
+    def __init__(self, dem_files=None, tile_dir=None, memory_budget_bytes=DEFAULT_MEMORY_BUDGET_BYTES, debug=False):
+        if dem_files is None and tile_dir is None:
+            raise ValueError('Either dem_files or tile_dir must be provided')
+        self.dem_files = dem_files
+        self.tile_dir = tile_dir
+        self.memory_budget_bytes = memory_budget_bytes
+        self.debug = debug
+        self._planner = None
+        self._dem_bounds = None
+
+    @property
+    def max_open_tiles(self):
+        return max(1, self.memory_budget_bytes // TILE_MEMORY_BYTES)
+
+    def footprint(self, edges_file):
+        """Return the DEM files, in order, needed by the graph of ``edges_file``."""
+        if self.tile_dir is not None:
+            from .tile_planner import TilePlanner
+
+            if self._planner is None:
+                self._planner = TilePlanner()
+            tiles = self._planner.tiles_for_edges_file(edges_file)
+            dem_files, missing = self._planner.resolve(tiles, self.tile_dir)
+            if missing and self.debug:
+                Logger.warning(f'DEM tiles missing from {self.tile_dir} for {edges_file}: {missing}')
+            return tuple(dem_files)
+
+        bounds = edges_bounds(edges_file)
+        if bounds is None:
+            return ()
+        minx, miny, maxx, maxy = bounds
+        return tuple(
+            dem_file for dem_file, dem_bounds in self._all_dem_bounds()
+            if not (minx > dem_bounds.right or maxx < dem_bounds.left or
+                    miny > dem_bounds.top or maxy < dem_bounds.bottom)
+        )
+
+    def _safe_footprint(self, edges_file):
+        # A job whose edges file cannot be read fails when it runs, not when planning
+        try:
+            return self.footprint(edges_file)
+        except (OSError, ValueError) as e:
+            if self.debug:
+                Logger.warning(f'Could not plan DEM tiles for {edges_file}: {e}')
+            return ()
+
+    def _all_dem_bounds(self):
+        if self._dem_bounds is None:
+            from .dem_processor import geographic_bounds
+
+            self._dem_bounds = []
+            for dem_file in self.dem_files:
+                with rasterio.open(dem_file) as dem:
+                    self._dem_bounds.append((str(dem_file), geographic_bounds(dem)))
+        return self._dem_bounds
+
+    def simulate(self, footprints, order):
+        """Number of tile loads when running the jobs in ``order`` with
+        ``max_open_tiles`` tiles kept open."""
+        resident = OrderedDict()
+        loads = 0
+        for index in order:
+            for dem_file in footprints[index]:
+                if dem_file in resident:
+                    resident.move_to_end(dem_file)
+                else:
+                    resident[dem_file] = True
+                    loads += 1
+            while len(resident) > self.max_open_tiles:
+                resident.popitem(last=False)
+        return loads
+
+    def order(self, footprints):
+        """Greedy tile-affinity order of the jobs with the given footprints."""
+        # Ties are broken by footprint, so that jobs on neighbouring tiles stay close
+        remaining = sorted(range(len(footprints)), key=lambda i: (sorted(footprints[i]), i))
+        resident = OrderedDict()
+        order = []
+        while remaining:
+            best = max(
+                remaining,
+                key=lambda i: (
+                    sum(dem_file in resident for dem_file in footprints[i]),
+                    -sum(dem_file not in resident for dem_file in footprints[i])
+                )
+            )
+            remaining.remove(best)
+            order.append(best)
+            for dem_file in footprints[best]:
+                resident[dem_file] = True
+                resident.move_to_end(dem_file)
+            while len(resident) > self.max_open_tiles:
+                resident.popitem(last=False)
+        return order
+
+    def plan(self, jobs, workers=1):
+        """Work out the footprints, order and worker groups of ``jobs``, a list
+        of ``(nodes_file, edges_file)`` pairs.
+
+        Returns a dict with ``footprints``, ``groups`` (lists of job indices, one
+        per worker), and the ``naive_loads`` and ``estimated_loads`` of tiles for
+        the input order and the planned order.
+        """
+        footprints = [self._safe_footprint(edges_file) for _, edges_file in jobs]
+        order = self.order(footprints)
+        groups = split_groups(
+            order, [_file_size(edges_file) for _, edges_file in jobs], workers, footprints=footprints
+        )
+        return {
+            'footprints': footprints,
+            'groups': groups,
+            'naive_loads': self.simulate(footprints, range(len(jobs))),
+            'estimated_loads': sum(self.simulate(footprints, group) for group in groups),
+        }
+
+    def run(self, jobs, workers=1, skip_existing_tags=False, batch_processing=False, method='idw',
+            coverage_index=False, elevation_cache=None, edge_filter=None, layered=False, overview_factor=1,
+            coarse_length=None):
+        """Compute inclines for every job and write them back in place.
+
+        With ``layered``, the DEM files of a job are layers in the order of
+        ``dem_files`` (or of the tiles), the first covering an edge giving its
+        incline.
+
+        Edges rejected by ``edge_filter`` are written back unchanged; with more
+        than one worker, the filter must be picklable.
+
+        Returns ``(records, report)``: one record per job, in input order, and a
+        report comparing the estimated and actual tile loads.
+        """
+        start_time = time.time()
+        plan = self.plan(jobs, workers=workers)
+        options = {
+            'skip_existing_tags': skip_existing_tags,
+            'batch_processing': batch_processing,
+            'method': method,
+            'coverage_index': coverage_index,
+            # A path, so that every worker opens its own connection
+            'elevation_cache': None if elevation_cache is None else str(elevation_cache),
+            'edge_filter': edge_filter,
+            'layered': layered,
+            'overview_factor': overview_factor,
+            'coarse_length': coarse_length,
+            'max_open_tiles': self.max_open_tiles,
+            'debug': self.debug,
+        }
+        tasks = [
+            (options, [(index, jobs[index], plan['footprints'][index]) for index in group])
+            for group in plan['groups']
+        ]
+        if len(tasks) <= 1:
+            results = [run_group(*task) for task in tasks]
+        else:
+            # Each group runs in one worker, so the tiles it shares stay open there
+            with ProcessPoolExecutor(max_workers=len(tasks)) as executor:
+                results = list(executor.map(run_group, *zip(*tasks)))
+
+        records = [None] * len(jobs)
+        actual_loads = 0
+        for group_records, loads in results:
+            actual_loads += loads
+            for index, record in group_records:
+                records[index] = record
+
+        report = {
+            'jobs': len(jobs),
+            'workers': len(tasks),
+            'tiles': len({dem_file for footprint in plan['footprints'] for dem_file in footprint}),
+            'max_open_tiles': self.max_open_tiles,
+            'naive_loads': plan['naive_loads'],
+            'estimated_loads': plan['estimated_loads'],
+            'actual_loads': actual_loads,
+            'estimated_saved': plan['naive_loads'] - plan['estimated_loads'],
+            'actual_saved': plan['naive_loads'] - actual_loads,
+            'seconds': time.time() - start_time,
+        }
+        if self.debug:
+            Logger.info(f'Tile schedule: {report}')
+        return records, report
+
+
+def edges_bounds(edges_file):
+    """Bounds ``(minx, miny, maxx, maxy)`` of the edge endpoints in a GeoJSON file."""
+    minx = miny = float('inf')
+    maxx = maxy = float('-inf')
+    for feature in iter_features(edges_file):
+        geometry = feature.get('geometry')
+        if not geometry or geometry.get('type') != 'LineString' or not geometry['coordinates']:
+            continue
+        for x, y in (geometry['coordinates'][0][:2], geometry['coordinates'][-1][:2]):
+            minx, miny, maxx, maxy = min(minx, x), min(miny, y), max(maxx, x), max(maxy, y)
+    if minx == float('inf'):
+        return None
+    return minx, miny, maxx, maxy
+
+
+def split_groups(order, weights, workers, footprints=None):
+    """Split ``order`` into at most ``workers`` contiguous groups of similar total
+    weight. With ``footprints``, groups are preferably split where the tiles change,
+    so that jobs sharing tiles end up in the same group."""
+    workers = max(1, min(workers, len(order)))
+    if not order:
+        return []
+    cumulative = list(itertools.accumulate(weights[index] for index in order))
+    # A boundary b starts a new group at position b of the order
+    candidates = list(range(1, len(order)))
+    changes = candidates
+    if footprints is not None:
+        changes = [b for b in candidates if set(footprints[order[b]]) != set(footprints[order[b - 1]])]
+
+    boundaries = []
+    for k in range(1, workers):
+        target = cumulative[-1] * k / workers
+        last = boundaries[-1] if boundaries else 0
+        pool = [b for b in changes if b > last] or [b for b in candidates if b > last]
+        if not pool:
+            break
+        boundaries.append(min(pool, key=lambda b: abs(cumulative[b - 1] - target)))
+
+    edges = [0, *boundaries, len(order)]
+    return [order[start:end] for start, end in zip(edges, edges[1:])]
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def run_group(options, group):
+    """Run the jobs of one group on a single engine. Returns the records of the
+    jobs and the number of DEM tiles opened."""
+    from .engine import InclineEngine
+    from .osm_graph import OSMGraph
+
+    edge_filter = options['edge_filter']
+    if edge_filter is not None:
+        edge_filter = edge_filter.with_skip_existing_tags(options['skip_existing_tags'])
+    records = []
+    with InclineEngine(dem_files=[], debug=options['debug'], method=options['method'],
+                       coverage_index=options['coverage_index'],
+                       elevation_cache=options['elevation_cache'], layered=options['layered'],
+                       overview_factor=options['overview_factor'], coarse_length=options['coarse_length'],
+                       max_open=options['max_open_tiles']) as engine:
+        for index, (nodes_file, edges_file), dem_files in group:
+            record = {'nodes': str(nodes_file), 'edges': str(edges_file), 'dem_files': list(dem_files)}
+            start_time = time.time()
+            before = Counter(engine.stats)
+            try:
+                osm_graph = OSMGraph.from_geojson(
+                    nodes_path=Path(nodes_file), edges_path=Path(edges_file), edge_filter=edge_filter
+                )
+                if osm_graph.passthrough_edges:
+                    engine.stats['passthrough_edges'] += len(osm_graph.passthrough_edges)
+                engine.compute(
+                    osm_graph,
+                    skip_existing_tags=options['skip_existing_tags'],
+                    batch_processing=options['batch_processing'],
+                    dem_files=dem_files
+                )
+                osm_graph.to_geojson(Path(nodes_file), Path(edges_file))
+                record['edge_count'] = osm_graph.G.number_of_edges() + len(osm_graph.passthrough_edges)
+                osm_graph.clean()
+                record['status'] = 'ok'
+            except Exception as e:
+                if options['debug']:
+                    Logger.error(f'Failed to process {edges_file}: {e}')
+                record['status'] = 'error'
+                record['error'] = str(e)
+            record['seconds'] = time.time() - start_time
+            record['stats'] = dict(Counter(engine.stats) - before)
+            records.append((index, record))
+        return records, engine.stats['dem_opens']
@@ -0,0 +1,258 @@
+import os
+import json
+import math
+import heapq
+import tempfile
+from pathlib import Path
+from .logger import Logger
+from .tile_planner import TilePlanner, tile_name
+from .geojson_stream import iter_features, FeatureWriter
+
+MANIFEST_NAME = 'manifest.json'
+# Property carrying a feature's position in the source file through a shard run
+INDEX_PROPERTY = '_shard_index'
+SHARD_KINDS = ('tile', 'cell')
+DEFAULT_SHARD_CELL_SIZE = 0.1  # degrees
+# Encoded features buffered in memory before they are appended to the shards' spill files
+SPILL_FEATURES = 100000
+# Sorted runs merged at once; more runs are merged in passes through intermediate runs
+MERGE_FAN_IN = 64
+
+
+def shard_of(x, y, by='tile', cell_size=DEFAULT_SHARD_CELL_SIZE):
+    """Name of the shard containing the point ``(x, y)``.
+
+    With ``by='tile'``, shards are NED tiles (1 degree cells named like
+    ``n48w123``); with ``by='cell'``, grid cells of ``cell_size`` degrees.
+    """
+    if by == 'tile':
+        north, west = math.floor(y) + 1, math.floor(-x) + 1
+        if 0 <= north <= 90 and 0 <= west <= 180:
+            return tile_name(north, west)
+        cell_size = 1.0
+    return f'cell_{math.floor(x / cell_size)}_{math.floor(y / cell_size)}'
+
+
+def shard_graph(nodes_path, edges_path, output_dir, by='tile', cell_size=DEFAULT_SHARD_CELL_SIZE, debug=False):
+    """Split a nodes/edges pair into self-contained shards under ``output_dir``.
+
+    Each edge goes to the shard of its lower endpoint (so that an edge and its
+    reverse stay together), and each shard gets every node its edges refer
+    to. A shard is a ``{name}/nodes.geojson`` and ``{name}/edges.geojson``
+    pair which can be processed on its own, e.g. with ``OSWIncline``. Features
+    keep their position in the source files in an ``_shard_index`` property,
+    used by ``merge_shards`` and removed by it.
+
+    Writes and returns the manifest: the shards, with the NED tiles each one
+    needs, and the feature counts of the source files, including the number of
+    ``is_point`` nodes, which processing writes out of the nodes file.
+    """
+    if by not in SHARD_KINDS:
+        raise ValueError(f'Invalid shard kind {by}, expected one of {SHARD_KINDS}')
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    planner = TilePlanner()
+
+    shards = {}
+    node_shards = {}
+    with tempfile.TemporaryDirectory(dir=output_dir, prefix='.osw_incline_') as spill_dir:
+        spill = _Spill(spill_dir)
+
+        edge_count = 0
+        for index, feature in enumerate(iter_features(edges_path)):
+            edge_count += 1
+            props = feature.setdefault('properties', {})
+            points = _endpoints(feature.get('geometry'))
+            if points:
+                anchor = min(points)
+                name = shard_of(anchor[0], anchor[1], by=by, cell_size=cell_size)
+            else:
+                # Edges without a usable geometry never get an incline
+                name = 'no_geometry'
+            shard = shards.setdefault(name, {'nodes': 0, 'edges': 0, 'tiles': set()})
+            shard['edges'] += 1
+            for lon, lat in points:
+                tile = shard_of(lon, lat, by='tile')
+                if tile in planner:
+                    shard['tiles'].add(tile)
+            for key in ('_u_id', '_v_id'):
+                if key in props:
+                    node_shards.setdefault(props[key], []).append(name)
+            props[INDEX_PROPERTY] = index
+            spill.add(name, 'edges', feature)
+
+        node_count = 0
+        point_count = 0
+        for index, feature in enumerate(iter_features(nodes_path)):
+            node_count += 1
+            props = feature.setdefault('properties', {})
+            if 'is_point' in props:
+                point_count += 1
+            names = node_shards.get(props.get('_id'))
+            if names is None:
+                # A node without edges goes to the shard it lies in
+                geometry = feature.get('geometry') or {}
+                coordinates = geometry.get('coordinates') if geometry.get('type') == 'Point' else None
+                names = [shard_of(coordinates[0], coordinates[1], by=by, cell_size=cell_size)
+                         if coordinates else 'no_geometry']
+            props[INDEX_PROPERTY] = index
+            for name in dict.fromkeys(names):
+                shards.setdefault(name, {'nodes': 0, 'edges': 0, 'tiles': set()})['nodes'] += 1
+                spill.add(name, 'nodes', feature)
+
+        spill.flush()
+        for name in shards:
+            Path(output_dir, name).mkdir(exist_ok=True)
+            for kind in ('nodes', 'edges'):
+                spill.write_shard(name, kind, Path(output_dir, name, f'{kind}.geojson'))
+
+    manifest = {
+        'source': {'nodes': str(nodes_path), 'edges': str(edges_path)},
+        'by': by,
+        'cell_size': cell_size if by == 'cell' else None,
+        'nodes': node_count,
+        'points': point_count,
+        'edges': edge_count,
+        'shards': [
+            {
+                'name': name,
+                'nodes': f'{name}/nodes.geojson',
+                'edges': f'{name}/edges.geojson',
+                'tiles': sorted(shard['tiles']),
+                'node_count': shard['nodes'],
+                'edge_count': shard['edges'],
+            }
+            for name, shard in sorted(shards.items())
+        ],
+    }
+    with open(Path(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    if debug:
+        Logger.info(f'Split {edge_count} edges and {node_count} nodes into {len(shards)} shards in {output_dir}')
+    return manifest
+
+
+def merge_shards(manifest_path, nodes_path, edges_path, debug=False):
+    """Reassemble the processed shards of a manifest into one nodes/edges pair.
+
+    Features are written back in their order in the source files, without
+    their ``_shard_index`` property; nodes copied into several shards are
+    written once. Raises ``ValueError`` if features are missing, e.g. because
+    a shard was not processed. ``is_point`` nodes are not expected back, as
+    processing drops them from the nodes files.
+    """
+    manifest_path = Path(manifest_path)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    shard_dir = manifest_path.parent
+    with tempfile.TemporaryDirectory(dir=Path(edges_path).resolve().parent, prefix='.osw_incline_') as spill_dir:
+        for kind, output_path in (('edges', edges_path), ('nodes', nodes_path)):
+            runs = [
+                _sort_shard(Path(shard_dir, shard[kind]), Path(spill_dir, f'{kind}.{i}.jsonl'))
+                for i, shard in enumerate(manifest['shards'])
+            ]
+            partial_path = Path(spill_dir, f'{kind}.geojson')
+            written = _merge_runs(runs, partial_path, spill_dir)
+            expected = manifest[kind] - (manifest.get('points', 0) if kind == 'nodes' else 0)
+            if written != expected:
+                raise ValueError(
+                    f'{manifest_path}: merged {written} of {expected} {kind}, some shards are incomplete'
+                )
+            os.replace(partial_path, output_path)
+            if debug:
+                Logger.info(f'Merged {written} {kind} from {len(runs)} shards into {output_path}')
+
+
+class _Spill:
+    # Encoded features of every shard, appended to one file per shard and kind,
+    # so that the number of open files does not grow with the number of shards
+
+    def __init__(self, spill_dir):
+        self.spill_dir = spill_dir
+        self.buffers = {}
+        self.buffered = 0
+
+    def path(self, name, kind):
+        return Path(self.spill_dir, f'{name}.{kind}.jsonl')
+
+    def add(self, name, kind, feature):
+        self.buffers.setdefault((name, kind), []).append(json.dumps(feature))
+        self.buffered += 1
+        if self.buffered >= SPILL_FEATURES:
+            self.flush()
+
+    def flush(self):
+        for (name, kind), lines in self.buffers.items():
+            with open(self.path(name, kind), 'a') as f:
+                f.writelines(f'{line}\n' for line in lines)
+        self.buffers.clear()
+        self.buffered = 0
+
+    def write_shard(self, name, kind, output_path):
+        with FeatureWriter(output_path) as writer:
+            if self.path(name, kind).exists():
+                with open(self.path(name, kind)) as f:
+                    for line in f:
+                        writer.write_json(line.rstrip('\n'))
+
+
+def _endpoints(geometry):
+    if not geometry or geometry.get('type') != 'LineString' or len(geometry.get('coordinates') or ()) < 2:
+        return []
+    return [tuple(geometry['coordinates'][0][:2]), tuple(geometry['coordinates'][-1][:2])]
+
+
+def _sort_shard(path, run_path):
+    # One shard's features, sorted by source index, as "index<TAB>json" lines
+    entries = []
+    for feature in iter_features(path):
+        props = feature.get('properties') or {}
+        if INDEX_PROPERTY not in props:
+            raise ValueError(f'{path}: feature without {INDEX_PROPERTY}, not a shard of this manifest')
+        entries.append((props.pop(INDEX_PROPERTY), json.dumps(feature)))
+    entries.sort(key=lambda entry: entry[0])
+    with open(run_path, 'w') as f:
+        f.writelines(f'{index}\t{line}\n' for index, line in entries)
+    return run_path
+
+
+def _read_run(run_path):
+    with open(run_path) as f:
+        for line in f:
+            index, feature = line.rstrip('\n').split('\t', 1)
+            yield int(index), feature
+
+
+def _merge_runs(runs, output_path, spill_dir):
+    # Runs are merged MERGE_FAN_IN at a time into intermediate runs until few enough are
+    # left, so that the number of files open at once does not grow with the number of shards
+    level = 0
+    while len(runs) > MERGE_FAN_IN:
+        merged = []
+        for i in range(0, len(runs), MERGE_FAN_IN):
+            run_path = Path(spill_dir, f'{Path(output_path).stem}.merge{level}.{len(merged)}.jsonl')
+            with open(run_path, 'w') as f:
+                f.writelines(f'{index}\t{feature}\n' for index, feature in _merge_sorted(runs[i:i + MERGE_FAN_IN]))
+            for run in runs[i:i + MERGE_FAN_IN]:
+                os.remove(run)
+            merged.append(run_path)
+        runs = merged
+        level += 1
+
+    written = 0
+    with FeatureWriter(output_path) as writer:
+        for _, feature in _merge_sorted(runs):
+            writer.write_json(feature)
+            written += 1
+    return written
+
+
+def _merge_sorted(runs):
+    # k-way merge of sorted runs; nodes shared by several shards are yielded once
+    last = None
+    for index, feature in heapq.merge(*(_read_run(run) for run in runs), key=lambda entry: entry[0]):
+        if index == last:
+            continue
+        last = index
+        yield index, feature
@@ -0,0 +1,209 @@
+import os
+import hashlib
+import requests
+from pathlib import Path
+from contextlib import contextmanager
+from .logger import Logger
+from .tile_planner import NED_13_URL_TEMPLATE
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; locking is skipped
+    fcntl = None
+
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+LOCK_FILE = '.lock'
+PARTIAL_DIR = '.partial'
+
+
+def file_checksum(path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TileCache:
+    """Size-bounded, content-addressed local store of DEM tiles.
+
+    Tiles are stored as ``<name>.<sha256>.tif``. Installs are atomic renames
+    from a staging directory on the same file system, and the least recently
+    used tiles are evicted once the cache grows past ``max_bytes``. An
+    advisory file lock makes the cache safe to share between processes on
+    one host.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES, debug=False):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.debug = debug
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def partial_dir(self):
+        return Path(self.root, PARTIAL_DIR)
+
+    @contextmanager
+    def lock(self, shared=False):
+        with open(Path(self.root, LOCK_FILE), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _entries(self, name=None):
+        pattern = f'{name}.*.tif' if name else '*.*.tif'
+        return [path for path in self.root.glob(pattern) if path.is_file()]
+
+    def tiles(self):
+        """Return ``{name: path}`` for every cached tile."""
+        return {path.name.split('.', 1)[0]: path for path in self._entries()}
+
+    def size(self):
+        return sum(path.stat().st_size for path in self._entries())
+
+    def get(self, name):
+        """Return the path of a cached tile, or None, marking it as recently used."""
+        with self.lock(shared=True):
+            entries = self._entries(name)
+            if not entries:
+                return None
+            path = max(entries, key=lambda entry: entry.stat().st_mtime)
+            os.utime(path)
+            return path
+
+    def resolve(self, tiles):
+        """Same contract as ``TilePlanner.resolve``: ``(dem_files, missing)``."""
+        dem_files = []
+        missing = []
+        for tile in tiles:
+            path = self.get(tile)
+            if path is None:
+                missing.append(tile)
+            else:
+                dem_files.append(str(path))
+        return dem_files, missing
+
+    def verify(self, name):
+        """Check a cached tile against the checksum in its file name."""
+        path = self.get(name)
+        if path is None:
+            return False
+        return file_checksum(path) == path.name.split('.')[1]
+
+    def install(self, name, source, checksum=None):
+        """Move ``source`` into the cache as tile ``name`` and return its path.
+
+        ``source`` should live on the same file system as the cache (for
+        instance in ``partial_dir``) so the final rename is atomic. If a
+        ``checksum`` is given and does not match, nothing is installed.
+        """
+        source = Path(source)
+        actual = file_checksum(source)
+        if checksum is not None and actual != checksum:
+            source.unlink(missing_ok=True)
+            raise ValueError(f'Checksum mismatch for tile {name}: expected {checksum}, got {actual}')
+
+        target = Path(self.root, f'{name}.{actual}.tif')
+        with self.lock():
+            os.replace(source, target)
+            os.utime(target)
+            # Older versions of the same tile are superseded
+            for entry in self._entries(name):
+                if entry != target:
+                    entry.unlink(missing_ok=True)
+            self._evict(keep={target})
+        if self.debug:
+            Logger.debug(f'Installed DEM tile {name} at {target}')
+        return target
+
+    def fetch(self, name, url=None, checksum=None, session=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """Return the cached tile ``name``, downloading it first if needed.
+
+        Downloads go to ``partial_dir/<name>.part``. If a previous download of
+        the tile was interrupted, it is resumed with a Range request.
+        """
+        path = self.get(name)
+        if path is not None:
+            return path
+
+        url = url or NED_13_URL_TEMPLATE.format(tile=name)
+        partial = Path(self.partial_dir, f'{name}.part')
+        with self._lock_partial(partial) as f:
+            # Another process may have installed the tile while we waited for the lock
+            path = self.get(name)
+            if path is not None:
+                return path
+            try:
+                self._download(url, f, session=session, chunk_size=chunk_size)
+            except Exception:
+                # Keep what was downloaded so far for the next attempt to resume
+                if f.tell() == 0:
+                    partial.unlink(missing_ok=True)
+                raise
+            return self.install(name, partial, checksum=checksum)
+
+    @contextmanager
+    def _lock_partial(self, partial):
+        while True:
+            f = open(partial, 'ab')
+            if fcntl is None:
+                break
+            fcntl.flock(f, fcntl.LOCK_EX)
+            # The file may have been installed or removed while we waited for the lock
+            try:
+                if os.stat(partial).st_ino == os.fstat(f.fileno()).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            f.close()
+        try:
+            yield f
+        finally:
+            f.close()
+
+    def _download(self, url, f, session=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        offset = f.seek(0, os.SEEK_END)
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        if self.debug:
+            Logger.debug(f'Downloading {url}' + (f' from byte {offset}' if offset else ''))
+        with (session or requests).get(url, headers=headers, stream=True) as r:
+            if offset and r.status_code == 416:
+                # Nothing left to download, unless the remote file is now smaller
+                if r.headers.get('Content-Range', '').endswith(f'/{offset}'):
+                    return
+                f.truncate(0)
+                return self._download(url, f, session=session, chunk_size=chunk_size)
+            r.raise_for_status()
+            if offset and r.status_code != 206:
+                # The server ignored the Range header and sent the whole file
+                f.truncate(0)
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+        f.flush()
+
+    def evict(self):
+        """Remove least recently used tiles until the cache fits ``max_bytes``."""
+        with self.lock():
+            return self._evict()
+
+    def _evict(self, keep=()):
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        evicted = []
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry in keep:
+                continue
+            total -= entry.stat().st_size
+            entry.unlink(missing_ok=True)
+            evicted.append(entry.name.split('.', 1)[0])
+        if evicted and self.debug:
+            Logger.debug(f'Evicted DEM tiles: {evicted}')
+        return evicted
@@ -0,0 +1,150 @@
+import re
+import json
+import numpy as np
+from pathlib import Path
+from .geojson_stream import iter_features
+
+NED_13_INDEX = Path(__file__).resolve().parent / 'ned_13_index.json'
+NED_13_URL_TEMPLATE = 'https://prd-tnm.s3.amazonaws.com/StagedProducts/Elevation/13/TIFF/current/{tile}/USGS_13_{tile}.tif'
+
+# NED 1/3 arc-second tiles are named after their north-west corner, e.g.
+# n48w123 covers latitudes 47..48 and longitudes -123..-122.
+TILE_NAME = re.compile(r'^n(\d{2})w(\d{3})$')
+# File names a tile may have in a local tile directory
+TILE_FILE_NAMES = ('{tile}.tif', 'USGS_13_{tile}.tif')
+# Tiles installed by a TileCache are named <name>.<sha256>.tif
+CACHED_TILE_FILE = re.compile(r'^(n\d{2}w\d{3})\.[0-9a-f]{64}\.tif$')
+
+# Endpoints are turned into tiles this many at a time when streaming features
+POINTS_PER_BATCH = 100000
+
+
+def tile_name(north, west):
+    return f'n{north:02d}w{west:03d}'
+
+
+class TilePlanner:
+    """Works out which NED 1/3 arc-second tiles a graph needs.
+
+    Available tiles are kept in a latitude/longitude bitmap, so the tiles of
+    any number of points are found with a single vectorised lookup.
+    """
+
+    def __init__(self, index_path=NED_13_INDEX):
+        with open(index_path) as f:
+            tiles = json.load(f)['tiles']
+
+        self.available = np.zeros((91, 181), dtype=bool)
+        for tile in tiles:
+            match = TILE_NAME.match(tile)
+            if match:
+                self.available[int(match.group(1)), int(match.group(2))] = True
+
+    def __contains__(self, tile):
+        match = TILE_NAME.match(tile)
+        return bool(match) and bool(self.available[int(match.group(1)), int(match.group(2))])
+
+    @property
+    def tile_count(self):
+        return int(self.available.sum())
+
+    def tiles_for_points(self, lons, lats):
+        """Return the sorted names of the available tiles containing the points."""
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        finite = np.isfinite(lons) & np.isfinite(lats)
+        north = np.floor(lats[finite]).astype(np.int64) + 1
+        west = np.floor(-lons[finite]).astype(np.int64) + 1
+        in_range = (north >= 0) & (north < self.available.shape[0]) & (west >= 0) & (west < self.available.shape[1])
+        cells = np.unique(np.column_stack([north[in_range], west[in_range]]), axis=0)
+        return [tile_name(int(n), int(w)) for n, w in cells if self.available[n, w]]
+
+    def tiles_for_bounds(self, bounds):
+        """Return the available tiles intersecting ``(minx, miny, maxx, maxy)``."""
+        minx, miny, maxx, maxy = bounds
+        tiles = []
+        for north in range(int(np.floor(miny)) + 1, int(np.ceil(maxy)) + 1):
+            for west in range(int(np.floor(-maxx)) + 1, int(np.ceil(-minx)) + 1):
+                if 0 <= north < self.available.shape[0] and 0 <= west < self.available.shape[1] \
+                        and self.available[north, west]:
+                    tiles.append(tile_name(north, west))
+        return sorted(tiles)
+
+    def tiles_for_graph(self, G):
+        """Return the tiles containing the endpoints of the edges of ``G``."""
+        coords = np.array([
+            (*d['geometry'].coords[0], *d['geometry'].coords[-1])
+            for _, _, d in G.edges(data=True) if 'geometry' in d
+        ], dtype=np.float64).reshape(-1, 4)
+        return self.tiles_for_points(
+            np.concatenate([coords[:, 0], coords[:, 2]]),
+            np.concatenate([coords[:, 1], coords[:, 3]])
+        )
+
+    def tiles_for_edges_file(self, edges_path):
+        """Return the tiles containing the edge endpoints of a GeoJSON file,
+        streaming it with bounded memory."""
+        tiles = set()
+        points = []
+        for feature in iter_features(edges_path):
+            geometry = feature.get('geometry')
+            if not geometry or geometry.get('type') != 'LineString' or not geometry['coordinates']:
+                continue
+            points.append(geometry['coordinates'][0][:2])
+            points.append(geometry['coordinates'][-1][:2])
+            if len(points) >= POINTS_PER_BATCH:
+                tiles.update(self._tiles_for_point_list(points))
+                points = []
+        tiles.update(self._tiles_for_point_list(points))
+        return sorted(tiles)
+
+    def _tiles_for_point_list(self, points):
+        if not points:
+            return []
+        arr = np.array(points, dtype=np.float64)
+        return self.tiles_for_points(arr[:, 0], arr[:, 1])
+
+    def urls(self, tiles, url_template=None):
+        """Return the remote URLs of ``tiles``, which can be used as DEM files directly."""
+        return [(url_template or NED_13_URL_TEMPLATE).format(tile=tile) for tile in tiles]
+
+    def resolve(self, tiles, tile_dir):
+        """Map tile names to files in ``tile_dir``, named after the tile or
+        installed there by a ``TileCache``.
+
+        Returns ``(dem_files, missing)``: the paths found, in tile order, and
+        the names of the tiles without a file.
+        """
+        dem_files = []
+        missing = []
+        cached = None
+        for tile in tiles:
+            for file_name in TILE_FILE_NAMES:
+                path = Path(tile_dir, file_name.format(tile=tile))
+                if path.is_file():
+                    dem_files.append(str(path))
+                    break
+            else:
+                if cached is None:
+                    cached = cached_tile_files(tile_dir)
+                if tile in cached:
+                    dem_files.append(str(cached[tile]))
+                else:
+                    missing.append(tile)
+        return dem_files, missing
+
+
+def cached_tile_files(tile_dir):
+    """Return ``{name: path}`` of the tiles a ``TileCache`` installed in
+    ``tile_dir``, the most recent one where a tile has several versions."""
+    files = {}
+    tile_dir = Path(tile_dir)
+    if not tile_dir.is_dir():
+        return files
+    for path in tile_dir.glob('*.tif'):
+        match = CACHED_TILE_FILE.match(path.name)
+        if match and path.is_file():
+            tile = match.group(1)
+            if tile not in files or path.stat().st_mtime > files[tile].stat().st_mtime:
+                files[tile] = path
+    return files
@@ -0,0 +1,95 @@
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from .logger import Logger
+from . import tile_planner
+from .tile_cache import DOWNLOAD_CHUNK_SIZE
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class TilePrefetcher:
+    """Downloads DEM tiles into a TileCache in parallel.
+
+    All downloads share one pooled HTTP session and resume from partial files
+    left by interrupted runs. ``prefetch`` yields tiles as soon as they are
+    available, so incline computation can start on the first tiles while the
+    others are still downloading.
+    """
+
+    def __init__(self, cache, max_workers=DEFAULT_MAX_WORKERS, url_template=None, checksums=None,
+                 chunk_size=DOWNLOAD_CHUNK_SIZE, debug=False):
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1')
+        self.cache = cache
+        self.max_workers = max_workers
+        # Defaults to the USGS NED 1/3 arc-second bucket
+        self.url_template = url_template
+        # Optional {tile: sha256} of the expected tile contents
+        self.checksums = checksums or {}
+        self.chunk_size = chunk_size
+        self.debug = debug
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def url(self, tile):
+        return (self.url_template or tile_planner.NED_13_URL_TEMPLATE).format(tile=tile)
+
+    def fetch(self, tile):
+        return self.cache.fetch(
+            tile,
+            url=self.url(tile),
+            checksum=self.checksums.get(tile),
+            session=self.session,
+            chunk_size=self.chunk_size
+        )
+
+    def prefetch(self, tiles):
+        """Yield ``(tile, path)`` for every tile as it becomes available.
+
+        Tiles already in the cache come first, the others in the order their
+        downloads complete. If a download fails, the pending ones are cancelled
+        and the error is raised.
+        """
+        cached = []
+        pending = []
+        for tile in dict.fromkeys(tiles):
+            path = self.cache.get(tile)
+            if path is None:
+                pending.append(tile)
+            else:
+                cached.append((tile, path))
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(pending))))
+        try:
+            futures = {executor.submit(self.fetch, tile): tile for tile in pending}
+            yield from cached
+            for future in as_completed(futures):
+                tile = futures[future]
+                try:
+                    path = future.result()
+                except Exception as e:
+                    if self.debug:
+                        Logger.error(f'Failed to download DEM tile {tile}: {e}')
+                    raise
+                if self.debug:
+                    Logger.debug(f'DEM tile {tile} is available at {path}')
+                yield tile, path
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def dem_files(self, tiles):
+        """Same as ``prefetch``, yielding only the paths, e.g. for ``DEMProcessor(dem_files=...)``."""
+        for _, path in self.prefetch(tiles):
+            yield str(path)
@@ -21,7 +21,7 @@ def download_dems():
         with requests.get(URL, stream=True) as r:
             r.raise_for_status()
             with open(file_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
+                for chunk in r.iter_content(chunk_size=1024 * 1024):
                     f.write(chunk)
 
 
@@ -0,0 +1,136 @@
+import os
+import re
+import json
+import random
+import tempfile
+import threading
+import unittest
+import rasterio
+import numpy as np
+from pathlib import Path
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from rasterio.transform import from_origin
+
+
+def write_test_dem(path, width=200, height=200, west=-122.5, north=47.7, resolution=1 / 10800, nodata_rows=0):
+    """Write a small synthetic EPSG:4326 DEM whose elevation rises towards the south-east.
+
+    The first ``nodata_rows`` rows are filled with nodata to exercise masked reads.
+    """
+    rows, cols = np.mgrid[0:height, 0:width]
+    elevation = (100 + cols * 0.5 + rows * 0.25).astype('float32')
+    elevation[:nodata_rows, :] = -999999
+    with rasterio.open(
+            path, 'w', driver='GTiff', width=width, height=height, count=1, dtype='float32',
+            crs='EPSG:4326', transform=from_origin(west, north, resolution, resolution), nodata=-999999,
+            tiled=True, blockxsize=64, blockysize=64
+    ) as dst:
+        dst.write(elevation, 1)
+    return path
+
+
+def write_test_graph(nodes_path, edges_path, count=50, west=-122.5, north=47.7, span=0.015, seed=0,
+                     bidirectional=False):
+    """Write a small OSW nodes/edges pair with ``count`` random edges inside the given extent.
+
+    With ``bidirectional``, every edge is followed by its reverse, as in bidirectional exports.
+    """
+    rng = random.Random(seed)
+    nodes = []
+    edges = []
+    for i in range(count):
+        start = (west + rng.random() * span, north - rng.random() * span)
+        end = (west + rng.random() * span, north - rng.random() * span)
+        u, v = str(2 * i), str(2 * i + 1)
+        for n, coords in ((u, start), (v, end)):
+            nodes.append({
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': list(coords)},
+                'properties': {'_id': n}
+            })
+        edges.append({
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': [list(start), list(end)]},
+            'properties': {'_id': str(i), '_u_id': u, '_v_id': v, 'highway': 'footway'}
+        })
+        if bidirectional:
+            edges.append({
+                'type': 'Feature',
+                'geometry': {'type': 'LineString', 'coordinates': [list(end), list(start)]},
+                'properties': {'_id': f'{i}r', '_u_id': v, '_v_id': u, 'highway': 'footway'}
+            })
+
+    with open(nodes_path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': nodes}, f)
+    with open(edges_path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': edges}, f)
+
+
+class GraphTestCase(unittest.TestCase):
+    """Test case run in a temporary ``workdir`` holding a test DEM, ``dem_file``,
+    and a test graph of ``edge_count`` edges, ``nodes_file`` and ``edges_file``.
+
+    Subclasses set ``dem_name`` or ``edge_count`` to None to go without either.
+    """
+    dem_name = 'n48w123.tif'
+    dem_options = {}
+    edge_count = 30
+    bidirectional = False
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.workdir = Path(tmp_dir.name)
+        if self.dem_name is not None:
+            self.dem_file = str(write_test_dem(Path(self.workdir, self.dem_name), **self.dem_options))
+        self.nodes_file = Path(self.workdir, 'nodes.geojson')
+        self.edges_file = Path(self.workdir, 'edges.geojson')
+        if self.edge_count is not None:
+            write_test_graph(self.nodes_file, self.edges_file, count=self.edge_count,
+                             bidirectional=self.bidirectional)
+
+
+def serve_directory(directory):
+    """Serve ``directory`` over HTTP on localhost from a background thread, with
+    support for single ``Range`` requests. Returns ``(server, base_url)``; call
+    ``server.shutdown()`` when done. ``server.requests`` records ``(path, range)``
+    of every GET request."""
+    class RangeRequestHandler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.server.requests.append((self.path, self.headers.get('Range')))
+            match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range') or '')
+            path = self.translate_path(self.path)
+            if match is None or not os.path.isfile(path):
+                return super().do_GET()
+
+            size = os.path.getsize(path)
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.end_headers()
+                return
+            with open(path, 'rb') as f:
+                f.seek(start)
+                body = f.read(end - start + 1)
+            self.send_response(206)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def end_headers(self):
+            self.send_header('Accept-Ranges', 'bytes')
+            super().end_headers()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(RangeRequestHandler, directory=str(directory)))
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
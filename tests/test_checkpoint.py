@@ -0,0 +1,173 @@
+import json
+import shutil
+import unittest
+import tempfile
+import networkx as nx
+from shapely.geometry import LineString
+from pathlib import Path
+from unittest.mock import patch
+from src.osw_incline import OSWIncline
+from src.osw_incline.checkpoint import Checkpoint
+from src.osw_incline.dem_processor import DEMProcessor
+from tests.helpers import GraphTestCase, write_test_graph
+
+EDGE_COUNT = 30
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name, 'run.checkpoint')
+        self.G = nx.MultiDiGraph()
+        for i in range(4):
+            self.G.add_edge(str(i), str(i + 1), incline=None)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_progress_is_kept_across_opens(self):
+        with Checkpoint(self.path) as checkpoint:
+            self.assertFalse(checkpoint.start(self.G, 'idw'))
+            checkpoint.save('a.tif', 2, [(0, 0.1), (1, None)])
+            checkpoint.complete('b.tif')
+
+        with Checkpoint(self.path) as checkpoint:
+            self.assertTrue(checkpoint.start(self.G, 'idw'))
+            self.assertEqual(checkpoint.position('a.tif'), 2)
+            self.assertFalse(checkpoint.is_done('a.tif'))
+            self.assertTrue(checkpoint.is_done('b.tif'))
+            edges = list(self.G.edges(data=True))
+            self.assertEqual(checkpoint.restore(edges), 2)
+
+        self.assertEqual([d.get('incline') for _, _, d in edges], [0.1, None, None, None])
+        self.assertNotIn('incline', edges[1][2])
+
+    def test_other_inputs_start_over(self):
+        with Checkpoint(self.path) as checkpoint:
+            checkpoint.start(self.G, 'idw')
+            checkpoint.save('a.tif', 2, [(0, 0.1)])
+
+        with Checkpoint(self.path) as checkpoint:
+            self.assertFalse(checkpoint.start(self.G, 'bilinear'))
+            self.assertEqual(checkpoint.position('a.tif'), 0)
+            self.assertEqual(checkpoint.restore(list(self.G.edges(data=True))), 0)
+
+    def test_other_geometries_or_dems_start_over(self):
+        with Checkpoint(self.path) as checkpoint:
+            checkpoint.start(self.G, 'idw', ['b.tif', 'a.tif'])
+            checkpoint.save('a.tif', 2, [(0, 0.1)])
+
+        with Checkpoint(self.path) as checkpoint:
+            self.assertTrue(checkpoint.start(self.G, 'idw', ['b.tif', 'a.tif']))
+            self.assertFalse(checkpoint.start(self.G, 'idw', ['b.tif', 'c.tif']))
+            # Later DEM files override earlier ones, so their order matters
+            self.assertFalse(checkpoint.start(self.G, 'idw', ['a.tif', 'b.tif']))
+            self.assertFalse(checkpoint.start(self.G, 'idw', ['a.tif', 'b.tif'], layered=True))
+
+        with Checkpoint(self.path) as checkpoint:
+            checkpoint.start(self.G, 'idw')
+            checkpoint.save('a.tif', 2, [(0, 0.1)])
+            self.G.edges['0', '1', 0]['geometry'] = LineString([(0, 0), (1, 1)])
+            self.assertFalse(checkpoint.start(self.G, 'idw'))
+
+    def test_remove(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.start(self.G, 'idw')
+        checkpoint.remove()
+        self.assertEqual(list(Path(self.tmp_dir.name).iterdir()), [])
+
+
+class Interrupt(Exception):
+    pass
+
+
+class TestResume(GraphTestCase):
+    dem_name = 'first.tif'
+    edge_count = EDGE_COUNT
+
+    def setUp(self):
+        super().setUp()
+        second = Path(self.workdir, 'second.tif')
+        shutil.copy(self.dem_file, second)
+        self.dem_files = [self.dem_file, str(second)]
+        self.checkpoint_file = Path(self.workdir, 'run.checkpoint')
+
+    def _incline(self):
+        return OSWIncline(dem_files=self.dem_files, nodes_file=self.nodes_file, edges_file=self.edges_file)
+
+    def _inclines(self):
+        with open(self.edges_file) as f:
+            features = json.load(f)['features']
+        return {feature['properties']['_id']: feature['properties'].get('incline') for feature in features}
+
+    def _expected(self, **options):
+        write_test_graph(self.nodes_file, self.edges_file, count=EDGE_COUNT)
+        self._incline().calculate(**options)
+        expected = self._inclines()
+        write_test_graph(self.nodes_file, self.edges_file, count=EDGE_COUNT)
+        return expected
+
+    def _run(self, checkpoint, fail_after=None, **options):
+        # Counts the edges processed, raising once fail_after of them were
+        calls = []
+        original = DEMProcessor._process_edge
+
+        def process_edge(processor, *args, **kwargs):
+            if fail_after is not None and len(calls) == fail_after:
+                raise Interrupt()
+            calls.append(args[:2])
+            return original(processor, *args, **kwargs)
+
+        incline = self._incline()
+        with patch.object(DEMProcessor, '_process_edge', process_edge):
+            try:
+                incline.calculate(checkpoint=checkpoint, **options)
+            except Exception:
+                if fail_after is None:
+                    raise
+        return incline.stats, len(calls)
+
+    def test_resume_within_a_tile(self):
+        expected = self._expected()
+        with Checkpoint(self.checkpoint_file, every=5) as checkpoint:
+            self._run(checkpoint, fail_after=13)
+            self.assertEqual(checkpoint.position(self.dem_files[0]), 10)
+
+            stats, processed = self._run(checkpoint)
+
+        self.assertEqual(stats['checkpoint_restored_edges'], 10)
+        self.assertEqual(processed, 2 * EDGE_COUNT - 10)
+        self.assertEqual(self._inclines(), expected)
+
+    def test_resume_skips_done_tiles(self):
+        expected = self._expected()
+        with Checkpoint(self.checkpoint_file, every=5) as checkpoint:
+            self._run(checkpoint, fail_after=EDGE_COUNT + 7)
+            self.assertTrue(checkpoint.is_done(self.dem_files[0]))
+
+            stats, processed = self._run(checkpoint)
+
+        self.assertEqual(stats['checkpoint_skipped_tiles'], 1)
+        self.assertEqual(processed, EDGE_COUNT - 5)
+        self.assertEqual(self._inclines(), expected)
+
+    def test_checkpoint_file_is_removed_after_success(self):
+        expected = self._expected(batch_processing=True)
+        with patch.object(DEMProcessor, 'process_edge_batch', side_effect=Interrupt()):
+            with self.assertRaises(Exception):
+                self._incline().calculate(batch_processing=True, checkpoint=self.checkpoint_file)
+        self.assertTrue(self.checkpoint_file.exists())
+
+        incline = self._incline()
+        self.assertTrue(incline.calculate(batch_processing=True, checkpoint=self.checkpoint_file))
+        self.assertFalse(self.checkpoint_file.exists())
+        self.assertEqual(self._inclines(), expected)
+
+    def test_chunked_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self._incline().calculate(chunked=True, checkpoint=self.checkpoint_file)
+
+
+if __name__ == '__main__':
+    unittest.main()
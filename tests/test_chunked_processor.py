@@ -0,0 +1,103 @@
+import json
+import shutil
+import unittest
+from pathlib import Path
+from src.osw_incline import OSWIncline
+from src.osw_incline.chunked_processor import ChunkedProcessor
+from tests.helpers import GraphTestCase, write_test_graph
+
+
+class TestChunkedProcessor(GraphTestCase):
+    edge_count = 60
+
+    def _copy_inputs(self, name):
+        nodes_file = Path(self.workdir, f'{name}.nodes.geojson')
+        edges_file = Path(self.workdir, f'{name}.edges.geojson')
+        shutil.copy(self.nodes_file, nodes_file)
+        shutil.copy(self.edges_file, edges_file)
+        return nodes_file, edges_file
+
+    def _inclines(self, edges_file):
+        with open(edges_file) as f:
+            return {
+                feature['properties']['_id']: feature['properties'].get('incline')
+                for feature in json.load(f)['features']
+            }
+
+    def test_initialization_rejects_empty_budget(self):
+        with self.assertRaises(ValueError):
+            ChunkedProcessor(dem_files=[self.dem_file], max_memory_bytes=0)
+
+    def test_matches_in_memory_processing(self):
+        nodes_file, edges_file = self._copy_inputs('graph')
+        OSWIncline(dem_files=[self.dem_file], nodes_file=nodes_file, edges_file=edges_file).calculate()
+
+        chunked_nodes, chunked_edges = self._copy_inputs('chunked')
+        # A tiny budget and cell size forces many cells and spill flushes
+        processor = ChunkedProcessor(dem_files=[self.dem_file], max_memory_bytes=2048, cell_size=0.002)
+        processor.process(chunked_nodes, chunked_edges)
+
+        expected = self._inclines(edges_file)
+        result = self._inclines(chunked_edges)
+        self.assertEqual(result, expected)
+        self.assertTrue(any(value is not None for value in result.values()))
+
+    def test_reverse_twins_share_a_cell(self):
+        write_test_graph(self.nodes_file, self.edges_file, count=30, bidirectional=True)
+        nodes_file, edges_file = self._copy_inputs('graph')
+        OSWIncline(dem_files=[self.dem_file], nodes_file=nodes_file, edges_file=edges_file).calculate()
+
+        chunked_nodes, chunked_edges = self._copy_inputs('chunked')
+        processor = ChunkedProcessor(dem_files=[self.dem_file], cell_size=0.002)
+        processor.process(chunked_nodes, chunked_edges)
+
+        self.assertEqual(self._inclines(chunked_edges), self._inclines(edges_file))
+        self.assertEqual(processor.dem_processor.stats['reverse_twins'], 30)
+
+    def test_preserves_feature_order(self):
+        _, edges_file = self._copy_inputs('chunked')
+        ChunkedProcessor(dem_files=[self.dem_file], cell_size=0.002).process(self.nodes_file, edges_file)
+
+        with open(edges_file) as f:
+            ids = [feature['properties']['_id'] for feature in json.load(f)['features']]
+        self.assertEqual(ids, [str(i) for i in range(60)])
+
+    def test_skip_existing_tags(self):
+        with open(self.edges_file) as f:
+            edges = json.load(f)
+        edges['features'][0]['properties']['incline'] = 0.5
+        edges['features'][1]['properties']['incline'] = 3
+        with open(self.edges_file, 'w') as f:
+            json.dump(edges, f)
+
+        ChunkedProcessor(dem_files=[self.dem_file]).process(
+            self.nodes_file, self.edges_file, skip_existing_tags=True
+        )
+
+        inclines = self._inclines(self.edges_file)
+        self.assertEqual(inclines['0'], 0.5)
+        self.assertIsNone(inclines['1'])
+        self.assertIsNotNone(inclines['2'])
+
+    def test_nodes_are_rewritten(self):
+        ChunkedProcessor(dem_files=[self.dem_file]).process(self.nodes_file, self.edges_file)
+
+        with open(self.nodes_file) as f:
+            nodes = json.load(f)
+        self.assertEqual(len(nodes['features']), 120)
+        self.assertIn('$schema', nodes)
+
+    def test_missing_dem_file(self):
+        processor = ChunkedProcessor(dem_files=[str(Path(self.workdir, 'missing.tif'))])
+        with self.assertRaises(Exception) as context:
+            processor.process(self.nodes_file, self.edges_file)
+        self.assertIn('Failed to open DEM file', str(context.exception))
+
+    def test_calculate_chunked(self):
+        incline = OSWIncline(dem_files=[self.dem_file], nodes_file=self.nodes_file, edges_file=self.edges_file)
+        self.assertTrue(incline.calculate(chunked=True, max_memory_bytes=4096))
+        self.assertTrue(any(value is not None for value in self._inclines(self.edges_file).values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import io
+import json
+import unittest
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+from contextlib import redirect_stdout
+from src.osw_incline.cli import main, read_manifest, parse_excludes
+from tests.helpers import write_test_dem, write_test_graph
+
+
+class TestCLI(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmp_dir.name)
+        self.dem_dir = Path(self.workdir, 'dems')
+        self.dem_dir.mkdir()
+        self.dem_file = write_test_dem(Path(self.dem_dir, 'n48w123.tif'))
+        self.pairs = []
+        for i in range(3):
+            nodes_file = Path(self.workdir, f'graph{i}.nodes.geojson')
+            edges_file = Path(self.workdir, f'graph{i}.edges.geojson')
+            write_test_graph(nodes_file, edges_file, count=10, seed=i)
+            self.pairs.append((str(nodes_file), str(edges_file)))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _run(self, *argv):
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            code = main(['run', *argv])
+        return code, stdout.getvalue()
+
+    def _assert_inclines_added(self, pairs):
+        for _, edges_file in pairs:
+            with open(edges_file) as f:
+                edges = json.load(f)['features']
+            self.assertTrue(any('incline' in feature['properties'] for feature in edges))
+
+    def test_read_manifest(self):
+        json_manifest = Path(self.workdir, 'graphs.json')
+        with open(json_manifest, 'w') as f:
+            json.dump([{'nodes': 'graph0.nodes.geojson', 'edges': 'graph0.edges.geojson'}], f)
+        text_manifest = Path(self.workdir, 'graphs.txt')
+        with open(text_manifest, 'w') as f:
+            f.write('# nodes edges\n\ngraph0.nodes.geojson graph0.edges.geojson\n')
+
+        self.assertEqual(read_manifest(json_manifest), self.pairs[:1])
+        self.assertEqual(read_manifest(text_manifest), self.pairs[:1])
+
+        with open(text_manifest, 'w') as f:
+            f.write('graph0.nodes.geojson\n')
+        with self.assertRaises(ValueError):
+            read_manifest(text_manifest)
+
+    def test_run_graphs_with_stats(self):
+        stats_file = Path(self.workdir, 'stats.json')
+        argv = ['--dem', str(self.dem_file), '--stats', str(stats_file), '--method', 'bilinear']
+        for nodes_file, edges_file in self.pairs:
+            argv.extend(['--graph', nodes_file, edges_file])
+
+        code, output = self._run(*argv)
+
+        self.assertEqual(code, 0)
+        self.assertIn('3/3 graphs processed', output)
+        self._assert_inclines_added(self.pairs)
+        with open(stats_file) as f:
+            stats = json.load(f)
+        self.assertEqual(stats['graphs'], 3)
+        self.assertEqual(stats['failed'], 0)
+        self.assertEqual([record['edges'] for record in stats['results']], [edges for _, edges in self.pairs])
+
+    def test_run_manifest_with_dem_dir_and_workers(self):
+        manifest = Path(self.workdir, 'graphs.txt')
+        with open(manifest, 'w') as f:
+            f.writelines(f'{nodes} {edges}\n' for nodes, edges in self.pairs)
+
+        code, output = self._run('--manifest', str(manifest), '--dem-dir', str(self.dem_dir),
+                                 '--workers', '2', '--batch-processing', '--report-format', 'json')
+
+        self.assertEqual(code, 0)
+        report = json.loads(output)
+        self.assertEqual(report['workers'], 2)
+        self.assertEqual({record['status'] for record in report['results']}, {'ok'})
+        self.assertEqual(report['results'][0]['dem_files'], [str(self.dem_file)])
+        self._assert_inclines_added(self.pairs)
+
+    def test_exclude_passes_edges_through(self):
+        code, output = self._run('--dem', str(self.dem_file), '--graph', *self.pairs[0],
+                                 '--exclude', 'highway=steps,footway', '--report-format', 'json')
+
+        self.assertEqual(code, 0)
+        report = json.loads(output)
+        self.assertEqual(report['stats']['passthrough_edges'], 10)
+        self.assertEqual(report['results'][0]['edge_count'], 10)
+        with open(self.pairs[0][1]) as f:
+            edges = json.load(f)['features']
+        self.assertEqual(len(edges), 10)
+        self.assertFalse(any('incline' in feature['properties'] for feature in edges))
+
+    def test_layered_dems(self):
+        lidar_file = write_test_dem(Path(self.workdir, 'lidar.tif'), resolution=1 / 21600)
+        code, output = self._run('--dem', str(lidar_file), str(self.dem_file), '--graph', *self.pairs[0],
+                                 '--layered', '--report-format', 'json')
+
+        self.assertEqual(code, 0)
+        self.assertGreater(json.loads(output)['stats']['layered_edges'], 0)
+        with open(self.pairs[0][1]) as f:
+            sources = {feature['properties'].get('ext:incline_source') for feature in json.load(f)['features']
+                       if 'incline' in feature['properties']}
+        self.assertEqual(sources, {'lidar.tif', 'n48w123.tif'})
+
+    def test_shard_run_and_merge(self):
+        nodes_file, edges_file = self.pairs[0]
+        shard_dir = Path(self.workdir, 'shards')
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            self.assertEqual(main(['shard', nodes_file, edges_file, '--out', str(shard_dir),
+                                   '--by', 'cell', '--cell-size', '0.005']), 0)
+        manifest = Path(shard_dir, 'manifest.json')
+        self.assertIn(str(manifest), stdout.getvalue())
+        shard_pairs = read_manifest(manifest)
+        self.assertGreater(len(shard_pairs), 1)
+
+        code, _ = self._run('--manifest', str(manifest), '--dem', str(self.dem_file))
+        self.assertEqual(code, 0)
+        merged = (str(Path(self.workdir, 'merged.nodes.geojson')), str(Path(self.workdir, 'merged.edges.geojson')))
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(main(['merge', str(manifest), '--nodes', merged[0], '--edges', merged[1]]), 0)
+        self._assert_inclines_added([merged])
+
+    def test_parse_excludes(self):
+        self.assertEqual(parse_excludes(['highway=steps,elevator', 'footway=crossing', 'highway=corridor']),
+                         {'highway': ['steps', 'elevator', 'corridor'], 'footway': ['crossing']})
+        with self.assertRaises(SystemExit):
+            parse_excludes(['highway'])
+
+    def test_failed_graph_is_reported(self):
+        code, output = self._run('--dem', str(self.dem_file), '--graph', *self.pairs[0],
+                                 '--graph', str(Path(self.workdir, 'missing.nodes.geojson')),
+                                 str(Path(self.workdir, 'missing.edges.geojson')))
+
+        self.assertEqual(code, 1)
+        self.assertIn('1/2 graphs processed', output)
+        self.assertIn('error', output)
+        self._assert_inclines_added(self.pairs[:1])
+
+    def test_requires_graphs_and_dems(self):
+        with self.assertRaises(SystemExit):
+            self._run('--dem', str(self.dem_file))
+        with self.assertRaises(SystemExit):
+            with redirect_stdout(io.StringIO()), patch('sys.stderr', io.StringIO()):
+                self._run('--graph', *self.pairs[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
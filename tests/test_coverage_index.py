@@ -0,0 +1,88 @@
+import unittest
+import rasterio
+import numpy as np
+from unittest.mock import patch
+from src.osw_incline.coverage_index import CoverageIndex
+from src.osw_incline.dem_processor import DEMProcessor
+from tests.helpers import GraphTestCase
+
+
+class TestCoverageIndex(GraphTestCase):
+    # 600x600 raster whose first 300 rows are nodata: with 256 pixel blocks,
+    # the first block row is empty and the second one is partially covered.
+    dem_name = 'dem.tif'
+    dem_options = {'width': 600, 'height': 600, 'nodata_rows': 300}
+    edge_count = None
+
+    def setUp(self):
+        super().setUp()
+        self.dem = rasterio.open(self.dem_file)
+        rng = np.random.default_rng(0)
+        bounds = self.dem.bounds
+        self.lons = rng.uniform(bounds.left, bounds.right, 2000)
+        self.lats = rng.uniform(bounds.bottom, bounds.top, 2000)
+
+    def tearDown(self):
+        self.dem.close()
+
+    def test_build(self):
+        index = CoverageIndex.build(self.dem, block_size=256)
+        self.assertEqual(index.has_data.shape, (3, 3))
+        self.assertFalse(index.has_data[0].any())
+        self.assertTrue(index.has_data[1:].all())
+        self.assertAlmostEqual(index.coverage, 6 / 9)
+
+    def test_build_reads_decimated_mask(self):
+        with patch.object(self.dem, 'read_masks', wraps=self.dem.read_masks) as mock_read_masks, \
+                patch.object(self.dem, 'read', wraps=self.dem.read) as mock_read:
+            CoverageIndex.build(self.dem, block_size=256)
+        mock_read.assert_not_called()
+        mock_read_masks.assert_called_once()
+        rows, cols = mock_read_masks.call_args.kwargs['out_shape']
+        self.assertLess(rows * cols, self.dem.height * self.dem.width / 100)
+
+    def test_all_nodata(self):
+        index = CoverageIndex.build(self.dem, block_size=256)
+        self.assertTrue(index.all_nodata(10, 10, 3))
+        # Windows touching a block with data are not rejected
+        self.assertFalse(index.all_nodata(254, 10, 3))
+        self.assertFalse(index.all_nodata(400, 10, 3))
+        np.testing.assert_array_equal(
+            index.all_nodata(np.array([0, 100, 300]), np.array([0, 500, 5]), 3), [True, True, False]
+        )
+
+    def test_interpolate_points_skips_empty_blocks(self):
+        plain = DEMProcessor(osm_graph=None, dem_files=[])
+        expected = plain.interpolate_points(self.lons, self.lats, self.dem)
+
+        processor = DEMProcessor(osm_graph=None, dem_files=[], coverage_index=True)
+        processor.coverage(self.dem)
+        with patch.object(self.dem, 'read', wraps=self.dem.read) as mock_read:
+            result = processor.interpolate_points(self.lons, self.lats, self.dem)
+
+        np.testing.assert_array_equal(result, expected)
+        self.assertGreater(processor.stats['nodata_skips'], 0)
+        # Empty blocks are only read for windows that reach into the covered rows
+        self.assertLess(mock_read.call_count, 9)
+
+    def test_scalar_path_skips_empty_blocks(self):
+        processor = DEMProcessor(osm_graph=None, dem_files=[], coverage_index=True)
+        lon, lat = self.dem.xy(10, 10)
+        with patch.object(self.dem, 'read', wraps=self.dem.read) as mock_read:
+            self.assertIsNone(processor.dem_interpolate(lon=lon, lat=lat, dem=self.dem))
+        mock_read.assert_not_called()
+        self.assertEqual(processor.stats['nodata_skips'], 1)
+
+        lon, lat = self.dem.xy(400, 10)
+        self.assertIsNotNone(processor.dem_interpolate(lon=lon + 1e-6, lat=lat + 1e-6, dem=self.dem))
+
+    def test_coverage_is_built_once_per_dem(self):
+        processor = DEMProcessor(osm_graph=None, dem_files=[], coverage_index=True)
+        with patch.object(CoverageIndex, 'build', wraps=CoverageIndex.build) as mock_build:
+            processor.interpolate_points(self.lons, self.lats, self.dem)
+            processor.interpolate_points(self.lons, self.lats, self.dem)
+        mock_build.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,20 @@
+import os
+import json
 import unittest
+import tempfile
+import rasterio
+import rasterio.shutil
 import numpy as np
+from pathlib import Path
 from rasterio.windows import Window
 from shapely.geometry import LineString
 from src.osw_incline.logger import Logger
 from unittest.mock import patch, MagicMock
+from scipy.interpolate import RectBivariateSpline
 from rasterio.errors import RasterioIOError
 from src.osw_incline.osm_graph import OSMGraph
-from src.osw_incline.dem_processor import DEMProcessor
+from src.osw_incline.dem_processor import DEMProcessor, dem_path, is_remote, reverse_twins
+from tests.helpers import write_test_dem, serve_directory, write_test_graph, GraphTestCase
 
 
 class TestDEMProcessor(unittest.TestCase):
@@ -45,9 +53,12 @@ class TestDEMProcessor(unittest.TestCase):
         mock_rasterio_open.return_value.__enter__.return_value = mock_dem
         self.osm_graph.G.edges.return_value = [('u', 'v', {'geometry': LineString([(0, 0), (1, 1)])})]
 
-        with patch.object(self.processor, 'infer_incline', return_value=0.1):
+        # Batch processing interpolates all edges of a batch at once
+        with patch.object(self.processor, 'infer_inclines', return_value=np.array([0.1])) as mock_infer_inclines:
             self.processor.process('nodes.json', 'edges.json', batch_processing=True)
 
+        mock_infer_inclines.assert_called_once()
+
         self.osm_graph.to_geojson.assert_called_once_with('nodes.json', 'edges.json')
 
     @patch('src.osw_incline.dem_processor.rasterio.open')
@@ -458,6 +469,456 @@ class TestDEMProcessor(unittest.TestCase):
         self.assertIsNone(result, 'interpolated_value should return None when the interpolator returns None')
 
 
+class TestDEMProcessorArrays(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        dem_file = write_test_dem(Path(self.tmp_dir.name, 'dem.tif'), width=600, height=500, nodata_rows=40)
+        self.dem = rasterio.open(dem_file)
+        rng = np.random.default_rng(0)
+        bounds = self.dem.bounds
+        # Include points just outside the raster and inside the nodata rows
+        self.lons = rng.uniform(bounds.left - 0.001, bounds.right + 0.001, 2000)
+        self.lats = rng.uniform(bounds.bottom - 0.001, bounds.top + 0.001, 2000)
+
+    def tearDown(self):
+        self.dem.close()
+        self.tmp_dir.cleanup()
+
+    def _scalar(self, processor):
+        values = []
+        for lon, lat in zip(self.lons, self.lats):
+            value = processor.dem_interpolate(lon=lon, lat=lat, dem=self.dem)
+            values.append(np.nan if value is None or np.ma.is_masked(value) else float(value))
+        return np.array(values)
+
+    def test_invalid_method(self):
+        with self.assertRaises(ValueError):
+            DEMProcessor(osm_graph=None, dem_files=[], method='nearest')
+
+    def test_idw_matches_scalar_path(self):
+        processor = DEMProcessor(osm_graph=None, dem_files=[], method='idw')
+        expected = self._scalar(processor)
+        result = processor.interpolate_points(self.lons, self.lats, self.dem)
+
+        np.testing.assert_array_equal(np.isnan(result), np.isnan(expected))
+        np.testing.assert_allclose(result, expected, rtol=1e-12)
+        self.assertTrue((~np.isnan(result)).sum() > 1000)
+
+    def test_bilinear_matches_scalar_path(self):
+        processor = DEMProcessor(osm_graph=None, dem_files=[], method='bilinear')
+        expected = self._scalar(processor)
+        result = processor.interpolate_points(self.lons, self.lats, self.dem)
+
+        # The scalar bilinear interpolator does not handle masked windows
+        valid = ~np.isnan(result)
+        np.testing.assert_array_equal(result[valid], expected[valid])
+        self.assertTrue(valid.sum() > 1000)
+
+    def test_spline_matches_scalar_path(self):
+        processor = DEMProcessor(osm_graph=None, dem_files=[], method='spline')
+        lons, lats = self.lons[:300], self.lats[:300]
+        self.lons, self.lats = lons, lats
+        with patch('scipy.interpolate.RectBivariateSpline', wraps=RectBivariateSpline) as mock_spline:
+            expected = self._scalar(processor)
+        # Splines are only fitted to the windows cut off by the raster edge
+        self.assertTrue(all(call.args[2].shape != (3, 3) for call in mock_spline.call_args_list))
+        result = processor.interpolate_points(lons, lats, self.dem)
+
+        # Both paths evaluate the same Lagrange weights, and windows with nodata produce no value
+        valid = ~np.isnan(result)
+        np.testing.assert_array_equal(result[valid], expected[valid])
+        self.assertTrue(valid.sum() > 100)
+
+    def test_methods_match_linear_surface(self):
+        # write_test_dem is the plane 100 + 0.5 * col + 0.25 * row, which bilinear and
+        # biquadratic interpolation reproduce exactly
+        pixels = np.array([(50.2, 60.7), (50.9, 60.1), (300.5, 120.25), (12.75, 450.4)])
+        expected = 100 + 0.5 * pixels[:, 0] + 0.25 * pixels[:, 1]
+        xs, ys = self.dem.transform * (pixels[:, 0], pixels[:, 1])
+        for method in ('bilinear', 'spline'):
+            with self.subTest(method=method):
+                processor = DEMProcessor(osm_graph=None, dem_files=[], method=method)
+                scalar = [processor.interpolated_value(x, y, self.dem, method=method) for x, y in zip(xs, ys)]
+                np.testing.assert_allclose(scalar, expected, rtol=1e-6)
+                np.testing.assert_allclose(processor.interpolate_points(xs, ys, self.dem), expected, rtol=1e-6)
+
+    def test_spline_fallback_matches_linear_surface(self):
+        # Windows other than 3x3 are fitted with SciPy, rows along its first axis
+        rows, cols = np.mgrid[0:4, 0:5]
+        arr = 0.5 * cols + 0.25 * rows
+        processor = DEMProcessor(osm_graph=None, dem_files=[])
+        self.assertAlmostEqual(processor.bivariate_spline(1.2, 2.7, arr), 0.5 * 1.2 + 0.25 * 2.7)
+
+    def test_infer_inclines_matches_infer_incline(self):
+        processor = DEMProcessor(osm_graph=None, dem_files=[])
+        coords = np.column_stack([self.lons[:500], self.lats[:500], self.lons[500:1000], self.lats[500:1000]])
+        result = processor.infer_inclines(coords, self.dem)
+
+        for row, value in zip(coords, result):
+            expected = processor.infer_incline(LineString([row[:2], row[2:]]), dem=self.dem)
+            if expected is None:
+                self.assertTrue(np.isnan(value))
+            else:
+                self.assertEqual(value, expected)
+
+    def test_infer_inclines_empty(self):
+        processor = DEMProcessor(osm_graph=None, dem_files=[])
+        self.assertEqual(len(processor.infer_inclines(np.empty((0, 4)), self.dem)), 0)
+
+    def test_block_cache_is_bounded(self):
+        # Room for a single block only: every new block evicts the previous one
+        processor = DEMProcessor(osm_graph=None, dem_files=[], block_cache_bytes=1)
+        processor.interpolate_points(self.lons, self.lats, self.dem)
+        self.assertEqual(len(processor._block_cache), 1)
+
+        processor = DEMProcessor(osm_graph=None, dem_files=[])
+        with patch.object(self.dem, 'read', wraps=self.dem.read) as mock_read:
+            processor.interpolate_points(self.lons, self.lats, self.dem)
+            processor.interpolate_points(self.lons, self.lats, self.dem)
+        # 600x500 pixels in 256 pixel blocks, each read only once
+        self.assertEqual(mock_read.call_count, 6)
+
+        processor.clear_block_cache()
+        self.assertEqual(len(processor._block_cache), 0)
+
+
+class TestDEMProcessorRemote(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmp_dir.name)
+        self.remote_dir = Path(self.workdir, 'remote')
+        self.remote_dir.mkdir()
+        # A 2000x2000 uncompressed COG, of which the graph only covers the north-west corner
+        write_test_dem(Path(self.workdir, 'dem.tif'), width=2000, height=2000)
+        self.cog_file = Path(self.remote_dir, 'dem.tif')
+        rasterio.shutil.copy(Path(self.workdir, 'dem.tif'), self.cog_file, driver='COG', BLOCKSIZE=256)
+        self.server, self.base_url = serve_directory(self.remote_dir)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def _process(self, dem_file, name, batch_processing):
+        nodes_file = Path(self.workdir, f'{name}_nodes.geojson')
+        edges_file = Path(self.workdir, f'{name}_edges.geojson')
+        write_test_graph(nodes_file, edges_file, count=30, west=-122.49, north=47.69, span=0.005)
+        osm_graph = OSMGraph.from_geojson(nodes_path=nodes_file, edges_path=edges_file)
+        processor = DEMProcessor(osm_graph=osm_graph, dem_files=[dem_file])
+        processor.process(nodes_file, edges_file, batch_processing=batch_processing)
+        with open(edges_file) as f:
+            return [feature['properties'].get('incline') for feature in json.load(f)['features']]
+
+    def test_dem_path(self):
+        self.assertEqual(dem_path('https://example.com/n48w123.tif'), '/vsicurl/https://example.com/n48w123.tif')
+        self.assertEqual(dem_path('s3://bucket/n48w123.tif'), '/vsis3/bucket/n48w123.tif')
+        self.assertEqual(dem_path('dems/n48w123.tif'), Path('dems/n48w123.tif'))
+        self.assertTrue(is_remote('http://localhost/n48w123.tif'))
+        self.assertFalse(is_remote(Path('n48w123.tif')))
+
+    def test_remote_cog_matches_local_file(self):
+        for batch_processing in (False, True):
+            with self.subTest(batch_processing=batch_processing):
+                self.server.requests.clear()
+                local = self._process(self.cog_file, f'local_{batch_processing}', batch_processing)
+                remote = self._process(f'{self.base_url}/dem.tif', f'remote_{batch_processing}', batch_processing)
+
+                self.assertEqual(remote, local)
+                self.assertTrue(any(incline is not None for incline in remote))
+
+                # Only byte ranges of the COG are fetched, never the whole file
+                fetched = 0
+                for path, byte_range in self.server.requests:
+                    self.assertEqual(path, '/dem.tif')
+                    self.assertIsNotNone(byte_range)
+                    start, end = byte_range[len('bytes='):].split('-')
+                    fetched += int(end) - int(start) + 1
+                self.assertLess(fetched, os.path.getsize(self.cog_file) / 4)
+
+
+class TestDEMProcessorReverseTwins(GraphTestCase):
+    dem_name = 'dem.tif'
+    dem_options = {'nodata_rows': 30}
+    edge_count = 40
+    bidirectional = True
+
+    def test_reverse_twins(self):
+        coords = np.array([
+            [0.0, 0.0, 1.0, 1.0],
+            [2.0, 2.0, 3.0, 3.0],
+            [1.0, 1.0, -0.0, 0.0],  # Reverse of row 0
+            [5.0, 5.0, 5.0, 5.0],
+            [5.0, 5.0, 5.0, 5.0],  # Zero length, not a reverse pair
+            [3.0, 3.0, 4.0, 4.0],
+            [4.0, 4.0, 3.0, 3.0],
+            [3.0, 3.0, 4.0, 4.0],  # Three edges between the same points are ambiguous
+        ])
+        np.testing.assert_array_equal(reverse_twins(coords), [-1, -1, 0, -1, -1, -1, -1, -1])
+        np.testing.assert_array_equal(reverse_twins(coords[:1]), [-1])
+
+    def test_twins_match_independent_computation(self):
+        for method in ('idw', 'bilinear'):
+            for batch_processing in (False, True):
+                with self.subTest(method=method, batch_processing=batch_processing):
+                    osm_graph = OSMGraph.from_geojson(self.nodes_file, self.edges_file)
+                    processor = DEMProcessor(osm_graph=osm_graph, dem_files=[], method=method)
+                    with rasterio.open(self.dem_file) as dem:
+                        expected = {}
+                        for _, _, d in osm_graph.G.edges(data=True):
+                            incline = processor.infer_incline(d['geometry'], dem=dem)
+                            expected[d['_id']] = incline if incline is not None and -1 <= incline <= 1 else None
+                        processor.process_graph(osm_graph.G, dem, batch_processing=batch_processing)
+
+                    inclines = {d['_id']: d.get('incline') for _, _, d in osm_graph.G.edges(data=True)}
+                    self.assertEqual(processor.stats['reverse_twins'], 40)
+                    self.assertEqual(inclines, expected)
+                    self.assertTrue(any(incline is not None for incline in inclines.values()))
+                    self.assertTrue(any(incline is None for incline in inclines.values()))
+
+    def test_computed_twins_are_released(self):
+        osm_graph = OSMGraph.from_geojson(self.nodes_file, self.edges_file)
+        # Edges whose twin is removed are never kept waiting for it
+        orphans = [(u, v) for u, v in osm_graph.G.edges() if u < v][:10]
+        osm_graph.G.remove_edges_from(orphans)
+        processor = DEMProcessor(osm_graph=osm_graph, dem_files=[])
+        with patch.object(processor, '_process_edge', wraps=processor._process_edge) as mock_process_edge, \
+                rasterio.open(self.dem_file) as dem:
+            processor.process_graph(osm_graph.G, dem)
+        computed = mock_process_edge.call_args.kwargs['computed']
+        self.assertEqual(computed, {})
+        self.assertEqual(processor.stats['reverse_twins'], 30)
+
+
+class TestDEMProcessorProjected(unittest.TestCase):
+
+    def setUp(self):
+        from rasterio.warp import calculate_default_transform, reproject, Resampling
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmp_dir.name)
+        self.geographic_file = write_test_dem(Path(self.workdir, 'n48w123.tif'))
+        # The same terrain as a 2 m UTM zone 10N lidar-style DEM
+        self.projected_file = Path(self.workdir, 'utm.tif')
+        with rasterio.open(self.geographic_file) as src:
+            transform, width, height = calculate_default_transform(
+                src.crs, 'EPSG:32610', src.width, src.height, *src.bounds, resolution=2
+            )
+            profile = dict(src.profile, crs='EPSG:32610', transform=transform, width=width, height=height)
+            with rasterio.open(self.projected_file, 'w', **profile) as dst:
+                reproject(rasterio.band(src, 1), rasterio.band(dst, 1), resampling=Resampling.bilinear)
+
+        rng = np.random.default_rng(0)
+        self.coords = np.column_stack([
+            rng.uniform(-122.495, -122.485, 200), rng.uniform(47.685, 47.695, 200),
+            rng.uniform(-122.495, -122.485, 200), rng.uniform(47.685, 47.695, 200),
+        ])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _inclines(self, dem_file, scalar=False):
+        processor = DEMProcessor(osm_graph=None, dem_files=[])
+        with rasterio.open(dem_file) as dem:
+            if scalar:
+                inclines = [processor.incline_between(row[:2], row[2:], dem=dem) for row in self.coords]
+                return np.array([np.nan if incline is None else incline for incline in inclines])
+            return processor.infer_inclines(self.coords, dem)
+
+    def test_projected_dem_matches_geographic_dem(self):
+        expected = self._inclines(self.geographic_file)
+        for scalar in (False, True):
+            with self.subTest(scalar=scalar):
+                result = self._inclines(self.projected_file, scalar=scalar)
+                valid = ~np.isnan(expected)
+                self.assertTrue(valid.sum() > 150)
+                np.testing.assert_array_equal(np.isnan(result[valid]), False)
+                np.testing.assert_allclose(result[valid], expected[valid], atol=0.01)
+
+    def test_transformers_are_shared_per_crs(self):
+        from src.osw_incline.dem_processor import raster_transformer, geographic_bounds
+
+        with rasterio.open(self.projected_file) as dem, rasterio.open(self.geographic_file) as geographic:
+            transformer = raster_transformer(dem.crs)
+            self.assertIsNotNone(transformer)
+            self.assertIs(raster_transformer(rasterio.crs.CRS.from_epsg(32610)), transformer)
+            self.assertIsNone(raster_transformer(geographic.crs))
+            self.assertIsNone(raster_transformer(None))
+
+            bounds = geographic_bounds(dem)
+            expected = geographic.bounds
+            self.assertAlmostEqual(bounds.left, expected.left, places=3)
+            self.assertAlmostEqual(bounds.top, expected.top, places=3)
+            self.assertEqual(geographic_bounds(geographic), expected)
+
+    def test_chunked_processing_with_projected_dem(self):
+        from src.osw_incline.chunked_processor import ChunkedProcessor
+
+        nodes_file = Path(self.workdir, 'nodes.geojson')
+        edges_file = Path(self.workdir, 'edges.geojson')
+        write_test_graph(nodes_file, edges_file, count=20)
+        ChunkedProcessor(dem_files=[str(self.projected_file)]).process(nodes_file, edges_file)
+
+        with open(edges_file) as f:
+            edges = json.load(f)['features']
+        self.assertTrue(any('incline' in feature['properties'] for feature in edges))
+
+
+class TestDEMProcessorLayered(GraphTestCase):
+    edge_count = 60
+    bidirectional = True
+
+    def setUp(self):
+        super().setUp()
+        # A finer DEM over the north-west corner of the graph, then the whole tile
+        self.lidar_file = str(write_test_dem(Path(self.workdir, 'lidar.tif'), resolution=1 / 21600))
+        self.base_file = self.dem_file
+
+    def _alone(self, dem_file, coords):
+        with rasterio.open(dem_file) as dem:
+            return DEMProcessor(osm_graph=None, dem_files=[]).infer_inclines(coords, dem)
+
+    def test_first_layer_covering_an_edge_wins(self):
+        from src.osw_incline.dem_processor import SOURCE_PROPERTY
+
+        osm_graph = OSMGraph.from_geojson(self.nodes_file, self.edges_file)
+        edges = list(osm_graph.G.edges(data=True))
+        coords = np.array([d['geometry'].coords[0] + d['geometry'].coords[-1] for _, _, d in edges])
+        lidar = self._alone(self.lidar_file, coords)
+        base = self._alone(self.base_file, coords)
+
+        processor = DEMProcessor(osm_graph=osm_graph, dem_files=[self.lidar_file, self.base_file], layered=True)
+        interpolated = []
+        original = processor.infer_inclines
+
+        def infer_inclines(coords, dem, precision=3):
+            interpolated.append((Path(dem.name).name, len(coords)))
+            return original(coords, dem, precision=precision)
+
+        with patch.object(processor, 'infer_inclines', infer_inclines):
+            processor.process(self.nodes_file, self.edges_file)
+
+        from_lidar = ~np.isnan(lidar)
+        self.assertTrue(0 < from_lidar.sum() < len(edges))
+        for (_, _, d), lidar_incline, base_incline in zip(edges, lidar, base):
+            expected, source = (lidar_incline, 'lidar.tif') if not np.isnan(lidar_incline) else \
+                (base_incline, 'n48w123.tif')
+            if np.isnan(expected) or abs(expected) > 1:
+                self.assertNotIn('incline', d)
+                continue
+            self.assertEqual(d['incline'], expected)
+            self.assertEqual(d[SOURCE_PROPERTY], source)
+
+        # The base layer only interpolates the edges the lidar layer did not resolve
+        # (infer_inclines calls itself once more for the edges without a reverse twin)
+        self.assertEqual([name for name, _ in interpolated], ['lidar.tif'] * 2 + ['n48w123.tif'] * 2)
+        self.assertEqual(interpolated[2][1], len(edges) - from_lidar.sum())
+        resolved = from_lidar.sum() + (np.isnan(lidar) & ~np.isnan(base)).sum()
+        self.assertEqual(processor.stats['layered_edges'], resolved)
+        with open(self.edges_file) as f:
+            written = json.load(f)['features']
+        self.assertEqual(
+            {feature['properties'][SOURCE_PROPERTY] for feature in written if 'incline' in feature['properties']},
+            {'lidar.tif', 'n48w123.tif'}
+        )
+
+    def test_layered_calculate(self):
+        from src.osw_incline import OSWIncline
+
+        incline = OSWIncline(dem_files=[self.lidar_file, self.base_file], nodes_file=self.nodes_file,
+                             edges_file=self.edges_file)
+        self.assertTrue(incline.calculate(layered=True))
+        self.assertGreater(incline.stats['layered_edges'], 0)
+        for options in ({'chunked': True}, {'checkpoint': Path(self.workdir, 'run.checkpoint')}):
+            with self.assertRaises(ValueError):
+                incline.calculate(layered=True, **options)
+
+
+class TestDEMProcessorOverviews(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmp_dir.name)
+        self.dem_file = write_test_dem(Path(self.workdir, 'n48w123.tif'), width=600, height=500)
+        rng = np.random.default_rng(0)
+        self.coords = np.column_stack([
+            rng.uniform(-122.49, -122.45, 300), rng.uniform(47.66, 47.69, 300),
+            rng.uniform(-122.49, -122.45, 300), rng.uniform(47.66, 47.69, 300),
+        ])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _lengths(self):
+        return DEMProcessor(osm_graph=None, dem_files=[]).calculate_projected_lengths(self.coords)
+
+    def _inclines(self, processor, scalar=False):
+        processor.prepare_overview(self.dem_file)
+        with rasterio.open(self.dem_file) as dem:
+            if scalar:
+                inclines = [processor.incline_between(row[:2], row[2:], dem=dem) for row in self.coords]
+                return np.array([np.nan if incline is None else incline for incline in inclines])
+            return processor.infer_inclines(self.coords, dem)
+
+    def test_build_overview(self):
+        from src.osw_incline.dem_processor import build_overview
+
+        self.assertTrue(build_overview(self.dem_file, 4))
+        ovr_file = Path(f'{self.dem_file}.ovr')
+        modified = ovr_file.stat().st_mtime_ns
+        self.assertTrue(build_overview(self.dem_file, 4))
+        self.assertEqual(ovr_file.stat().st_mtime_ns, modified)
+        with rasterio.open(self.dem_file) as dem:
+            self.assertEqual(dem.overviews(1), [4])
+        # Another factor cannot be added to an existing .ovr file
+        self.assertFalse(build_overview(self.dem_file, 8))
+        self.assertFalse(build_overview('https://example.com/n48w123.tif', 4))
+
+    def test_coarse_reads_come_from_the_overview(self):
+        processor = DEMProcessor(osm_graph=None, dem_files=[], overview_factor=4)
+        processor.prepare_overview(self.dem_file)
+        # Shift the overview, so that values read from it stand out
+        with rasterio.open(f'{self.dem_file}.ovr', 'r+') as ovr:
+            ovr.write(ovr.read(1) + 1000, 1)
+
+        with rasterio.open(self.dem_file) as dem:
+            full = processor.interpolate_points(self.coords[:, 0], self.coords[:, 1], dem)
+            coarse = processor.interpolate_points(self.coords[:, 0], self.coords[:, 1], dem, factor=4)
+        valid = ~np.isnan(full)
+        self.assertTrue(valid.all())
+        np.testing.assert_allclose(coarse[valid] - full[valid], 1000, atol=3)
+
+    def test_coarse_inclines_approximate_full_resolution(self):
+        full = self._inclines(DEMProcessor(osm_graph=None, dem_files=[]))
+        coarse_processor = DEMProcessor(osm_graph=None, dem_files=[], overview_factor=4)
+        coarse = self._inclines(coarse_processor)
+        self.assertEqual(coarse_processor.stats['coarse_edges'], len(self.coords))
+
+        long = self._lengths() > 500
+        valid = long & ~np.isnan(full)
+        self.assertTrue(valid.sum() > 50)
+        np.testing.assert_allclose(coarse[valid], full[valid], atol=0.005)
+        # The edge-by-edge path reads the same decimated windows
+        np.testing.assert_allclose(self._inclines(coarse_processor, scalar=True), coarse, atol=1e-9, equal_nan=True)
+
+    def test_coarse_length(self):
+        full = self._inclines(DEMProcessor(osm_graph=None, dem_files=[]))
+        coarse = self._inclines(DEMProcessor(osm_graph=None, dem_files=[], overview_factor=4))
+        processor = DEMProcessor(osm_graph=None, dem_files=[], overview_factor=4, coarse_length=1500)
+        result = self._inclines(processor)
+
+        long = self._lengths() >= 1500
+        self.assertTrue(0 < long.sum() < len(self.coords))
+        self.assertEqual(processor.stats['coarse_edges'], long.sum())
+        np.testing.assert_array_equal(result[long], coarse[long])
+        np.testing.assert_array_equal(result[~long], full[~long])
+        for length, expected in ((1000, 1), (1500, 4)):
+            self.assertEqual(processor.factor_for(length), expected)
+
+    def test_invalid_factor(self):
+        with self.assertRaises(ValueError):
+            DEMProcessor(osm_graph=None, dem_files=[], overview_factor=0)
 
 
 if __name__ == '__main__':
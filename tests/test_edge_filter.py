@@ -0,0 +1,139 @@
+import json
+import unittest
+import tempfile
+from pathlib import Path
+from src.osw_incline import OSWIncline
+from src.osw_incline.osm_graph import OSMGraph
+from src.osw_incline.edge_filter import EdgeFilter
+from tests.helpers import write_test_dem, write_test_graph
+
+
+def edge(coordinates=((-122.49, 47.69), (-122.48, 47.68)), **props):
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'LineString', 'coordinates': [list(point) for point in coordinates]},
+        'properties': {'_u_id': '0', '_v_id': '1', **props}
+    }
+
+
+class TestEdgeFilter(unittest.TestCase):
+
+    def test_accepts_by_default(self):
+        self.assertTrue(EdgeFilter().accepts(edge(highway='footway')))
+
+    def test_rejects_edges_without_linestring(self):
+        edge_filter = EdgeFilter()
+        self.assertFalse(edge_filter.accepts({'type': 'Feature', 'geometry': None, 'properties': {}}))
+        self.assertFalse(edge_filter.accepts(edge(coordinates=((-122.49, 47.69),))))
+        point = {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [0, 0]}, 'properties': {}}
+        self.assertFalse(edge_filter.accepts(point))
+
+    def test_exclude(self):
+        edge_filter = EdgeFilter(exclude={'highway': ['steps', 'elevator'], 'footway': 'crossing'})
+        self.assertFalse(edge_filter.accepts(edge(highway='steps')))
+        self.assertFalse(edge_filter.accepts(edge(highway='elevator')))
+        self.assertFalse(edge_filter.accepts(edge(highway='footway', footway='crossing')))
+        self.assertTrue(edge_filter.accepts(edge(highway='footway', footway='sidewalk')))
+        self.assertTrue(edge_filter.accepts(edge(highway=['steps'])))
+
+    def test_bbox(self):
+        edge_filter = EdgeFilter(bbox=(-122.5, 47.6, -122.4, 47.7))
+        self.assertTrue(edge_filter.accepts(edge()))
+        self.assertFalse(edge_filter.accepts(edge(coordinates=((-122.49, 47.69), (-122.3, 47.68)))))
+        with self.assertRaises(ValueError):
+            EdgeFilter(bbox=(-122.4, 47.6, -122.5, 47.7))
+
+    def test_predicate(self):
+        edge_filter = EdgeFilter(predicate=lambda props: props.get('surface') != 'wood')
+        self.assertFalse(edge_filter.accepts(edge(surface='wood')))
+        self.assertTrue(edge_filter.accepts(edge(surface='asphalt')))
+
+    def test_skip_existing_tags(self):
+        edge_filter = EdgeFilter(exclude={'highway': 'steps'})
+        self.assertTrue(edge_filter.accepts(edge(incline=0.1)))
+
+        skipping = edge_filter.with_skip_existing_tags(True)
+        self.assertIsNot(skipping, edge_filter)
+        self.assertFalse(edge_filter.skip_existing_tags)
+        self.assertFalse(skipping.accepts(edge(incline=0.1)))
+        self.assertIs(skipping.with_skip_existing_tags(True), skipping)
+        self.assertIs(edge_filter.with_skip_existing_tags(False), edge_filter)
+
+        self.assertEqual(skipping.passthrough({'incline': 2.5}), {})
+        self.assertEqual(skipping.passthrough({'incline': 0.5}), {'incline': 0.5})
+
+
+class TestEdgeFilterPushdown(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmp_dir.name)
+        self.dem_file = write_test_dem(Path(self.workdir, 'n48w123.tif'))
+        self.nodes_file = Path(self.workdir, 'nodes.geojson')
+        self.edges_file = Path(self.workdir, 'edges.geojson')
+        self._write_graph()
+        self.edge_filter = EdgeFilter(exclude={'highway': 'steps'})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write_graph(self):
+        # Every other edge is a flight of steps
+        write_test_graph(self.nodes_file, self.edges_file, count=20)
+        with open(self.edges_file) as f:
+            edges_fc = json.load(f)
+        for i, feature in enumerate(edges_fc['features']):
+            if i % 2:
+                feature['properties']['highway'] = 'steps'
+                feature['properties']['osm_id'] = 'way/1'
+        with open(self.edges_file, 'w') as f:
+            json.dump(edges_fc, f)
+
+    def _edges(self):
+        with open(self.edges_file) as f:
+            return {feature['properties']['_id']: feature for feature in json.load(f)['features']}
+
+    def test_from_geojson_keeps_rejected_edges_out_of_the_graph(self):
+        osm_graph = OSMGraph.from_geojson(self.nodes_file, self.edges_file, edge_filter=self.edge_filter)
+
+        self.assertEqual(osm_graph.G.number_of_edges(), 10)
+        self.assertEqual(len(osm_graph.passthrough_edges), 10)
+        self.assertTrue(all(d['highway'] == 'footway' for _, _, d in osm_graph.G.edges(data=True)))
+
+    def test_rejected_edges_are_written_back_unchanged(self):
+        before = self._edges()
+        osm_graph = OSMGraph.from_geojson(self.nodes_file, self.edges_file, edge_filter=self.edge_filter)
+        osm_graph.to_geojson(self.nodes_file, self.edges_file)
+        after = self._edges()
+
+        self.assertEqual(sorted(after), sorted(before))
+        for edge_id, feature in before.items():
+            if feature['properties']['highway'] == 'steps':
+                feature['properties'].pop('osm_id')
+                self.assertEqual(after[edge_id], feature)
+
+    def _calculate(self, **options):
+        self._write_graph()
+        incline = OSWIncline(dem_files=[self.dem_file], nodes_file=self.nodes_file, edges_file=self.edges_file)
+        self.assertTrue(incline.calculate(**options))
+        return incline.stats, {
+            edge_id: feature['properties'].get('incline') for edge_id, feature in self._edges().items()
+        }
+
+    def test_calculate(self):
+        for options in ({}, {'batch_processing': True}, {'chunked': True}):
+            with self.subTest(**options):
+                _, expected = self._calculate(**options)
+                stats, inclines = self._calculate(edge_filter=self.edge_filter, **options)
+
+                self.assertEqual(stats['passthrough_edges'], 10)
+                for edge_id, feature in self._edges().items():
+                    if feature['properties']['highway'] == 'steps':
+                        self.assertIsNone(inclines[edge_id])
+                    else:
+                        self.assertEqual(inclines[edge_id], expected[edge_id])
+                self.assertTrue(any(incline is not None for incline in inclines.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import os
+import json
+import shutil
+import unittest
+import tempfile
+import rasterio
+import numpy as np
+from pathlib import Path
+from src.osw_incline import OSWIncline
+from src.osw_incline.dem_processor import DEMProcessor
+from src.osw_incline.elevation_cache import ElevationCache, dem_fingerprint
+from tests.helpers import write_test_dem, write_test_graph
+
+
+class TestElevationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmp_dir.name)
+        self.cache = ElevationCache(Path(self.workdir, 'elevations.sqlite'))
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def test_get_and_put(self):
+        lons = np.array([-122.4, -122.3, -122.2])
+        lats = np.array([47.6, 47.5, 47.4])
+        self.cache.put_many('dem', 'idw', lons[:2], lats[:2], np.array([12.5, np.nan]))
+
+        found, values = self.cache.get_many('dem', 'idw', lons, lats)
+
+        np.testing.assert_array_equal(found, [True, True, False])
+        self.assertEqual(values[0], 12.5)
+        self.assertTrue(np.isnan(values[1]) and np.isnan(values[2]))
+        # Keys include the DEM fingerprint and the method
+        self.assertFalse(self.cache.get_many('other', 'idw', lons, lats)[0].any())
+        self.assertFalse(self.cache.get_many('dem', 'bilinear', lons, lats)[0].any())
+
+    def test_coordinates_are_quantized(self):
+        self.cache.put_many('dem', 'idw', np.array([-122.4]), np.array([47.6]), np.array([1.0]))
+        found, _ = self.cache.get_many('dem', 'idw', np.array([-122.4 + 1e-9, -122.4 + 1e-6]), np.array([47.6, 47.6]))
+        np.testing.assert_array_equal(found, [True, False])
+
+    def test_persists_across_connections(self):
+        self.cache.put_many('dem', 'idw', np.array([-122.4]), np.array([47.6]), np.array([3.0]))
+        with ElevationCache(self.cache.path) as cache:
+            found, values = cache.get_many('dem', 'idw', np.array([-122.4]), np.array([47.6]))
+        self.assertTrue(found[0])
+        self.assertEqual(values[0], 3.0)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ElevationCache(Path(self.workdir, 'small.sqlite'), max_entries=10)
+        cache.put_many('dem', 'idw', np.arange(5.0), np.zeros(5), np.arange(5.0))
+        cache.connection.execute('UPDATE elevations SET used = used - 100')
+        # A lookup makes these entries recently used
+        cache.get_many('dem', 'idw', np.arange(3.0), np.zeros(3))
+
+        cache.put_many('dem', 'idw', np.arange(5.0, 11.0), np.zeros(6), np.arange(6.0))
+
+        self.assertEqual(len(cache), 9)
+        found, _ = cache.get_many('dem', 'idw', np.arange(11.0), np.zeros(11))
+        np.testing.assert_array_equal(found[:3], [True, True, True])
+        self.assertFalse(found[3:5].any())
+        cache.close()
+
+    def test_dem_fingerprint(self):
+        dem_file = write_test_dem(Path(self.workdir, 'dem.tif'))
+        copy_file = Path(self.workdir, 'copy.tif')
+        shutil.copy(dem_file, copy_file)
+        other_file = write_test_dem(Path(self.workdir, 'other.tif'), nodata_rows=5)
+
+        with rasterio.open(dem_file) as dem, rasterio.open(copy_file) as copy, rasterio.open(other_file) as other:
+            self.assertEqual(dem_fingerprint(dem), dem_fingerprint(copy))
+            self.assertNotEqual(dem_fingerprint(dem), dem_fingerprint(other))
+
+
+class TestDEMProcessorElevationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmp_dir.name)
+        self.dem_file = str(write_test_dem(Path(self.workdir, 'n48w123.tif'), nodata_rows=20))
+        self.cache_file = Path(self.workdir, 'elevations.sqlite')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_cached_values_match_interpolation(self):
+        rng = np.random.default_rng(0)
+        with rasterio.open(self.dem_file) as dem:
+            bounds = dem.bounds
+            lons = rng.uniform(bounds.left - 0.001, bounds.right, 500)
+            lats = rng.uniform(bounds.bottom, bounds.top + 0.001, 500)
+            expected = DEMProcessor(osm_graph=None, dem_files=[]).interpolate_points(lons, lats, dem)
+
+            with ElevationCache(self.cache_file) as cache:
+                processor = DEMProcessor(osm_graph=None, dem_files=[], elevation_cache=cache)
+                first = processor.interpolate_points(lons, lats, dem)
+                second = processor.interpolate_points(lons, lats, dem)
+
+        np.testing.assert_array_equal(first, expected)
+        np.testing.assert_array_equal(second, expected)
+        on_dem = (lons >= bounds.left) & (lats <= bounds.top)
+        self.assertEqual(processor.stats['elevation_cache_misses'], on_dem.sum())
+        self.assertEqual(processor.stats['elevation_cache_hits'], on_dem.sum())
+
+    def test_calculate_reuses_cache_across_runs(self):
+        for batch_processing in (True, False):
+            with self.subTest(batch_processing=batch_processing):
+                cache_file = Path(self.workdir, f'elevations-{batch_processing}.sqlite')
+                results = []
+                stats = []
+                for run in range(2):
+                    nodes_file = Path(self.workdir, f'nodes{run}.geojson')
+                    edges_file = Path(self.workdir, f'edges{run}.geojson')
+                    write_test_graph(nodes_file, edges_file, count=30)
+                    incline = OSWIncline(dem_files=[self.dem_file], nodes_file=nodes_file, edges_file=edges_file)
+                    incline.calculate(batch_processing=batch_processing, elevation_cache=cache_file)
+                    stats.append(incline.stats)
+                    with open(edges_file) as f:
+                        results.append([feature['properties'].get('incline') for feature in json.load(f)['features']])
+
+                self.assertEqual(results[0], results[1])
+                self.assertGreater(stats[0]['elevation_cache_misses'], 0)
+                self.assertEqual(stats[0]['elevation_cache_hits'], 0)
+                self.assertEqual(stats[1]['elevation_cache_misses'], 0)
+                self.assertEqual(stats[1]['elevation_cache_hits'], stats[0]['elevation_cache_misses'])
+                self.assertTrue(os.path.exists(cache_file))
+
+    def test_serial_run_matches_uncached(self):
+        nodes_file = Path(self.workdir, 'nodes.geojson')
+        edges_file = Path(self.workdir, 'edges.geojson')
+        results = []
+        for elevation_cache in (None, self.cache_file):
+            write_test_graph(nodes_file, edges_file, count=30)
+            OSWIncline(dem_files=[self.dem_file], nodes_file=nodes_file,
+                       edges_file=edges_file).calculate(elevation_cache=elevation_cache)
+            with open(edges_file) as f:
+                results.append([feature['properties'].get('incline') for feature in json.load(f)['features']])
+        self.assertEqual(results[0], results[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import json
+import shutil
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from src.osw_incline import OSWIncline
+from src.osw_incline.engine import InclineEngine
+from src.osw_incline.osm_graph import OSMGraph
+from tests.helpers import GraphTestCase, write_test_dem
+
+
+class TestInclineEngine(GraphTestCase):
+    edge_count = 20
+
+    def setUp(self):
+        super().setUp()
+        self.engine = InclineEngine(dem_files=[self.dem_file])
+
+    def tearDown(self):
+        self.engine.close()
+
+    def _inclines(self, edges_file):
+        with open(edges_file) as f:
+            return {
+                feature['properties']['_id']: feature['properties'].get('incline')
+                for feature in json.load(f)['features']
+            }
+
+    def test_compute_graph(self):
+        osm_graph = OSMGraph.from_geojson(self.nodes_file, self.edges_file)
+        result = self.engine.compute(osm_graph)
+
+        self.assertIs(result, osm_graph)
+        inclines = [d.get('incline') for _, _, d in osm_graph.G.edges(data=True)]
+        self.assertGreater(sum(incline is not None for incline in inclines), len(inclines) // 2)
+
+    def test_compute_networkx_graph(self):
+        osm_graph = OSMGraph.from_geojson(self.nodes_file, self.edges_file)
+        self.engine.compute(osm_graph.G, batch_processing=True)
+        self.assertTrue(any('incline' in d for _, _, d in osm_graph.G.edges(data=True)))
+
+    def test_datasets_are_reused_across_graphs(self):
+        with patch('src.osw_incline.engine.rasterio.open', wraps=__import__('rasterio').open) as mock_open:
+            for _ in range(3):
+                self.engine.compute(OSMGraph.from_geojson(self.nodes_file, self.edges_file))
+        self.assertEqual(mock_open.call_count, 1)
+        self.assertEqual(self.engine.open_datasets, [self.dem_file])
+
+    def test_release_and_close(self):
+        self.engine.dataset(self.dem_file)
+        self.engine.release(self.dem_file)
+        self.assertEqual(self.engine.open_datasets, [])
+
+        with InclineEngine(dem_files=[self.dem_file]) as engine:
+            dem = engine.dataset(self.dem_file)
+        self.assertTrue(dem.closed)
+
+    def test_trim_closes_least_recently_used(self):
+        other_dem = str(write_test_dem(Path(self.workdir, 'n47w123.tif'), north=46.7))
+        self.engine.dataset(self.dem_file)
+        self.engine.dataset(other_dem)
+        self.engine.dataset(self.dem_file)
+
+        self.engine.trim(1)
+
+        self.assertEqual(self.engine.open_datasets, [self.dem_file])
+        self.assertEqual(self.engine.stats['dem_opens'], 2)
+
+    def test_max_open_holds_within_a_graph(self):
+        other_dem = str(Path(self.workdir, 'copy.tif'))
+        shutil.copy(self.dem_file, other_dem)
+        open_counts = []
+        with InclineEngine(dem_files=[self.dem_file, other_dem], max_open=1) as engine:
+            process_graph = engine.dem_processor.process_graph
+
+            def record_open(**kwargs):
+                open_counts.append(len(engine.open_datasets))
+                return process_graph(**kwargs)
+
+            with patch.object(engine.dem_processor, 'process_graph', side_effect=record_open):
+                engine.compute(OSMGraph.from_geojson(self.nodes_file, self.edges_file))
+            self.assertEqual(engine.open_datasets, [other_dem])
+        self.assertEqual(open_counts, [1, 1])
+
+    def test_compute_files_matches_oswincline(self):
+        nodes_copy = Path(self.workdir, 'copy.nodes.geojson')
+        edges_copy = Path(self.workdir, 'copy.edges.geojson')
+        shutil.copy(self.nodes_file, nodes_copy)
+        shutil.copy(self.edges_file, edges_copy)
+        OSWIncline(dem_files=[self.dem_file], nodes_file=nodes_copy, edges_file=edges_copy).calculate()
+
+        self.assertTrue(self.engine.compute_files(self.nodes_file, self.edges_file))
+        self.assertEqual(self._inclines(self.edges_file), self._inclines(edges_copy))
+
+    def test_missing_dem_file(self):
+        engine = InclineEngine(dem_files=[str(Path(self.workdir, 'missing.tif'))])
+        with self.assertRaises(Exception) as context:
+            engine.compute(OSMGraph.from_geojson(self.nodes_file, self.edges_file))
+        self.assertIn('Failed to open DEM file', str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
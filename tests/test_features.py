@@ -0,0 +1,149 @@
+import copy
+import json
+import unittest
+import importlib.util
+from pathlib import Path
+import numpy as np
+import shapely
+from src.osw_incline import OSWIncline
+from src.osw_incline.features import edge_coords, existing_inclines, with_inclines, geometry_coords
+from tests.helpers import GraphTestCase, write_test_dem
+
+HAS_GEOPANDAS = importlib.util.find_spec('geopandas') is not None
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+
+class TestFeatures(unittest.TestCase):
+
+    def setUp(self):
+        self.features = [
+            {'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': [[1, 2], [5, 5], [3, 4]]},
+             'properties': {'incline': 0.1}},
+            {'type': 'Feature', 'geometry': None, 'properties': {}},
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [1, 2]}, 'properties': None},
+        ]
+        self.collection = {'type': 'FeatureCollection', 'features': self.features}
+
+    def test_edge_coords(self):
+        coords = edge_coords(self.collection)
+        np.testing.assert_array_equal(coords[0], [1, 2, 3, 4])
+        self.assertTrue(np.isnan(coords[1:]).all())
+        np.testing.assert_array_equal(edge_coords(self.features), coords)
+
+    def test_geometry_coords(self):
+        geometries = [shapely.LineString([(1, 2), (5, 5), (3, 4)]), None, shapely.Point(1, 2)]
+        np.testing.assert_array_equal(geometry_coords(geometries), edge_coords(self.features))
+
+    def test_existing_inclines(self):
+        np.testing.assert_array_equal(existing_inclines(self.features), [0.1, np.nan, np.nan])
+        self.features[2]['properties'] = {'incline': 5.0}
+        np.testing.assert_array_equal(existing_inclines(self.features), [0.1, np.nan, np.nan])
+        np.testing.assert_array_equal(existing_inclines(self.features, valid_only=False), [0.1, np.nan, 5.0])
+
+    def test_with_inclines_copies(self):
+        before = copy.deepcopy(self.collection)
+        updated = with_inclines(self.collection, np.array([0.2, np.nan, 0.3]))
+
+        self.assertEqual(self.collection, before)
+        self.assertEqual([(feature['properties'] or {}).get('incline') for feature in updated['features']],
+                         [0.2, None, 0.3])
+        self.assertEqual(updated['type'], 'FeatureCollection')
+        self.assertIsInstance(with_inclines(self.features, np.array([0.2, np.nan, 0.3])), list)
+
+    def test_unsupported_edges(self):
+        with self.assertRaises(ValueError):
+            edge_coords({'type': 'Feature'})
+        with self.assertRaises(ValueError):
+            edge_coords('edges.geojson')
+
+
+class TestInMemoryInclines(GraphTestCase):
+    dem_name = 'dem.tif'
+    bidirectional = True
+
+    def setUp(self):
+        super().setUp()
+        with open(self.edges_file) as f:
+            self.collection = json.load(f)
+        self.osw_incline = OSWIncline(dem_files=[self.dem_file])
+
+    def _file_inclines(self, **options):
+        OSWIncline(dem_files=[self.dem_file], nodes_file=self.nodes_file,
+                   edges_file=self.edges_file).calculate(**options)
+        with open(self.edges_file) as f:
+            return [feature['properties'].get('incline') for feature in json.load(f)['features']]
+
+    def test_matches_file_run(self):
+        before = copy.deepcopy(self.collection)
+        inclines = self.osw_incline.inclines(self.collection)
+
+        self.assertEqual(self.collection, before)
+        self.assertEqual(self.osw_incline.stats['reverse_twins'], 30)
+        expected = self._file_inclines()
+        self.assertIn(None, expected)
+        self.assertEqual([None if np.isnan(incline) else incline for incline in inclines.tolist()], expected)
+
+        updated = self.osw_incline.add_inclines(self.collection['features'])
+        self.assertEqual([feature['properties'].get('incline') for feature in updated], expected)
+
+    def test_skip_existing_tags(self):
+        self.collection['features'][0]['properties']['incline'] = 0.5
+        inclines = self.osw_incline.inclines(self.collection, skip_existing_tags=True)
+        self.assertEqual(inclines[0], 0.5)
+        self.assertNotEqual(self.osw_incline.inclines(self.collection)[0], 0.5)
+
+    def test_out_of_range_existing_matches_file_run(self):
+        self.collection['features'][0]['properties']['incline'] = 5.0
+        self.collection['features'][1]['properties']['incline'] = 0.5
+        with open(self.edges_file, 'w') as f:
+            json.dump(self.collection, f)
+        for skip_existing_tags in (True, False):
+            with self.subTest(skip_existing_tags=skip_existing_tags):
+                updated = self.osw_incline.add_inclines(self.collection, skip_existing_tags=skip_existing_tags)
+                expected = self._file_inclines(skip_existing_tags=skip_existing_tags)
+                with open(self.edges_file, 'w') as f:
+                    json.dump(self.collection, f)
+                self.assertEqual([feature['properties'].get('incline') for feature in updated['features']], expected)
+        self.assertEqual(self.collection['features'][0]['properties']['incline'], 5.0)
+
+    def test_no_dem_coverage_keeps_existing(self):
+        for feature in self.collection['features']:
+            feature['geometry']['coordinates'] = [[10.0, 10.0], [10.001, 10.001]]
+        self.collection['features'][0]['properties']['incline'] = 0.25
+        inclines = self.osw_incline.inclines(self.collection)
+        self.assertEqual(inclines[0], 0.25)
+        self.assertTrue(np.isnan(inclines[1:]).all())
+
+    def test_layered(self):
+        lidar_file = write_test_dem(Path(self.workdir, 'lidar.tif'), resolution=1 / 21600)
+        osw_incline = OSWIncline(dem_files=[lidar_file, self.dem_file])
+        inclines = osw_incline.inclines(self.collection, layered=True)
+        lidar_inclines = OSWIncline(dem_files=[lidar_file]).inclines(self.collection)
+        found = ~np.isnan(lidar_inclines)
+        np.testing.assert_array_equal(inclines[found], lidar_inclines[found])
+        self.assertGreaterEqual(osw_incline.stats['layered_edges'], int(found.sum()))
+
+    @unittest.skipUnless(HAS_GEOPANDAS, 'geopandas is not installed')
+    def test_geodataframe(self):
+        import geopandas
+
+        frame = geopandas.GeoDataFrame.from_features(self.collection['features'], crs='EPSG:4326')
+        updated = self.osw_incline.add_inclines(frame)
+        self.assertNotIn('incline', frame.columns)
+        np.testing.assert_array_equal(updated['incline'].to_numpy(), self.osw_incline.inclines(self.collection))
+
+    @unittest.skipUnless(HAS_PYARROW, 'pyarrow is not installed')
+    def test_arrow_table(self):
+        import pyarrow as pa
+
+        geometries = [shapely.to_wkb(shapely.geometry.shape(feature['geometry']))
+                      for feature in self.collection['features']]
+        table = pa.table({'geometry': geometries})
+        updated = self.osw_incline.add_inclines(table)
+        inclines = self.osw_incline.inclines(self.collection)
+        self.assertEqual(updated.column('incline').to_pylist(),
+                         [None if np.isnan(incline) else incline for incline in inclines.tolist()])
+
+
+if __name__ == '__main__':
+    unittest.main()
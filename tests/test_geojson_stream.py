@@ -0,0 +1,68 @@
+import os
+import json
+import unittest
+import tempfile
+from pathlib import Path
+from src.osw_incline.geojson_stream import iter_features, FeatureWriter, SCHEMA
+
+
+class TestGeoJSONStream(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name, 'edges.geojson')
+        self.features = [
+            {
+                'type': 'Feature',
+                'geometry': {'type': 'LineString', 'coordinates': [[-122.1, 47.1], [-122.2, 47.2]]},
+                'properties': {'_id': str(i), 'name': 'a ] tricky, "name"'}
+            }
+            for i in range(25)
+        ]
+        with open(self.path, 'w') as f:
+            json.dump({'type': 'FeatureCollection', 'features': self.features}, f)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_iter_features(self):
+        self.assertEqual(list(iter_features(self.path)), self.features)
+
+    def test_iter_features_small_chunks(self):
+        # Features split across many buffer refills are still decoded correctly
+        self.assertEqual(list(iter_features(self.path, chunk_size=7)), self.features)
+
+    def test_iter_features_empty_collection(self):
+        with open(self.path, 'w') as f:
+            json.dump({'type': 'FeatureCollection', 'features': []}, f)
+        self.assertEqual(list(iter_features(self.path)), [])
+
+    def test_iter_features_missing_features(self):
+        with open(self.path, 'w') as f:
+            json.dump({'type': 'FeatureCollection'}, f)
+        with self.assertRaises(ValueError):
+            list(iter_features(self.path))
+
+    def test_iter_features_truncated_file(self):
+        with open(self.path) as f:
+            content = f.read()
+        with open(self.path, 'w') as f:
+            f.write(content[:len(content) // 2])
+        with self.assertRaises(ValueError):
+            list(iter_features(self.path, chunk_size=64))
+
+    def test_feature_writer_matches_json_dump(self):
+        output = Path(self.tmp_dir.name, 'out.geojson')
+        with FeatureWriter(output) as writer:
+            for feature in self.features:
+                writer.write(feature)
+
+        expected = json.dumps({'type': 'FeatureCollection', 'features': self.features, '$schema': SCHEMA})
+        with open(output) as f:
+            self.assertEqual(f.read(), expected)
+        self.assertEqual(writer.count, len(self.features))
+        self.assertTrue(os.path.exists(output))
+
+
+if __name__ == '__main__':
+    unittest.main()
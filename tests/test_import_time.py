@@ -0,0 +1,49 @@
+import sys
+import json
+import unittest
+import subprocess
+from pathlib import Path
+
+# Wall-clock budget for `import osw_incline` in a fresh interpreter. The package
+# itself only needs the standard library; heavy dependencies load on first use.
+IMPORT_TIME_BUDGET = 0.5  # seconds
+HEAVY_MODULES = ['networkx', 'rasterio', 'pyproj', 'shapely', 'scipy', 'numpy']
+
+PROBE = '''
+import sys, json, time
+start = time.perf_counter()
+import src.osw_incline
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+''' % (HEAVY_MODULES,)
+
+
+class TestImportTime(unittest.TestCase):
+
+    def _probe(self):
+        output = subprocess.check_output(
+            [sys.executable, '-c', PROBE], cwd=Path(__file__).resolve().parent.parent
+        )
+        return json.loads(output.decode().strip().splitlines()[-1])
+
+    def test_heavy_modules_are_not_imported(self):
+        self.assertEqual(self._probe()['loaded'], [])
+
+    def test_import_time_budget(self):
+        # Take the best of a few runs to keep the measurement stable on busy machines
+        elapsed = min(self._probe()['elapsed'] for _ in range(3))
+        self.assertLess(elapsed, IMPORT_TIME_BUDGET, f'import osw_incline took {elapsed:.3f}s')
+
+    def test_lazy_attributes(self):
+        import src.osw_incline as osw_incline
+        from src.osw_incline.dem_processor import DEMProcessor
+        from src.osw_incline.osm_graph import OSMGraph
+
+        self.assertIs(osw_incline.DEMProcessor, DEMProcessor)
+        self.assertIs(osw_incline.OSMGraph, OSMGraph)
+        with self.assertRaises(AttributeError):
+            getattr(osw_incline, 'NotAnAttribute')
+
+
+if __name__ == '__main__':
+    unittest.main()
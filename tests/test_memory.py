@@ -0,0 +1,110 @@
+import gc
+import json
+import unittest
+from unittest.mock import patch
+from src.osw_incline import OSWIncline
+from src.osw_incline.memory import MemoryMonitor, collect, rss_bytes, peak_rss_bytes
+from tests.helpers import GraphTestCase, write_test_graph
+
+
+class TestMemoryMonitor(unittest.TestCase):
+
+    def test_policy_events(self):
+        expected = {
+            'always': [True, True, True],
+            'tile': [False, True, False],
+            'none': [False, False, False],
+        }
+        for policy, collected in expected.items():
+            with self.subTest(policy=policy), patch('gc.collect') as mock_collect:
+                memory = MemoryMonitor(policy)
+                self.assertEqual([memory.collect(event) for event in ('batch', 'tile', 'stage')], collected)
+                self.assertEqual(mock_collect.call_count, sum(collected))
+                self.assertEqual(memory.collections, sum(collected))
+
+    def test_default_policy_without_monitor(self):
+        with patch('gc.collect') as mock_collect:
+            self.assertFalse(collect(None, 'batch'))
+            self.assertTrue(collect(None, 'tile'))
+        mock_collect.assert_called_once_with()
+
+    def test_pressure_policy(self):
+        with patch('src.osw_incline.memory.rss_bytes', side_effect=[1000, 1500, 2100, 2100]), \
+                patch('gc.collect') as mock_collect:
+            memory = MemoryMonitor('pressure', pressure_bytes=1000)
+            # 500 bytes above the baseline, then 1100
+            self.assertFalse(memory.collect('batch'))
+            self.assertTrue(memory.collect('batch'))
+        mock_collect.assert_called_once_with()
+
+    def test_pressure_policy_without_rss(self):
+        with patch('src.osw_incline.memory.rss_bytes', return_value=None), patch('gc.collect') as mock_collect:
+            memory = MemoryMonitor('pressure')
+            self.assertFalse(memory.collect('batch'))
+            self.assertTrue(memory.collect('tile'))
+        mock_collect.assert_called_once_with()
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            MemoryMonitor('sometimes')
+
+    def test_stage_records(self):
+        with MemoryMonitor('always', trace=True) as memory:
+            with memory.stage('allocate'):
+                data = [bytearray(1024) for _ in range(1000)]
+                memory.collect('stage')
+            del data
+
+        record, = memory.stages
+        self.assertEqual(record['stage'], 'allocate')
+        self.assertEqual(record['collections'], 1)
+        self.assertGreaterEqual(record['traced_peak_bytes'], 1000 * 1024)
+        self.assertTrue(record['top_allocations'])
+        self.assertEqual(set(record['top_allocations'][0]), {'location', 'bytes', 'count'})
+        if rss_bytes() is not None:
+            self.assertGreater(record['rss_bytes'], 0)
+            self.assertGreaterEqual(peak_rss_bytes(), record['rss_bytes'])
+
+
+class TestMemoryPolicyRun(GraphTestCase):
+
+    dem_name = 'dem.tif'
+    edge_count = 20
+
+    def setUp(self):
+        super().setUp()
+        self.osw_incline = OSWIncline(dem_files=[self.dem_file], nodes_file=self.nodes_file,
+                                      edges_file=self.edges_file)
+
+    def _inclines(self):
+        with open(self.edges_file) as f:
+            return [feature['properties'].get('incline') for feature in json.load(f)['features']]
+
+    def test_policies_give_the_same_inclines_and_restore_gc(self):
+        results = {}
+        for policy in ('always', 'tile', 'pressure', 'none'):
+            write_test_graph(self.nodes_file, self.edges_file, count=20)
+            self.assertTrue(gc.isenabled())
+            with patch('gc.collect') as mock_collect:
+                self.osw_incline.calculate(batch_processing=True, gc_policy=policy)
+            self.assertTrue(gc.isenabled())
+            results[policy] = (self._inclines(), mock_collect.call_count)
+
+        self.assertEqual(len({tuple(inclines) for inclines, _ in results.values()}), 1)
+        # Two when loading, two when saving, cleaning and the end of the run, plus a batch and a tile
+        self.assertEqual(results['always'][1], 8)
+        self.assertEqual(results['tile'][1], 1)
+        self.assertEqual(results['none'][1], 0)
+
+    def test_memory_stages(self):
+        self.osw_incline.calculate(trace_memory=True)
+
+        stages = [record['stage'] for record in self.osw_incline.memory_stages]
+        self.assertEqual(stages, ['load', 'tile dem.tif', 'clean'])
+        for record in self.osw_incline.memory_stages:
+            self.assertIn('traced_peak_bytes', record)
+        self.assertEqual(self.osw_incline.memory_stages[1]['collections'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
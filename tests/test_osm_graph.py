@@ -1,9 +1,11 @@
 import unittest
 import os
 import json
+import gc
 import networkx as nx
-from shapely.geometry import Point, LineString
-from src.osw_incline.osm_graph import OSMGraph
+from shapely.geometry import Point, LineString, shape, mapping
+from src.osw_incline.memory import paused_gc
+from src.osw_incline.osm_graph import OSMGraph, geometries_from_geojson, geometries_to_geojson
 
 
 class TestOSMGraph(unittest.TestCase):
@@ -62,11 +64,13 @@ class TestOSMGraph(unittest.TestCase):
             json.dump(edges_data, f)
 
     def tearDown(self):
-        """Remove temporary nodes.geojson and edges.geojson files"""
+        """Remove temporary nodes.geojson, edges.geojson and points.geojson files"""
         if os.path.exists(self.nodes_geojson):
             os.remove(self.nodes_geojson)
         if os.path.exists(self.edges_geojson):
             os.remove(self.edges_geojson)
+        if os.path.exists(self.points_geojson):
+            os.remove(self.points_geojson)
 
     def test_from_geojson_nodes(self):
         osm_graph = OSMGraph.from_geojson(self.nodes_geojson, self.edges_geojson)
@@ -263,5 +267,62 @@ class TestOSMGraph(unittest.TestCase):
         self.assertFalse(hasattr(osm_graph, 'G'))
 
 
+class TestGeometryConversion(unittest.TestCase):
+    GEOJSONS = [
+        {'type': 'Point', 'coordinates': [-122.2342147, 47.4686691]},
+        {'type': 'Point', 'coordinates': [-122, 47]},
+        {'type': 'Point', 'coordinates': [-122.2342147, 47.4686691, 12.5]},
+        {'type': 'LineString', 'coordinates': [[-122.2342147, 47.4686691], [-122.235159, 47.4709523]]},
+        {'type': 'LineString', 'coordinates': [[-122.1, 47.1], [-122.2, 47.2], [-122.3, 47.3]]},
+        {'type': 'LineString', 'coordinates': [[-122.1, 47.1, 1.0], [-122.2, 47.2, 2.0]]},
+        {'type': 'LineString', 'coordinates': []},
+        {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 0]]]},
+        {'type': 'MultiLineString', 'coordinates': [[[0, 0], [1, 1]], [[2, 2], [3, 3]]]},
+    ]
+
+    def test_from_geojson_matches_shape(self):
+        geometries = geometries_from_geojson(self.GEOJSONS)
+        for geometry, geojson in zip(geometries, self.GEOJSONS):
+            self.assertEqual(geometry.wkt, shape(geojson).wkt)
+
+    def test_from_geojson_mixed_dimensions(self):
+        geojsons = [
+            {'type': 'LineString', 'coordinates': [[0, 0], [1, 1]]},
+            {'type': 'LineString', 'coordinates': [[0, 0, 5], [1, 1, 6]]},
+        ]
+        geometries = geometries_from_geojson(geojsons)
+        self.assertEqual([g.wkt for g in geometries], [shape(g).wkt for g in geojsons])
+
+    def test_from_geojson_invalid_geometry_raises(self):
+        with self.assertRaises(Exception):
+            geometries_from_geojson([{'type': 'Unknown', 'coordinates': [0, 0]}])
+
+    def test_to_geojson_matches_mapping(self):
+        geometries = [shape(geojson) for geojson in self.GEOJSONS]
+        self.assertEqual(
+            json.dumps(geometries_to_geojson(geometries)),
+            json.dumps([mapping(geometry) for geometry in geometries])
+        )
+
+    def test_empty_lists(self):
+        self.assertEqual(geometries_from_geojson([]), [])
+        self.assertEqual(geometries_to_geojson([]), [])
+
+    def test_paused_gc_restores_state(self):
+        was_enabled = gc.isenabled()
+        try:
+            for enabled in (True, False):
+                if enabled:
+                    gc.enable()
+                else:
+                    gc.disable()
+                with paused_gc():
+                    self.assertFalse(gc.isenabled())
+                self.assertEqual(gc.isenabled(), enabled)
+        finally:
+            if was_enabled:
+                gc.enable()
+
+
 if __name__ == '__main__':
     unittest.main()
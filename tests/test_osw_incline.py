@@ -1,11 +1,17 @@
 import json
+import shutil
+import asyncio
 import unittest
+import tempfile
+import threading
 from pathlib import Path
 from src.osw_incline import OSWIncline
 from src.osw_incline.logger import Logger
 from unittest.mock import patch, MagicMock
 from src.osw_incline.osm_graph import OSMGraph
+from src.osw_incline.dem_processor import DEMProcessor
 from src.utils import download_dems, unzip_dataset, remove_unzip_dataset
+from tests.helpers import write_test_dem, write_test_graph
 
 ASSETS_DIR = f'{Path.cwd()}/tests/assets'
 DEM_DIR = f'{Path.cwd()}/downloads/dems'
@@ -124,6 +130,15 @@ class TestOSWIncline(unittest.TestCase):
             batch_processing=True
         )
 
+    @patch.object(OSMGraph, 'from_geojson', return_value=MagicMock())
+    @patch('src.osw_incline.dem_processor.DEMProcessor.process', return_value=None)
+    def test_calculate_with_invalid_method(self, mock_dem_processor, mock_osm_graph):
+        with self.assertRaises(Exception) as context:
+            self.osw_incline.calculate(method='nearest')
+
+        self.assertIn('Invalid interpolation method nearest selected', str(context.exception))
+        mock_dem_processor.assert_not_called()
+
     # Test when OSMGraph.from_geojson raises an exception
     @patch.object(OSMGraph, 'from_geojson', side_effect=Exception("OSMGraph Error"))
     @patch.object(Logger, 'error')  # Mock the Logger to capture error log calls
@@ -220,5 +235,119 @@ class TestOSWInclineIntegration(unittest.TestCase):
                 self.assertTrue(-1 <= incline_value <= 1, 'Incline should be between -1 and 1.')
 
 
+class TestOSWInclineAsync(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmp_dir.name)
+        self.dem_files = [str(write_test_dem(Path(self.workdir, 'n48w123.tif')))]
+        self.nodes_file = Path(self.workdir, 'nodes.geojson')
+        self.edges_file = Path(self.workdir, 'edges.geojson')
+        write_test_graph(self.nodes_file, self.edges_file, count=30)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _read(self, path):
+        with open(path) as f:
+            return json.load(f)
+
+    async def test_calculate_async_matches_calculate(self):
+        nodes_copy = Path(self.workdir, 'sync.nodes.geojson')
+        edges_copy = Path(self.workdir, 'sync.edges.geojson')
+        shutil.copy(self.nodes_file, nodes_copy)
+        shutil.copy(self.edges_file, edges_copy)
+        OSWIncline(dem_files=self.dem_files, nodes_file=nodes_copy, edges_file=edges_copy).calculate()
+
+        incline = OSWIncline(dem_files=self.dem_files, nodes_file=self.nodes_file, edges_file=self.edges_file)
+        result = await incline.calculate_async(chunk_size=7)
+
+        self.assertTrue(result)
+        self.assertEqual(self._read(self.edges_file), self._read(edges_copy))
+        self.assertEqual(self._read(self.nodes_file), self._read(nodes_copy))
+
+    async def test_calculate_async_plans_tiles_in_the_executor(self):
+        threads = []
+        plan_dem_files = OSWIncline._plan_dem_files
+
+        def tracked_plan_dem_files(incline, **kwargs):
+            threads.append(threading.current_thread())
+            return plan_dem_files(incline, **kwargs)
+
+        incline = OSWIncline(dem_files=self.dem_files, nodes_file=self.nodes_file, edges_file=self.edges_file)
+        with patch.object(OSWIncline, '_plan_dem_files', autospec=True, side_effect=tracked_plan_dem_files):
+            self.assertTrue(await incline.calculate_async())
+
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+
+    async def test_calculate_async_cancellation(self):
+        original = self._read(self.edges_file)
+        started = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        process_edge_batch = DEMProcessor.process_edge_batch
+
+        def slow_process_edge_batch(processor, edges, dem, skip_existing_tags=False):
+            loop.call_soon_threadsafe(started.set)
+            threading.Event().wait(0.05)
+            process_edge_batch(processor, edges, dem, skip_existing_tags=skip_existing_tags)
+
+        incline = OSWIncline(dem_files=self.dem_files, nodes_file=self.nodes_file, edges_file=self.edges_file)
+        with patch.object(DEMProcessor, 'process_edge_batch', autospec=True, side_effect=slow_process_edge_batch):
+            task = asyncio.create_task(incline.calculate_async(chunk_size=1))
+            await started.wait()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        # Nothing is written for a cancelled job
+        self.assertEqual(self._read(self.edges_file), original)
+
+    async def _peak_concurrent_jobs(self, max_concurrent_jobs, count=4):
+        active = []
+        peak = []
+        lock = threading.Lock()
+        from_geojson = OSMGraph.from_geojson
+
+        def tracked_from_geojson(*args, **kwargs):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            threading.Event().wait(0.05)
+            with lock:
+                active.pop()
+            return from_geojson(*args, **kwargs)
+
+        jobs = []
+        for i in range(count):
+            nodes_file = Path(self.workdir, f'{i}.nodes.geojson')
+            edges_file = Path(self.workdir, f'{i}.edges.geojson')
+            shutil.copy(self.nodes_file, nodes_file)
+            shutil.copy(self.edges_file, edges_file)
+            jobs.append(OSWIncline(dem_files=self.dem_files, nodes_file=nodes_file, edges_file=edges_file))
+
+        with patch.object(OSWIncline, 'max_concurrent_jobs', max_concurrent_jobs), \
+                patch.object(OSMGraph, 'from_geojson', side_effect=tracked_from_geojson):
+            results = await asyncio.gather(*(job.calculate_async() for job in jobs))
+
+        self.assertEqual(results, [True] * count)
+        return max(peak)
+
+    async def test_calculate_async_limits_concurrent_jobs(self):
+        self.assertLessEqual(await self._peak_concurrent_jobs(2), 2)
+
+    async def test_calculate_async_follows_a_changed_limit(self):
+        await self._peak_concurrent_jobs(1, count=1)
+        self.assertEqual(await self._peak_concurrent_jobs(2), 2)
+
+    async def test_calculate_async_missing_dem_file(self):
+        incline = OSWIncline(
+            dem_files=[str(Path(self.workdir, 'missing.tif'))], nodes_file=self.nodes_file, edges_file=self.edges_file
+        )
+        with self.assertRaises(Exception) as context:
+            await incline.calculate_async()
+        self.assertIn('Failed to open DEM file', str(context.exception))
+
+
 if __name__ == '__main__':
     unittest.main()
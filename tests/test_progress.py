@@ -0,0 +1,123 @@
+import json
+import unittest
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+from src.osw_incline import OSWIncline
+from src.osw_incline.progress import ProgressTracker, CancellationToken, Cancelled
+from tests.helpers import GraphTestCase, write_test_dem, write_test_graph
+
+
+class TestProgressTracker(unittest.TestCase):
+
+    def test_reports(self):
+        reports = []
+        with patch('time.monotonic', side_effect=[0, 0, 1, 2, 4, 5]):
+            tracker = ProgressTracker(reports.append, interval=1.5)
+            tracker.start(100, tiles=2)
+            tracker.advance(50)  # t=1, within the interval
+            tracker.advance(50)  # t=2, reported
+            tracker.end_tile()  # t=4, reported
+            tracker.finish()  # t=5
+
+        self.assertEqual([report['edges_done'] for report in reports], [100, 100, 200])
+        self.assertEqual(reports[0]['edges_total'], 200)
+        self.assertEqual(reports[0]['edges_per_second'], 50)
+        self.assertEqual(reports[0]['eta_seconds'], 2)
+        self.assertEqual(reports[1]['tiles_done'], 1)
+        self.assertTrue(reports[-1]['finished'])
+        self.assertEqual(reports[-1]['eta_seconds'], 0)
+
+    def test_unknown_tiles(self):
+        tracker = ProgressTracker()
+        tracker.start(10)
+        tracker.advance(10)
+        self.assertIsNone(tracker.report()['edges_total'])
+        self.assertIsNone(tracker.report()['eta_seconds'])
+        tracker.end_tile()
+        tracker.finish()
+        self.assertEqual((tracker.tiles_total, tracker.edges_total), (1, 10))
+
+    def test_cancellation(self):
+        token = CancellationToken()
+        tracker = ProgressTracker(cancel_token=token)
+        tracker.start(10)
+        tracker.advance(5)
+        token.cancel()
+        self.assertTrue(token.cancelled)
+        with self.assertRaises(Cancelled):
+            tracker.advance(5)
+
+
+class TestCalculateProgress(GraphTestCase):
+    dem_name = 'dem.tif'
+    edge_count = 2500
+
+    def setUp(self):
+        super().setUp()
+        self.osw_incline = OSWIncline(dem_files=[self.dem_file, self.dem_file], nodes_file=self.nodes_file,
+                                      edges_file=self.edges_file)
+
+    def test_progress_per_mode(self):
+        for options in ({}, {'batch_processing': True}, {'chunked': True}):
+            with self.subTest(**options):
+                reports = []
+                self.osw_incline.calculate(progress=reports.append, progress_interval=0, **options)
+                final = reports[-1]
+                self.assertTrue(final['finished'])
+                self.assertEqual(final['edges_done'], final['edges_total'])
+                if not options.get('chunked'):
+                    self.assertEqual(final['edges_total'], 2 * 2500)
+                    self.assertEqual(final['tiles_done'], 2)
+                    # The edge-by-edge path reports between chunks of edges
+                    self.assertGreater(len(reports), 4)
+                self.assertTrue(any(report['tile'] == 'dem.tif' for report in reports))
+                done = [report['edges_done'] for report in reports]
+                self.assertEqual(done, sorted(done))
+
+    def test_cancel_between_chunks(self):
+        token = CancellationToken()
+        reports = []
+
+        def progress(report):
+            reports.append(report)
+            token.cancel()
+
+        with open(self.edges_file) as f:
+            before = f.read()
+        with self.assertRaises(Cancelled):
+            self.osw_incline.calculate(progress=progress, progress_interval=0, cancel_token=token)
+        self.assertEqual(len(reports), 1)
+        self.assertLess(reports[0]['edges_done'], 2500)
+        # Stopped before the first tile was written
+        with open(self.edges_file) as f:
+            self.assertEqual(f.read(), before)
+
+    def test_cancelled_before_start(self):
+        token = CancellationToken()
+        token.cancel()
+        with self.assertRaises(Cancelled):
+            self.osw_incline.calculate(chunked=True, cancel_token=token)
+        with open(self.edges_file) as f:
+            self.assertFalse(any('incline' in feature['properties'] for feature in json.load(f)['features']))
+
+
+class TestCalculateAsyncProgress(unittest.IsolatedAsyncioTestCase):
+
+    async def test_progress(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            dem_file = write_test_dem(Path(workdir, 'dem.tif'))
+            nodes_file, edges_file = Path(workdir, 'nodes.geojson'), Path(workdir, 'edges.geojson')
+            write_test_graph(nodes_file, edges_file, count=50)
+            reports = []
+            await OSWIncline(dem_files=[dem_file], nodes_file=nodes_file, edges_file=edges_file).calculate_async(
+                chunk_size=10, progress=reports.append, progress_interval=0
+            )
+
+        self.assertEqual([report['edges_done'] for report in reports[:5]], [10, 20, 30, 40, 50])
+        self.assertTrue(reports[-1]['finished'])
+        self.assertEqual((reports[-1]['edges_total'], reports[-1]['tiles_total']), (50, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import io
+import json
+import unittest
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+from contextlib import redirect_stdout
+from src.osw_incline import OSWIncline
+from src.osw_incline.cli import main
+from src.osw_incline.dem_processor import DEMProcessor
+from src.osw_incline.run_plan import plan_run, GRAPH_EDGE_BYTES, GRAPH_NODE_BYTES
+from tests.helpers import write_test_dem, write_test_graph
+
+
+class TestRunPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmp_dir.name)
+        self.dem_dir = Path(self.workdir, 'dems')
+        self.dem_dir.mkdir()
+        self.dem_file = str(write_test_dem(Path(self.dem_dir, 'n48w123.tif')))
+        self.nodes_file = Path(self.workdir, 'nodes.geojson')
+        self.edges_file = Path(self.workdir, 'edges.geojson')
+        write_test_graph(self.nodes_file, self.edges_file, count=30, bidirectional=True)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_plan(self):
+        with open(self.edges_file) as f:
+            before = f.read()
+        incline = OSWIncline(dem_files=[self.dem_file], nodes_file=self.nodes_file, edges_file=self.edges_file)
+        with patch.object(DEMProcessor, 'infer_inclines', side_effect=AssertionError('inclines computed')):
+            plan = incline.plan(workers=4, max_memory_bytes=128 * 1024 * 1024)
+
+        self.assertEqual((plan['nodes'], plan['edges'], plan['edges_without_geometry']), (60, 60, 0))
+        self.assertEqual(plan['distinct_nodes'], 60)
+        self.assertEqual(plan['reverse_pairs'], 30)
+        [tile] = plan['tiles']
+        self.assertEqual((tile['dem'], tile['edges']), (self.dem_file, 60))
+        # The test DEM is stored in 64x64 float32 blocks
+        self.assertGreater(tile['blocks'], 0)
+        self.assertEqual(tile['read_bytes'], tile['blocks'] * 64 * 64 * 4)
+        self.assertEqual(plan['read_bytes'], tile['read_bytes'])
+
+        memory = plan['memory']
+        self.assertEqual(memory['serial'], 60 * GRAPH_NODE_BYTES + 60 * GRAPH_EDGE_BYTES)
+        self.assertGreater(memory['batch'], memory['serial'])
+        self.assertGreater(memory['workers'], 4 * memory['batch'])
+        self.assertEqual(memory['chunked'], 128 * 1024 * 1024)
+        with open(self.edges_file) as f:
+            self.assertEqual(f.read(), before)
+
+    def test_tile_dir_with_missing_tiles(self):
+        # Half of the edges lie in n48w122, which is not in the tile directory
+        extra_nodes = Path(self.workdir, 'extra.nodes.geojson')
+        extra_edges = Path(self.workdir, 'extra.edges.geojson')
+        write_test_graph(extra_nodes, extra_edges, count=30, west=-121.5)
+        with open(self.edges_file) as f, open(extra_edges) as g:
+            edges_fc = json.load(f)
+            edges_fc['features'] += json.load(g)['features'][:30]
+        with open(self.edges_file, 'w') as f:
+            json.dump(edges_fc, f)
+
+        plan = plan_run(self.nodes_file, self.edges_file, tile_dir=self.dem_dir)
+
+        self.assertEqual(plan['missing_tiles'], ['n48w122'])
+        self.assertEqual([(tile['dem'], tile['edges']) for tile in plan['tiles']], [(self.dem_file, 60)])
+
+    def test_cli(self):
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            code = main(['plan', str(self.nodes_file), str(self.edges_file), '--dem-dir', str(self.dem_dir),
+                         '--workers', '2'])
+        self.assertEqual(code, 0)
+        plan = json.loads(stdout.getvalue())
+        self.assertEqual(plan['edges'], 60)
+        self.assertEqual(plan['workers'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import unittest
+import tempfile
+from pathlib import Path
+from src.osw_incline.scheduler import TileScheduler, TILE_MEMORY_BYTES, edges_bounds, split_groups
+from tests.helpers import write_test_dem, write_test_graph
+
+# (tile, west, north) of the synthetic DEM tiles
+TILES = [('n48w123', -122.5, 47.7), ('n48w122', -121.5, 47.7)]
+
+
+class TestTileScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmp_dir.name)
+        self.tile_dir = Path(self.workdir, 'dems')
+        self.tile_dir.mkdir()
+        self.dem_files = {}
+        for tile, west, north in TILES:
+            self.dem_files[tile] = str(write_test_dem(Path(self.tile_dir, f'{tile}.tif'), west=west, north=north))
+
+        # Graphs alternate between the two tiles
+        self.jobs = []
+        for i in range(6):
+            _, west, north = TILES[i % 2]
+            nodes_file = Path(self.workdir, f'graph{i}.nodes.geojson')
+            edges_file = Path(self.workdir, f'graph{i}.edges.geojson')
+            write_test_graph(nodes_file, edges_file, count=10, west=west, north=north, seed=i)
+            self.jobs.append((str(nodes_file), str(edges_file)))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_footprint(self):
+        by_dir = TileScheduler(tile_dir=self.tile_dir)
+        by_files = TileScheduler(dem_files=list(self.dem_files.values()))
+        for i, (_, edges_file) in enumerate(self.jobs):
+            expected = (self.dem_files[TILES[i % 2][0]],)
+            self.assertEqual(by_dir.footprint(edges_file), expected)
+            self.assertEqual(by_files.footprint(edges_file), expected)
+
+    def test_plan_groups_jobs_sharing_tiles(self):
+        scheduler = TileScheduler(tile_dir=self.tile_dir, memory_budget_bytes=TILE_MEMORY_BYTES)
+        self.assertEqual(scheduler.max_open_tiles, 1)
+
+        plan = scheduler.plan(self.jobs)
+
+        order = plan['groups'][0]
+        self.assertEqual(sorted(order), list(range(6)))
+        # Jobs on the same tile run back to back
+        self.assertEqual(len({i % 2 for i in order[:3]}), 1)
+        self.assertEqual(len({i % 2 for i in order[3:]}), 1)
+        self.assertEqual(plan['naive_loads'], 6)
+        self.assertEqual(plan['estimated_loads'], 2)
+
+    def test_run_reports_actual_loads(self):
+        scheduler = TileScheduler(tile_dir=self.tile_dir, memory_budget_bytes=TILE_MEMORY_BYTES)
+        records, report = scheduler.run(self.jobs, batch_processing=True)
+
+        self.assertEqual([record['edges'] for record in records], [edges for _, edges in self.jobs])
+        self.assertEqual({record['status'] for record in records}, {'ok'})
+        self.assertEqual(report['actual_loads'], 2)
+        self.assertEqual(report['estimated_saved'], 4)
+        self.assertEqual(report['actual_saved'], 4)
+        for _, edges_file in self.jobs:
+            with open(edges_file) as f:
+                edges = json.load(f)['features']
+            self.assertTrue(any('incline' in feature['properties'] for feature in edges))
+
+    def test_run_with_workers(self):
+        scheduler = TileScheduler(dem_files=list(self.dem_files.values()), memory_budget_bytes=TILE_MEMORY_BYTES)
+        records, report = scheduler.run(self.jobs, workers=2)
+
+        self.assertEqual(report['workers'], 2)
+        self.assertEqual(report['actual_loads'], report['estimated_loads'])
+        self.assertEqual([record['edges'] for record in records], [edges for _, edges in self.jobs])
+        # Each worker only opens the tile of its own graphs
+        self.assertEqual(report['actual_loads'], 2)
+
+    def test_edges_bounds(self):
+        minx, miny, maxx, maxy = edges_bounds(self.jobs[0][1])
+        self.assertTrue(-122.5 <= minx < maxx <= -122.485)
+        self.assertTrue(47.685 <= miny < maxy <= 47.7)
+
+    def test_split_groups(self):
+        self.assertEqual(split_groups([3, 1, 0, 2], [1, 1, 1, 1], 2), [[3, 1], [0, 2]])
+        self.assertEqual(split_groups([0, 1, 2], [10, 1, 1], 2), [[0], [1, 2]])
+        self.assertEqual(split_groups([0], [1], 4), [[0]])
+        self.assertEqual(split_groups([], [], 2), [])
+        # Split where the tiles change rather than at the weight midpoint
+        footprints = [('a',), ('a',), ('a',), ('b',)]
+        self.assertEqual(split_groups([0, 1, 2, 3], [1, 1, 1, 1], 2, footprints=footprints), [[0, 1, 2], [3]])
+
+
+if __name__ == '__main__':
+    unittest.main()
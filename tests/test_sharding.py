@@ -0,0 +1,177 @@
+import sys
+import json
+import unittest
+import subprocess
+from pathlib import Path
+from unittest.mock import patch
+from src.osw_incline import sharding
+from src.osw_incline import OSWIncline
+from src.osw_incline.sharding import shard_of, shard_graph, merge_shards, INDEX_PROPERTY, MANIFEST_NAME
+from tests.helpers import GraphTestCase
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def read_features(path):
+    with open(path) as f:
+        return json.load(f)['features']
+
+
+class TestShardOf(unittest.TestCase):
+
+    def test_tile(self):
+        self.assertEqual(shard_of(-122.45, 47.65), 'n48w123')
+        self.assertEqual(shard_of(-122.999, 47.001), 'n48w123')
+        self.assertEqual(shard_of(2.35, 48.85), 'cell_2_48')
+
+    def test_cell(self):
+        self.assertEqual(shard_of(-122.45, 47.65, by='cell', cell_size=0.1), 'cell_-1225_476')
+        self.assertEqual(shard_of(0.05, 0.15, by='cell', cell_size=0.1), 'cell_0_1')
+
+
+class TestSharding(GraphTestCase):
+    edge_count = 40
+    bidirectional = True
+
+    def setUp(self):
+        super().setUp()
+        self.shard_dir = Path(self.workdir, 'shards')
+
+    def _shard(self):
+        return shard_graph(self.nodes_file, self.edges_file, self.shard_dir, by='cell', cell_size=0.005)
+
+    def test_shards_are_self_contained(self):
+        manifest = self._shard()
+        self.assertGreater(len(manifest['shards']), 1)
+        self.assertEqual(manifest['edges'], 80)
+        self.assertEqual(manifest['nodes'], 80)
+
+        edge_indices = []
+        for shard in manifest['shards']:
+            self.assertEqual(shard['tiles'], ['n48w123'])
+            nodes = read_features(Path(self.shard_dir, shard['nodes']))
+            edges = read_features(Path(self.shard_dir, shard['edges']))
+            self.assertEqual((len(nodes), len(edges)), (shard['node_count'], shard['edge_count']))
+            node_ids = {feature['properties']['_id'] for feature in nodes}
+            for feature in edges:
+                self.assertIn(feature['properties']['_u_id'], node_ids)
+                self.assertIn(feature['properties']['_v_id'], node_ids)
+                edge_indices.append(feature['properties'][INDEX_PROPERTY])
+        # Every edge is in exactly one shard, with its reverse
+        self.assertEqual(sorted(edge_indices), list(range(80)))
+        with open(Path(self.shard_dir, MANIFEST_NAME)) as f:
+            self.assertEqual(json.load(f), manifest)
+
+    def test_shards_run_as_separate_processes_and_merge(self):
+        edges_before = read_features(self.edges_file)
+        manifest = self._shard()
+
+        OSWIncline(dem_files=[self.dem_file], nodes_file=self.nodes_file, edges_file=self.edges_file).calculate()
+        expected = {feature['properties']['_id']: feature for feature in read_features(self.edges_file)}
+
+        processes = [
+            subprocess.Popen(
+                [sys.executable, '-m', 'src.osw_incline', 'run', '--dem', str(self.dem_file), '--graph',
+                 str(Path(self.shard_dir, shard['nodes'])), str(Path(self.shard_dir, shard['edges']))],
+                cwd=ROOT, stdout=subprocess.DEVNULL
+            )
+            for shard in manifest['shards']
+        ]
+        self.assertEqual([process.wait() for process in processes], [0] * len(processes))
+
+        merged_nodes = Path(self.workdir, 'merged.nodes.geojson')
+        merged_edges = Path(self.workdir, 'merged.edges.geojson')
+        merge_shards(Path(self.shard_dir, MANIFEST_NAME), merged_nodes, merged_edges)
+
+        edges = read_features(merged_edges)
+        self.assertEqual(
+            [feature['properties']['_id'] for feature in edges],
+            [feature['properties']['_id'] for feature in edges_before]
+        )
+        for feature in edges:
+            self.assertNotIn(INDEX_PROPERTY, feature['properties'])
+            self.assertEqual(feature, expected[feature['properties']['_id']])
+        nodes = read_features(merged_nodes)
+        self.assertEqual(
+            [feature['properties']['_id'] for feature in nodes],
+            [feature['properties']['_id'] for feature in read_features(self.nodes_file)]
+        )
+        self.assertTrue(all(INDEX_PROPERTY not in feature['properties'] for feature in nodes))
+
+    def _process_shards(self, manifest):
+        for shard in manifest['shards']:
+            OSWIncline(dem_files=[self.dem_file], nodes_file=Path(self.shard_dir, shard['nodes']),
+                       edges_file=Path(self.shard_dir, shard['edges'])).calculate()
+
+    def test_merge_in_passes_with_a_bounded_fan_in(self):
+        edges_before = read_features(self.edges_file)
+        manifest = self._shard()
+        self.assertGreater(len(manifest['shards']), 4)
+        self._process_shards(manifest)
+
+        open_runs = []
+        read_run = sharding._read_run
+
+        def counting_read_run(run_path):
+            # Counts the runs being read at once
+            open_runs.append(1)
+            try:
+                yield from read_run(run_path)
+            finally:
+                open_runs.append(-1)
+
+        def max_open():
+            level = peak = 0
+            for change in open_runs:
+                level += change
+                peak = max(peak, level)
+            return peak
+
+        merged_edges = Path(self.workdir, 'merged.edges.geojson')
+        with patch.object(sharding, 'MERGE_FAN_IN', 2), patch.object(sharding, '_read_run', counting_read_run):
+            merge_shards(Path(self.shard_dir, MANIFEST_NAME), Path(self.workdir, 'merged.nodes.geojson'),
+                         merged_edges)
+
+        self.assertEqual(max_open(), 2)
+        self.assertEqual(
+            [feature['properties']['_id'] for feature in read_features(merged_edges)],
+            [feature['properties']['_id'] for feature in edges_before]
+        )
+        nodes = read_features(Path(self.workdir, 'merged.nodes.geojson'))
+        self.assertEqual(len(nodes), 80)
+
+    def test_merge_without_point_nodes(self):
+        with open(self.nodes_file) as f:
+            nodes = json.load(f)
+        nodes['features'].append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [-122.495, 47.695]},
+            'properties': {'_id': 'point', 'is_point': True}
+        })
+        with open(self.nodes_file, 'w') as f:
+            json.dump(nodes, f)
+        manifest = self._shard()
+        self.assertEqual((manifest['nodes'], manifest['points']), (81, 1))
+        self._process_shards(manifest)
+
+        merged_nodes = Path(self.workdir, 'merged.nodes.geojson')
+        merge_shards(Path(self.shard_dir, MANIFEST_NAME), merged_nodes, Path(self.workdir, 'merged.edges.geojson'))
+        self.assertEqual(len(read_features(merged_nodes)), 80)
+
+    def test_merge_with_a_missing_shard(self):
+        manifest = self._shard()
+        shard = manifest['shards'][0]
+        with open(Path(self.shard_dir, shard['edges']), 'w') as f:
+            json.dump({'type': 'FeatureCollection', 'features': []}, f)
+
+        with self.assertRaises(ValueError):
+            merge_shards(
+                Path(self.shard_dir, MANIFEST_NAME),
+                Path(self.workdir, 'merged.nodes.geojson'),
+                Path(self.workdir, 'merged.edges.geojson')
+            )
+        self.assertFalse(Path(self.workdir, 'merged.edges.geojson').exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import time
+import hashlib
+import unittest
+import tempfile
+import multiprocessing
+from pathlib import Path
+from src.osw_incline.tile_cache import TileCache, file_checksum
+from tests.helpers import serve_directory
+
+
+def _fetch_in_process(root, name, url):
+    TileCache(root).fetch(name, url=url)
+
+
+class TestTileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.remote_dir = Path(self.tmp_dir.name, 'remote')
+        self.remote_dir.mkdir()
+        self.cache_dir = Path(self.tmp_dir.name, 'cache')
+        for name in ('n48w122', 'n48w123', 'n47w122'):
+            with open(Path(self.remote_dir, f'USGS_13_{name}.tif'), 'wb') as f:
+                f.write(name.encode() * 1000)
+        self.server, self.base_url = serve_directory(self.remote_dir)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def _url(self, name):
+        return f'{self.base_url}/USGS_13_{name}.tif'
+
+    def test_fetch_installs_by_name_and_checksum(self):
+        cache = TileCache(self.cache_dir)
+        path = cache.fetch('n48w122', url=self._url('n48w122'))
+
+        checksum = hashlib.sha256(b'n48w122' * 1000).hexdigest()
+        self.assertEqual(path, Path(self.cache_dir, f'n48w122.{checksum}.tif'))
+        self.assertTrue(cache.verify('n48w122'))
+        self.assertEqual(list(cache.partial_dir.iterdir()), [])
+
+    def test_fetch_uses_cached_tile(self):
+        cache = TileCache(self.cache_dir)
+        first = cache.fetch('n48w122', url=self._url('n48w122'))
+        second = cache.fetch('n48w122', url=self._url('n48w122'))
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_checksum_mismatch_is_not_installed(self):
+        cache = TileCache(self.cache_dir)
+        with self.assertRaises(ValueError):
+            cache.fetch('n48w122', url=self._url('n48w122'), checksum='0' * 64)
+
+        self.assertIsNone(cache.get('n48w122'))
+        self.assertEqual(list(cache.partial_dir.iterdir()), [])
+
+    def test_failed_download_is_not_installed(self):
+        cache = TileCache(self.cache_dir)
+        with self.assertRaises(Exception):
+            cache.fetch('n01w001', url=self._url('n01w001'))
+        self.assertEqual(cache.tiles(), {})
+        self.assertEqual(list(cache.partial_dir.iterdir()), [])
+
+    def test_verify_detects_corruption(self):
+        cache = TileCache(self.cache_dir)
+        path = cache.fetch('n48w122', url=self._url('n48w122'))
+        with open(path, 'ab') as f:
+            f.write(b'corrupted')
+        self.assertFalse(cache.verify('n48w122'))
+        self.assertFalse(cache.verify('n47w122'))
+
+    def test_lru_eviction(self):
+        # Room for two tiles of 7000 bytes
+        cache = TileCache(self.cache_dir, max_bytes=15000)
+        cache.fetch('n48w122', url=self._url('n48w122'))
+        time.sleep(0.01)
+        cache.fetch('n48w123', url=self._url('n48w123'))
+        time.sleep(0.01)
+        # Touch the oldest tile so the other one becomes least recently used
+        cache.get('n48w122')
+        time.sleep(0.01)
+        cache.fetch('n47w122', url=self._url('n47w122'))
+
+        self.assertEqual(sorted(cache.tiles()), ['n47w122', 'n48w122'])
+        self.assertLessEqual(cache.size(), 15000)
+
+    def test_install_replaces_older_version(self):
+        cache = TileCache(self.cache_dir)
+        cache.fetch('n48w122', url=self._url('n48w122'))
+
+        source = Path(cache.partial_dir, 'new.part')
+        with open(source, 'wb') as f:
+            f.write(b'updated tile')
+        path = cache.install('n48w122', source, checksum=file_checksum(source))
+
+        self.assertEqual(cache.tiles(), {'n48w122': path})
+        self.assertFalse(source.exists())
+
+    def test_resolve(self):
+        cache = TileCache(self.cache_dir)
+        path = cache.fetch('n48w122', url=self._url('n48w122'))
+        self.assertEqual(cache.resolve(['n48w122', 'n48w123']), ([str(path)], ['n48w123']))
+
+    def test_concurrent_processes(self):
+        context = multiprocessing.get_context('spawn')
+        processes = [
+            context.Process(target=_fetch_in_process, args=(str(self.cache_dir), 'n48w122', self._url('n48w122')))
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(timeout=60)
+            self.assertEqual(process.exitcode, 0)
+
+        cache = TileCache(self.cache_dir)
+        self.assertEqual(list(cache.tiles()), ['n48w122'])
+        self.assertTrue(cache.verify('n48w122'))
+        self.assertTrue(os.path.exists(Path(self.cache_dir, '.lock')))
+
+
+if __name__ == '__main__':
+    unittest.main()
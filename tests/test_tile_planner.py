@@ -0,0 +1,127 @@
+import os
+import json
+import unittest
+import tempfile
+import rasterio
+import numpy as np
+from pathlib import Path
+from unittest.mock import patch
+from src.osw_incline import OSWIncline
+from src.osw_incline.osm_graph import OSMGraph
+from src.osw_incline.tile_planner import TilePlanner, tile_name
+from tests.helpers import write_test_dem, write_test_graph
+
+
+class TestTilePlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.planner = TilePlanner()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_index_is_loaded(self):
+        self.assertGreater(self.planner.tile_count, 1000)
+        self.assertIn('n48w123', self.planner)
+        self.assertNotIn('n01w001', self.planner)
+        self.assertNotIn('', self.planner)
+
+    def test_tile_name(self):
+        self.assertEqual(tile_name(48, 123), 'n48w123')
+        self.assertEqual(tile_name(9, 65), 'n09w065')
+
+    def test_tiles_for_points(self):
+        tiles = self.planner.tiles_for_points(
+            lons=np.array([-122.3, -122.31, -121.5, 10.0, np.nan]),
+            lats=np.array([47.6, 47.61, 47.2, 1.0, 47.0])
+        )
+        self.assertEqual(tiles, ['n48w122', 'n48w123'])
+
+    def test_tiles_for_bounds(self):
+        self.assertEqual(self.planner.tiles_for_bounds((-122.5, 47.2, -121.5, 47.8)), ['n48w122', 'n48w123'])
+
+    def test_tiles_for_graph_and_edges_file(self):
+        nodes_file = Path(self.workdir, 'nodes.geojson')
+        edges_file = Path(self.workdir, 'edges.geojson')
+        write_test_graph(nodes_file, edges_file, west=-122.01, north=47.6, span=0.02)
+
+        osm_graph = OSMGraph.from_geojson(nodes_file, edges_file)
+        self.assertEqual(self.planner.tiles_for_graph(osm_graph.G), ['n48w122', 'n48w123'])
+        self.assertEqual(self.planner.tiles_for_edges_file(edges_file), ['n48w122', 'n48w123'])
+
+    def test_resolve(self):
+        Path(self.workdir, 'n48w123.tif').touch()
+        Path(self.workdir, 'USGS_13_n48w122.tif').touch()
+
+        dem_files, missing = self.planner.resolve(['n48w122', 'n48w123', 'n47w122'], self.workdir)
+
+        self.assertEqual(dem_files, [str(Path(self.workdir, 'USGS_13_n48w122.tif')), str(Path(self.workdir, 'n48w123.tif'))])
+        self.assertEqual(missing, ['n47w122'])
+
+    def test_resolve_cached_tiles(self):
+        # As installed by a TileCache, the most recent version of a tile wins
+        older = Path(self.workdir, f'n47w122.{"a" * 64}.tif')
+        newer = Path(self.workdir, f'n47w122.{"b" * 64}.tif')
+        for mtime, path in enumerate((older, newer)):
+            path.touch()
+            os.utime(path, (mtime, mtime))
+        Path(self.workdir, 'n48w122.tif.ovr').touch()
+
+        dem_files, missing = self.planner.resolve(['n48w122', 'n47w122'], self.workdir)
+
+        self.assertEqual(dem_files, [str(newer)])
+        self.assertEqual(missing, ['n48w122'])
+
+
+    def test_urls(self):
+        self.assertEqual(
+            self.planner.urls(['n48w123']),
+            ['https://prd-tnm.s3.amazonaws.com/StagedProducts/Elevation/13/TIFF/current/n48w123/USGS_13_n48w123.tif']
+        )
+        self.assertEqual(self.planner.urls(['n48w123'], url_template='http://localhost/{tile}.tif'),
+                         ['http://localhost/n48w123.tif'])
+
+
+class TestOSWInclineTileDir(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmp_dir.name)
+        self.tile_dir = Path(self.workdir, 'dems')
+        self.tile_dir.mkdir()
+        write_test_dem(Path(self.tile_dir, 'n48w123.tif'))
+        # A tile the graph does not touch
+        write_test_dem(Path(self.tile_dir, 'n47w123.tif'), north=46.7)
+        self.nodes_file = Path(self.workdir, 'nodes.geojson')
+        self.edges_file = Path(self.workdir, 'edges.geojson')
+        write_test_graph(self.nodes_file, self.edges_file, count=20)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_requires_dem_files_or_tile_dir(self):
+        with self.assertRaises(ValueError):
+            OSWIncline(nodes_file=self.nodes_file, edges_file=self.edges_file)
+
+    def _assert_only_needed_tile_opened(self, **kwargs):
+        incline = OSWIncline(nodes_file=self.nodes_file, edges_file=self.edges_file, tile_dir=self.tile_dir)
+        with patch('rasterio.open', wraps=rasterio.open) as mock_open:
+            self.assertTrue(incline.calculate(**kwargs))
+
+        opened = {Path(call.args[0]).name for call in mock_open.call_args_list}
+        self.assertEqual(opened, {'n48w123.tif'})
+        with open(self.edges_file) as f:
+            edges = json.load(f)['features']
+        self.assertTrue(any('incline' in feature['properties'] for feature in edges))
+
+    def test_calculate_with_tile_dir(self):
+        self._assert_only_needed_tile_opened()
+
+    def test_calculate_chunked_with_tile_dir(self):
+        self._assert_only_needed_tile_opened(chunked=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import json
+import unittest
+import tempfile
+import numpy as np
+from pathlib import Path
+from unittest.mock import patch
+from src.osw_incline import OSWIncline
+from src.osw_incline.tile_cache import TileCache, file_checksum
+from src.osw_incline.tile_prefetcher import TilePrefetcher
+from tests.helpers import serve_directory, write_test_dem, write_test_graph
+
+TILES = ('n48w122', 'n48w123', 'n47w122')
+
+
+class TestTilePrefetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.remote_dir = Path(self.tmp_dir.name, 'remote')
+        self.remote_dir.mkdir()
+        for tile in TILES:
+            with open(Path(self.remote_dir, f'USGS_13_{tile}.tif'), 'wb') as f:
+                f.write(tile.encode() * 10000)
+        self.server, self.base_url = serve_directory(self.remote_dir)
+        self.cache = TileCache(Path(self.tmp_dir.name, 'cache'))
+        self.prefetcher = TilePrefetcher(
+            self.cache, max_workers=2, url_template=self.base_url + '/USGS_13_{tile}.tif', chunk_size=4096
+        )
+
+    def tearDown(self):
+        self.prefetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def test_prefetch_downloads_every_tile(self):
+        fetched = dict(self.prefetcher.prefetch(TILES))
+
+        self.assertEqual(sorted(fetched), sorted(TILES))
+        for tile, path in fetched.items():
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), tile.encode() * 10000)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_cached_tiles_come_first_without_requests(self):
+        self.prefetcher.fetch('n47w122')
+        self.server.requests.clear()
+
+        fetched = [tile for tile, _ in self.prefetcher.prefetch(['n48w122', 'n47w122', 'n48w122'])]
+
+        self.assertEqual(fetched, ['n47w122', 'n48w122'])
+        self.assertEqual([path for path, _ in self.server.requests], ['/USGS_13_n48w122.tif'])
+
+    def test_resumes_partial_download(self):
+        content = b'n48w122' * 10000
+        with open(Path(self.cache.partial_dir, 'n48w122.part'), 'wb') as f:
+            f.write(content[:30000])
+
+        path = self.prefetcher.fetch('n48w122')
+
+        self.assertEqual(self.server.requests, [('/USGS_13_n48w122.tif', 'bytes=30000-')])
+        self.assertEqual(file_checksum(path), path.name.split('.')[1])
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), content)
+
+    def test_complete_partial_download_is_installed(self):
+        content = b'n48w122' * 10000
+        with open(Path(self.cache.partial_dir, 'n48w122.part'), 'wb') as f:
+            f.write(content)
+
+        path = self.prefetcher.fetch('n48w122')
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), content)
+
+    def test_failed_download_raises(self):
+        with self.assertRaises(Exception):
+            list(self.prefetcher.prefetch(['n48w122', 'n01w001']))
+        self.assertIsNone(self.cache.get('n01w001'))
+
+    def test_dem_files_are_paths(self):
+        dem_files = list(self.prefetcher.dem_files(['n48w122']))
+        self.assertEqual(dem_files, [str(self.cache.get('n48w122'))])
+
+
+class TestOSWInclineDownloadTiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmp_dir.name)
+        self.remote_dir = Path(self.workdir, 'remote')
+        self.remote_dir.mkdir()
+        write_test_dem(Path(self.remote_dir, 'USGS_13_n48w123.tif'))
+        self.server, self.base_url = serve_directory(self.remote_dir)
+        self.tile_dir = Path(self.workdir, 'dems')
+        self.nodes_file = Path(self.workdir, 'nodes.geojson')
+        self.edges_file = Path(self.workdir, 'edges.geojson')
+        write_test_graph(self.nodes_file, self.edges_file, count=20)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def test_calculate_downloads_missing_tiles(self):
+        incline = OSWIncline(
+            nodes_file=self.nodes_file, edges_file=self.edges_file, tile_dir=self.tile_dir, download_tiles=True
+        )
+        with patch('src.osw_incline.tile_planner.NED_13_URL_TEMPLATE', self.base_url + '/USGS_13_{tile}.tif'):
+            self.assertTrue(incline.calculate(batch_processing=True))
+
+        self.assertEqual(list(TileCache(self.tile_dir).tiles()), ['n48w123'])
+        with open(self.edges_file) as f:
+            edges = json.load(f)['features']
+        self.assertTrue(any('incline' in feature['properties'] for feature in edges))
+
+    def test_downloaded_tiles_keep_plan_order(self):
+        Path(self.tile_dir).mkdir()
+        write_test_dem(Path(self.tile_dir, 'n48w122.tif'))
+
+        def prefetch(prefetcher, tiles):
+            # Downloads completing in the reverse order
+            for tile in reversed(tiles):
+                yield tile, Path(self.tile_dir, f'{tile}.{"0" * 64}.tif')
+
+        incline = OSWIncline(
+            nodes_file=self.nodes_file, edges_file=self.edges_file, tile_dir=self.tile_dir, download_tiles=True
+        )
+        # One endpoint in each of n48w123, n48w122 and n47w122
+        coords = np.array([[-122.5, 47.5, -121.5, 47.5], [-121.5, 46.5, -121.5, 46.6]])
+        with patch.object(TilePrefetcher, 'prefetch', prefetch):
+            dem_files = list(incline._plan_dem_files(coords=coords))
+
+        self.assertEqual(dem_files, [
+            str(Path(self.tile_dir, f'n47w122.{"0" * 64}.tif')),
+            str(Path(self.tile_dir, 'n48w122.tif')),
+            str(Path(self.tile_dir, f'n48w123.{"0" * 64}.tif')),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()